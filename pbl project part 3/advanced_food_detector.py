@@ -5,10 +5,26 @@ import io
 import colorsys
 from collections import Counter
 import math
+import os
+import time
+import atexit
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from indian_food_database import INDIAN_FOOD_DATABASE
+from food_matcher import FoodFilenameMatcher
+
+# Longest side (in pixels) of the image the detection layers work on
+ANALYSIS_IMAGE_SIZE = 512
+
+# Largest possible Euclidean distance between two RGB colors
+MAX_COLOR_DISTANCE = math.sqrt(3 * 255**2)
+
+class FallbackGuess(str):
+    """Food name picked at random because detection failed or was inconclusive (never cache it)"""
 
 class AdvancedFoodDetector:
-    def __init__(self):
+    def __init__(self, color_engine='histogram'):
         # Define comprehensive visual patterns for Indian foods
         self.food_visual_patterns = {
             # Rice dishes - grain patterns and colors
@@ -511,6 +527,25 @@ class AdvancedFoodDetector:
         
         # Color analysis thresholds
         self.color_tolerance = 50
+        
+        # Dominant color engines ('kmeans' is the original full-resolution clustering)
+        self.dominant_color_engines = {
+            'histogram': self._histogram_dominant_colors,
+            'kmeans': self._kmeans_dominant_colors
+        }
+        if color_engine not in self.dominant_color_engines:
+            raise ValueError(f"Unknown color engine: {color_engine}")
+        self.color_engine = color_engine
+        
+        # Compile the pattern colors once for vectorised color scoring
+        self._compile_color_patterns()
+        
+        # One filename-hint automaton over every database food name and pattern keyword
+        food_keywords = {food_name: [] for food_name in INDIAN_FOOD_DATABASE}
+        for food_name, pattern in self.food_visual_patterns.items():
+            food_keywords[food_name] = pattern.get('keywords', [])
+        self.filename_matcher = FoodFilenameMatcher(food_keywords)
+        
         self.texture_patterns = {
             'grainy': self._detect_grainy_texture,
             'smooth': self._detect_smooth_texture,
@@ -535,16 +570,13 @@ class AdvancedFoodDetector:
             'slightly_textured': self._detect_slightly_textured_texture
         }
 
-    def analyze_image_advanced(self, image_data, filename=""):
-        """Advanced multi-layer food detection"""
+    def analyze_image_advanced(self, image_data, filename="", timings=None):
+        """Advanced multi-layer food detection (fills timings with per-stage milliseconds if given)"""
         try:
             # Load and preprocess image
-            image = Image.open(io.BytesIO(image_data))
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            
-            # Resize for consistent analysis
-            image = image.resize((512, 512), Image.Resampling.LANCZOS)
+            start = time.perf_counter()
+            image = self._load_image(image_data)
+            decoded = time.perf_counter()
             
             # Convert to numpy array for OpenCV operations
             cv_image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
@@ -561,6 +593,10 @@ class AdvancedFoodDetector:
             # Get best match with confidence
             best_food, confidence = self._get_best_match(final_scores)
             
+            if timings is not None:
+                timings['decode_ms'] = (decoded - start) * 1000
+                timings['analysis_ms'] = (time.perf_counter() - decoded) * 1000
+            
             return best_food, confidence
             
         except Exception as e:
@@ -568,26 +604,57 @@ class AdvancedFoodDetector:
             # Fallback to basic detection
             return self._fallback_detection(), 0.3
 
+    def _load_image(self, image_data, target_size=ANALYSIS_IMAGE_SIZE):
+        """Decode an upload straight to roughly target_size, keeping its aspect ratio"""
+        image = Image.open(io.BytesIO(image_data))
+        
+        # Let the JPEG decoder skip detail we will throw away (DCT scaling by 1/2, 1/4 or 1/8)
+        # while staying at least as large as the final size. No-op for other formats
+        width, height = image.size
+        scale = target_size / max(width, height)
+        image.draft('RGB', (max(1, int(width * scale)), max(1, int(height * scale))))
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        
+        # Scale so the longest side is target_size
+        width, height = image.size
+        scale = target_size / max(width, height)
+        new_size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        if new_size != image.size:
+            image = image.resize(new_size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+        
+        return image
+
+    def _compile_color_patterns(self):
+        """Flatten every food's pattern colors into one palette matrix"""
+        self._food_names = list(self.food_visual_patterns.keys())
+        palette, food_index = [], []
+        for index, food_name in enumerate(self._food_names):
+            colors = self.food_visual_patterns[food_name].get('colors', [])
+            palette.extend(colors)
+            food_index.extend([index] * len(colors))
+        
+        self._palette_matrix = np.array(palette, dtype=np.float32).reshape(-1, 3)
+        self._palette_food_index = np.array(food_index, dtype=np.intp)
+
     def _analyze_colors(self, image):
         """Analyze dominant colors and match with food patterns"""
-        scores = {}
-        
         # Get dominant colors
-        dominant_colors = self._get_dominant_colors(image, k=5)
+        dominant_colors = np.array(self._get_dominant_colors(image, k=5), dtype=np.float32).reshape(-1, 3)
         
-        for food_name, pattern in self.food_visual_patterns.items():
-            color_score = 0
-            pattern_colors = pattern.get('colors', [])
-            
-            for dom_color in dominant_colors:
-                for pattern_color in pattern_colors:
-                    similarity = self._color_similarity(dom_color, pattern_color)
-                    if similarity > 0.7:  # 70% similarity threshold
-                        color_score += similarity * 0.3
-            
-            scores[food_name] = min(color_score, 1.0)
+        # Similarity of every dominant color to every pattern color in one pass
+        distances = np.sqrt(np.sum(
+            (dominant_colors[:, None, :] - self._palette_matrix[None, :, :]) ** 2, axis=2
+        ))
+        similarity = 1 - distances / MAX_COLOR_DISTANCE
         
-        return scores
+        # 70% similarity threshold, then sum the matches per food
+        contributions = np.where(similarity > 0.7, similarity * 0.3, 0).sum(axis=0)
+        food_scores = np.bincount(self._palette_food_index, weights=contributions,
+                                  minlength=len(self._food_names))
+        food_scores = np.minimum(food_scores, 1.0)
+        
+        return {food_name: float(score) for food_name, score in zip(self._food_names, food_scores)}
 
     def _analyze_shapes(self, cv_image):
         """Analyze shapes and geometric patterns"""
@@ -614,46 +681,40 @@ class AdvancedFoodDetector:
 
     def _analyze_textures(self, cv_image):
         """Analyze texture patterns"""
-        scores = {}
-        
         gray = cv2.cvtColor(cv_image, cv2.COLOR_BGR2GRAY)
         
-        for food_name, pattern in self.food_visual_patterns.items():
-            texture_type = pattern.get('texture', '')
-            if texture_type in self.texture_patterns:
-                texture_score = self.texture_patterns[texture_type](gray)
-                scores[food_name] = texture_score
-            else:
-                scores[food_name] = 0.0
+        # Compute shared primitives once, then score each distinct texture type once
+        features = self._extract_texture_features(gray)
+        texture_scores = {
+            texture_type: detector(features)
+            for texture_type, detector in self.texture_patterns.items()
+        }
         
-        return scores
+        return {
+            food_name: texture_scores.get(pattern.get('texture', ''), 0.0)
+            for food_name, pattern in self.food_visual_patterns.items()
+        }
 
     def _analyze_filename(self, filename):
         """Analyze filename for food hints"""
-        scores = {}
-        filename_lower = filename.lower()
+        name_hits, keyword_hits = self.filename_matcher.match(filename)
         
-        for food_name, pattern in self.food_visual_patterns.items():
-            filename_score = 0
-            keywords = pattern.get('keywords', [])
-            
-            # Direct name match
-            if food_name.replace('_', ' ') in filename_lower:
-                filename_score = 1.0
-            elif food_name in filename_lower:
-                filename_score = 0.9
-            else:
-                # Keyword matching
-                for keyword in keywords:
-                    if keyword in filename_lower:
-                        filename_score += 0.2
-            
-            scores[food_name] = min(filename_score, 1.0)
+        # Direct name match wins, otherwise 0.2 per matching keyword
+        scores = {}
+        for food_name, count in keyword_hits.items():
+            scores[food_name] = min(count * 0.2, 1.0)
+        for food_name, score in name_hits.items():
+            if food_name in self.food_visual_patterns:
+                scores[food_name] = score
         
         return scores
 
     def _get_dominant_colors(self, image, k=5):
-        """Extract dominant colors using k-means clustering"""
+        """Extract dominant colors with the configured color engine"""
+        return self.dominant_color_engines[self.color_engine](image, k)
+
+    def _kmeans_dominant_colors(self, image, k=5):
+        """Extract dominant colors using k-means clustering over every pixel"""
         # Convert image to array
         data = np.array(image)
         data = data.reshape((-1, 3))
@@ -668,15 +729,72 @@ class AdvancedFoodDetector:
         
         return [tuple(color) for color in centers]
 
-    def _color_similarity(self, color1, color2):
-        """Calculate color similarity using Euclidean distance"""
-        r1, g1, b1 = color1
-        r2, g2, b2 = color2
+    def _histogram_dominant_colors(self, image, k=5, bits=5, attempts=10, iterations=20, seed=0):
+        """Extract dominant colors using weighted k-means over a quantized color histogram"""
+        data = np.asarray(image).reshape(-1, 3)
+        
+        # Pack each pixel into a (2**bits)^3 histogram bin
+        shift = 8 - bits
+        bins = ((data[:, 0] >> shift).astype(np.int32) << (2 * bits)) | \
+               ((data[:, 1] >> shift).astype(np.int32) << bits) | \
+               (data[:, 2] >> shift).astype(np.int32)
+        num_bins = 1 << (3 * bits)
+        counts = np.bincount(bins, minlength=num_bins)
+        occupied = np.nonzero(counts)[0]
+        weights = counts[occupied].astype(np.float64)
+        
+        # Mean color of the pixels that fell into each occupied bin
+        points = np.stack([
+            np.bincount(bins, weights=data[:, channel], minlength=num_bins)[occupied]
+            for channel in range(3)
+        ], axis=1) / weights[:, None]
+        
+        k = min(k, len(points))
+        
+        # Weighted k-means++ restarts with a fixed seed, keeping the most compact result
+        rng = np.random.default_rng(seed)
+        best_centers, best_weights, best_inertia = None, None, float('inf')
+        for _ in range(attempts):
+            centers = [points[rng.choice(len(points), p=weights / weights.sum())]]
+            nearest = np.sum((points - centers[0]) ** 2, axis=1)
+            while len(centers) < k:
+                probabilities = weights * nearest
+                total = probabilities.sum()
+                if total == 0:
+                    centers.append(centers[-1])
+                    continue
+                centers.append(points[rng.choice(len(points), p=probabilities / total)])
+                nearest = np.minimum(nearest, np.sum((points - centers[-1]) ** 2, axis=1))
+            centers = np.array(centers)
+            
+            # Weighted Lloyd iterations over the histogram bins
+            for _ in range(iterations):
+                distances = np.sum((points[:, None, :] - centers[None, :, :]) ** 2, axis=2)
+                labels = np.argmin(distances, axis=1)
+                cluster_weights = np.bincount(labels, weights=weights, minlength=k)
+                new_centers = centers.copy()
+                filled = cluster_weights > 0
+                for channel in range(3):
+                    sums = np.bincount(labels, weights=weights * points[:, channel], minlength=k)
+                    new_centers[filled, channel] = sums[filled] / cluster_weights[filled]
+                converged = np.allclose(new_centers, centers, atol=1.0)
+                centers = new_centers
+                if converged:
+                    break
+            
+            distances = np.sum((points[:, None, :] - centers[None, :, :]) ** 2, axis=2)
+            labels = np.argmin(distances, axis=1)
+            inertia = np.sum(weights * distances[np.arange(len(points)), labels])
+            if inertia < best_inertia:
+                best_inertia = inertia
+                best_centers = centers
+                best_weights = np.bincount(labels, weights=weights, minlength=k)
         
-        distance = math.sqrt((r1-r2)**2 + (g1-g2)**2 + (b1-b2)**2)
-        max_distance = math.sqrt(3 * 255**2)
+        # Heaviest cluster first for a stable palette order
+        order = np.argsort(-best_weights, kind='stable')
+        centers = np.uint8(np.clip(np.rint(best_centers[order]), 0, 255))
         
-        return 1 - (distance / max_distance)
+        return [tuple(color) for color in centers]
 
     def _extract_shape_features(self, contours, image_shape):
         """Extract geometric features from contours"""
@@ -777,192 +895,194 @@ class AdvancedFoodDetector:
         
         return min(score, 1.0)
 
-    # Texture detection methods
-    def _detect_grainy_texture(self, gray_image):
+    # Texture feature stage
+    def _extract_texture_features(self, gray_image):
+        """Compute every texture primitive once per image"""
+        features = {}
+        total_pixels = gray_image.size
+
+        # Global intensity statistics
+        features['mean'] = np.mean(gray_image)
+        features['std'] = np.std(gray_image)
+        features['var'] = np.var(gray_image)
+        features['dark_ratio'] = np.sum(gray_image < 80) / total_pixels
+
+        # Laplacian variance
+        features['laplacian_var'] = cv2.Laplacian(gray_image, cv2.CV_64F).var()
+
+        # Canny edge density at every threshold pair used by the detectors
+        for low, high in ((10, 30), (20, 60), (30, 80), (50, 150), (100, 200)):
+            edges = cv2.Canny(gray_image, low, high)
+            features[f'edge_density_{low}_{high}'] = np.count_nonzero(edges) / total_pixels
+            if (low, high) == (50, 150):
+                contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+                features['significant_chunks'] = sum(1 for c in contours if cv2.contourArea(c) > 100)
+
+        # Blur differences
+        features['blur15_diff_mean'] = np.mean(cv2.absdiff(gray_image, cv2.GaussianBlur(gray_image, (15, 15), 0)))
+        features['blur9_std'] = np.std(cv2.GaussianBlur(gray_image, (9, 9), 0))
+        features['blur7_std'] = np.std(cv2.GaussianBlur(gray_image, (7, 7), 0))
+        features['median5_diff_mean'] = np.mean(cv2.absdiff(gray_image, cv2.medianBlur(gray_image, 5)))
+
+        # Morphology
+        closing = cv2.morphologyEx(gray_image, cv2.MORPH_CLOSE, np.ones((5, 5), np.uint8))
+        features['closing_diff_mean'] = np.mean(cv2.absdiff(gray_image, closing))
+        gradient = cv2.morphologyEx(gray_image, cv2.MORPH_GRADIENT, np.ones((3, 3), np.uint8))
+        features['gradient_mean'] = np.mean(gradient)
+        kernel = np.ones((2, 2), np.uint8)
+        opened = cv2.dilate(cv2.erode(gray_image, kernel, iterations=1), kernel, iterations=1)
+        features['opening_diff_mean'] = np.mean(cv2.absdiff(gray_image, opened))
+
+        # Sobel gradients
+        features['sobelx_mean'] = np.mean(np.abs(cv2.Sobel(gray_image, cv2.CV_64F, 1, 0, ksize=3)))
+        features['sobely_mean'] = np.mean(np.abs(cv2.Sobel(gray_image, cv2.CV_64F, 0, 1, ksize=3)))
+
+        # Hough circles (the two most expensive primitives)
+        circles = cv2.HoughCircles(gray_image, cv2.HOUGH_GRADIENT, 1, 20,
+                                 param1=50, param2=30, minRadius=10, maxRadius=100)
+        features['small_circles'] = len(circles[0]) if circles is not None else 0
+        circles = cv2.HoughCircles(gray_image, cv2.HOUGH_GRADIENT, 1, 30,
+                                 param1=40, param2=25, minRadius=20, maxRadius=200)
+        features['large_circles'] = len(circles[0]) if circles is not None else 0
+
+        return features
+
+    # Texture detection methods (score a cached feature bundle)
+    def _detect_grainy_texture(self, features):
         """Detect grainy texture (rice, etc.)"""
         # Use Laplacian variance to detect texture
-        laplacian_var = cv2.Laplacian(gray_image, cv2.CV_64F).var()
+        laplacian_var = features['laplacian_var']
         
         # Normalize score
         if laplacian_var > 500:
             return min(laplacian_var / 2000, 1.0)
         return laplacian_var / 500
 
-    def _detect_smooth_texture(self, gray_image):
+    def _detect_smooth_texture(self, features):
         """Detect smooth texture (bread, etc.)"""
         # Inverse of grainy - smooth surfaces have low variance
-        laplacian_var = cv2.Laplacian(gray_image, cv2.CV_64F).var()
+        laplacian_var = features['laplacian_var']
         
         if laplacian_var < 200:
             return 1.0 - (laplacian_var / 200)
         return 0.0
 
-    def _detect_liquid_texture(self, gray_image):
+    def _detect_liquid_texture(self, features):
         """Detect liquid/gravy texture"""
         # Look for smooth regions with some variation
-        blur = cv2.GaussianBlur(gray_image, (15, 15), 0)
-        diff = cv2.absdiff(gray_image, blur)
-        
-        mean_diff = np.mean(diff)
+        mean_diff = features['blur15_diff_mean']
         if 10 < mean_diff < 50:
             return min(mean_diff / 50, 1.0)
         return 0.0
 
-    def _detect_crispy_texture(self, gray_image):
+    def _detect_crispy_texture(self, features):
         """Detect crispy texture (fried items)"""
         # High frequency components indicate crispiness
-        edges = cv2.Canny(gray_image, 100, 200)
-        edge_density = np.sum(edges > 0) / edges.size
-        
-        return min(edge_density * 5, 1.0)
+        return min(features['edge_density_100_200'] * 5, 1.0)
 
-    def _detect_spiral_texture(self, gray_image):
+    def _detect_spiral_texture(self, features):
         """Detect spiral patterns (jalebi)"""
         # Use Hough circles to detect circular/spiral patterns
-        circles = cv2.HoughCircles(gray_image, cv2.HOUGH_GRADIENT, 1, 20,
-                                 param1=50, param2=30, minRadius=10, maxRadius=100)
-        
-        if circles is not None:
-            return min(len(circles[0]) / 5, 1.0)
-        return 0.0
+        return min(features['small_circles'] / 5, 1.0)
 
-    def _detect_creamy_texture(self, gray_image):
+    def _detect_creamy_texture(self, features):
         """Detect creamy, smooth texture with slight variations"""
-        # Gaussian blur to smooth out noise
-        blurred = cv2.GaussianBlur(gray_image, (9, 9), 0)
-        # Calculate standard deviation - creamy textures have moderate variance
-        std_dev = np.std(blurred)
+        # Creamy textures have moderate variance after smoothing
+        std_dev = features['blur9_std']
         if 15 < std_dev < 40:
             return min(std_dev / 40, 1.0)
         return 0.0
 
-    def _detect_thick_texture(self, gray_image):
+    def _detect_thick_texture(self, features):
         """Detect thick, dense texture patterns"""
-        # Use morphological operations to detect thick patterns
-        kernel = np.ones((5,5), np.uint8)
-        closing = cv2.morphologyEx(gray_image, cv2.MORPH_CLOSE, kernel)
-        diff = cv2.absdiff(gray_image, closing)
-        thickness_score = 1.0 - (np.mean(diff) / 255)
+        # Use morphological closing to detect thick patterns
+        thickness_score = 1.0 - (features['closing_diff_mean'] / 255)
         return max(thickness_score, 0.0)
 
-    def _detect_soft_texture(self, gray_image):
+    def _detect_soft_texture(self, features):
         """Detect soft, gentle texture"""
         # Soft textures have low edge density and smooth gradients
-        edges = cv2.Canny(gray_image, 30, 80)
-        edge_density = np.sum(edges > 0) / edges.size
-        softness = 1.0 - min(edge_density * 10, 1.0)
+        softness = 1.0 - min(features['edge_density_30_80'] * 10, 1.0)
         return max(softness, 0.0)
 
-    def _detect_chunky_texture(self, gray_image):
+    def _detect_chunky_texture(self, features):
         """Detect chunky texture with distinct pieces"""
-        # Find contours to detect chunks
-        edges = cv2.Canny(gray_image, 50, 150)
-        contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        
         # Count significant chunks
-        significant_chunks = sum(1 for c in contours if cv2.contourArea(c) > 100)
-        return min(significant_chunks / 10, 1.0)
+        return min(features['significant_chunks'] / 10, 1.0)
 
-    def _detect_mixed_texture(self, gray_image):
+    def _detect_mixed_texture(self, features):
         """Detect mixed texture with various elements"""
         # High variance indicates mixed textures
-        variance = np.var(gray_image)
+        variance = features['var']
         if variance > 1000:
             return min(variance / 3000, 1.0)
         return variance / 1000
 
-    def _detect_flaky_texture(self, gray_image):
+    def _detect_flaky_texture(self, features):
         """Detect flaky texture (poha, etc.)"""
-        # Use edge detection with specific parameters for flakes
-        edges = cv2.Canny(gray_image, 20, 60)
-        edge_density = np.sum(edges > 0) / edges.size
-        
         # Flaky textures have moderate edge density
+        edge_density = features['edge_density_20_60']
         if 0.05 < edge_density < 0.15:
             return min(edge_density * 10, 1.0)
         return 0.0
 
-    def _detect_spongy_texture(self, gray_image):
+    def _detect_spongy_texture(self, features):
         """Detect spongy texture (dhokla, idli)"""
         # Spongy textures have uniform but slightly varied appearance
-        blur = cv2.GaussianBlur(gray_image, (7, 7), 0)
-        uniformity = 1.0 - (np.std(blur) / 128)
+        uniformity = 1.0 - (features['blur7_std'] / 128)
         return max(uniformity * 0.8, 0.0)
 
-    def _detect_dense_texture(self, gray_image):
+    def _detect_dense_texture(self, features):
         """Detect dense, compact texture"""
         # Dense textures have high pixel intensity consistency
-        mean_intensity = np.mean(gray_image)
-        std_intensity = np.std(gray_image)
-        density_score = mean_intensity / 255 * (1 - std_intensity / 128)
+        density_score = features['mean'] / 255 * (1 - features['std'] / 128)
         return max(density_score, 0.0)
 
-    def _detect_crumbly_texture(self, gray_image):
+    def _detect_crumbly_texture(self, features):
         """Detect crumbly texture (mysore pak, etc.)"""
         # Crumbly textures have irregular small patterns
-        kernel = np.ones((3,3), np.uint8)
-        gradient = cv2.morphologyEx(gray_image, cv2.MORPH_GRADIENT, kernel)
-        crumble_score = np.mean(gradient) / 255
+        crumble_score = features['gradient_mean'] / 255
         return min(crumble_score * 2, 1.0)
 
-    def _detect_mashed_texture(self, gray_image):
+    def _detect_mashed_texture(self, features):
         """Detect mashed texture (bharta, etc.)"""
         # Mashed textures have irregular but smooth patterns
-        blur = cv2.medianBlur(gray_image, 5)
-        diff = cv2.absdiff(gray_image, blur)
-        mash_score = np.mean(diff) / 255
+        mash_score = features['median5_diff_mean'] / 255
         return min(mash_score * 3, 1.0)
 
-    def _detect_minced_texture(self, gray_image):
+    def _detect_minced_texture(self, features):
         """Detect minced texture (keema)"""
         # Minced textures have small granular patterns
-        kernel = np.ones((2,2), np.uint8)
-        eroded = cv2.erode(gray_image, kernel, iterations=1)
-        dilated = cv2.dilate(eroded, kernel, iterations=1)
-        granular_score = np.mean(cv2.absdiff(gray_image, dilated)) / 255
+        granular_score = features['opening_diff_mean'] / 255
         return min(granular_score * 4, 1.0)
 
-    def _detect_charred_texture(self, gray_image):
+    def _detect_charred_texture(self, features):
         """Detect charred, grilled texture"""
         # Charred textures have dark spots and high contrast
-        dark_pixels = np.sum(gray_image < 80) / gray_image.size
-        contrast = np.std(gray_image) / 128
-        char_score = dark_pixels * contrast
+        char_score = features['dark_ratio'] * (features['std'] / 128)
         return min(char_score * 2, 1.0)
 
-    def _detect_puffy_texture(self, gray_image):
+    def _detect_puffy_texture(self, features):
         """Detect puffy, inflated texture"""
         # Puffy textures have rounded, inflated appearance
-        circles = cv2.HoughCircles(gray_image, cv2.HOUGH_GRADIENT, 1, 30,
-                                 param1=40, param2=25, minRadius=20, maxRadius=200)
-        if circles is not None:
-            return min(len(circles[0]) / 3, 1.0)
-        return 0.0
+        return min(features['large_circles'] / 3, 1.0)
 
-    def _detect_mushy_texture(self, gray_image):
+    def _detect_mushy_texture(self, features):
         """Detect mushy, soft texture"""
         # Mushy textures are very smooth with minimal edges
-        edges = cv2.Canny(gray_image, 10, 30)
-        edge_density = np.sum(edges > 0) / edges.size
-        mushiness = 1.0 - min(edge_density * 20, 1.0)
+        mushiness = 1.0 - min(features['edge_density_10_30'] * 20, 1.0)
         return max(mushiness, 0.0)
 
-    def _detect_layered_texture(self, gray_image):
+    def _detect_layered_texture(self, features):
         """Detect layered texture (paratha)"""
-        # Detect horizontal or vertical layers
-        sobelx = cv2.Sobel(gray_image, cv2.CV_64F, 1, 0, ksize=3)
-        sobely = cv2.Sobel(gray_image, cv2.CV_64F, 0, 1, ksize=3)
-        
         # Look for directional patterns
-        horizontal_lines = np.mean(np.abs(sobely))
-        vertical_lines = np.mean(np.abs(sobelx))
-        layer_score = max(horizontal_lines, vertical_lines) / 255
+        layer_score = max(features['sobely_mean'], features['sobelx_mean']) / 255
         return min(layer_score * 2, 1.0)
 
-    def _detect_slightly_textured_texture(self, gray_image):
+    def _detect_slightly_textured_texture(self, features):
         """Detect slightly textured surface"""
         # Moderate texture - between smooth and rough
-        laplacian_var = cv2.Laplacian(gray_image, cv2.CV_64F).var()
+        laplacian_var = features['laplacian_var']
         if 100 < laplacian_var < 400:
             return min(laplacian_var / 400, 1.0)
         return 0.0
@@ -1018,11 +1138,96 @@ class AdvancedFoodDetector:
         """Fallback to popular Indian foods when detection fails"""
         popular_foods = ['biryani', 'dal_tadka', 'butter_chicken', 'roti', 'samosa', 'dosa']
         import random
-        return random.choice(popular_foods)
+        return FallbackGuess(random.choice(popular_foods))
 
 # Global detector instance
-food_detector = AdvancedFoodDetector()
+food_detector = AdvancedFoodDetector(color_engine=os.getenv('FOOD_COLOR_ENGINE', 'histogram'))
 
-def detect_food_advanced(image_data, filename=""):
-    """Main function to detect food using advanced algorithms"""
-    return food_detector.analyze_image_advanced(image_data, filename)
+def detect_food_advanced(image_data, filename="", timings=None):
+    """Main function to detect food using advanced algorithms (timings as in analyze_image_advanced)"""
+    return food_detector.analyze_image_advanced(image_data, filename, timings)
+
+# Worker pool for batch detection (each worker process owns its own detector)
+# Shared by every request thread in the process; _detector_pool_lock guards creating and replacing it
+_detector_pool = None
+_detector_pool_size = None
+_detector_pool_lock = threading.Lock()
+
+def get_detector_pool(max_workers=None):
+    """
+    Get the shared detector process pool, creating it on first use with
+    max_workers processes (default one per CPU)
+    A running pool is never resized, since other requests may still be
+    submitting to it, so asking it for a different size raises ValueError
+    """
+    global _detector_pool, _detector_pool_size
+    with _detector_pool_lock:
+        if _detector_pool is None:
+            _detector_pool_size = max_workers or os.cpu_count() or 1
+            _detector_pool = ProcessPoolExecutor(max_workers=_detector_pool_size)
+        elif max_workers and max_workers != _detector_pool_size:
+            raise ValueError(f"Detector pool is running with {_detector_pool_size} workers, not {max_workers}")
+        return _detector_pool
+
+def discard_detector_pool(pool):
+    """Drop a broken pool so the next caller starts a fresh one (no-op if it was already replaced)"""
+    global _detector_pool
+    with _detector_pool_lock:
+        if _detector_pool is not pool:
+            return
+        _detector_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def shutdown_detector_pool():
+    """Stop the detector worker processes"""
+    global _detector_pool
+    with _detector_pool_lock:
+        pool, _detector_pool = _detector_pool, None
+    if pool is not None:
+        pool.shutdown(wait=True)
+
+atexit.register(shutdown_detector_pool)
+
+def submit_detections(images, max_workers=None):
+    """Futures for the images, on a fresh pool if the shared one broke under another request"""
+    for attempt in range(2):
+        pool = get_detector_pool(max_workers)
+        futures = []
+        try:
+            for image_data, filename in images:
+                futures.append(pool.submit(detect_food_advanced, image_data, filename))
+            return pool, futures
+        except BaseException as e:
+            # Nobody will collect the images already submitted, so don't leave them queued
+            for future in futures:
+                future.cancel()
+            # RuntimeError: the pool was shut down after a break between get and submit
+            if not isinstance(e, (BrokenProcessPool, RuntimeError)):
+                raise
+            discard_detector_pool(pool)
+            if attempt:
+                raise
+
+def detect_food_batch(images, max_workers=None):
+    """
+    Detect food in several images in parallel
+    Takes a list of (image_data, filename) pairs and returns, in the same
+    order, either a (food, confidence) tuple or the exception that image raised
+    """
+    pool, futures = submit_detections(images, max_workers)
+    
+    results = []
+    pool_broken = False
+    for future in futures:
+        try:
+            results.append(future.result())
+        except BrokenProcessPool as e:
+            # A worker died; report it and start a fresh pool next time
+            pool_broken = True
+            results.append(e)
+        except Exception as e:
+            results.append(e)
+    
+    if pool_broken:
+        discard_detector_pool(pool)
+    return results
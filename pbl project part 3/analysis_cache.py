@@ -0,0 +1,161 @@
+"""
+Content-addressed cache for food image analysis results
+Keeps a bounded in-memory LRU with an optional SQLite tier on disk
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+
+
+def image_content_hash(image_data):
+    """SHA-256 hex digest of the raw image bytes"""
+    return hashlib.sha256(image_data).hexdigest()
+
+
+def analysis_cache_key(content_hash, filename=""):
+    """Cache key for an image (filename hints change the detection result)"""
+    return f"{content_hash}:{(filename or '').lower()}"
+
+
+# The disk tier is pruned (expired rows, then the oldest beyond max_disk_entries) every this many writes
+DISK_PRUNE_INTERVAL = 100
+
+
+class AnalysisCache:
+    def __init__(self, max_entries=1024, ttl=3600, db_path=None, max_disk_entries=100_000):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_path = db_path
+        self.max_disk_entries = max_disk_entries
+        self._disk_writes = 0
+        self._entries = OrderedDict()  # key -> (stored_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.evictions = 0
+
+        if self.db_path:
+            with closing(self._connect()) as conn, conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS analysis_cache (
+                        key TEXT PRIMARY KEY,
+                        value TEXT NOT NULL,
+                        stored_at REAL NOT NULL
+                    )
+                ''')
+                conn.execute('CREATE INDEX IF NOT EXISTS ix_analysis_cache_stored_at ON analysis_cache (stored_at)')
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=5)
+
+    def _expired(self, stored_at, now):
+        return self.ttl is not None and now - stored_at > self.ttl
+
+    def get(self, key):
+        """Return the cached value for key, or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if not self._expired(stored_at, now):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+        value = self._disk_get(key, now)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._store(key, value, now)
+        return value
+
+    def set(self, key, value):
+        """Store a JSON-serialisable value under key"""
+        now = time.time()
+        with self._lock:
+            self._store(key, value, now)
+        self._disk_set(key, value, now)
+
+    def _store(self, key, value, now):
+        self._entries[key] = (now, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _disk_get(self, key, now):
+        if not self.db_path:
+            return None
+        try:
+            with closing(self._connect()) as conn, conn:
+                row = conn.execute('SELECT value, stored_at FROM analysis_cache WHERE key = ?', (key,)).fetchone()
+                if row is None:
+                    return None
+                if self._expired(row[1], now):
+                    conn.execute('DELETE FROM analysis_cache WHERE key = ?', (key,))
+                    return None
+                return json.loads(row[0])
+        except sqlite3.Error as e:
+            print(f"Analysis cache read error: {e}")
+            return None
+
+    def _disk_set(self, key, value, now):
+        if not self.db_path:
+            return
+        try:
+            with closing(self._connect()) as conn, conn:
+                conn.execute('INSERT OR REPLACE INTO analysis_cache (key, value, stored_at) VALUES (?, ?, ?)',
+                             (key, json.dumps(value), now))
+                with self._lock:
+                    self._disk_writes += 1
+                    prune = self._disk_writes % DISK_PRUNE_INTERVAL == 0
+                if prune:
+                    self._disk_prune(conn, now)
+        except sqlite3.Error as e:
+            print(f"Analysis cache write error: {e}")
+
+    def _disk_prune(self, conn, now):
+        if self.ttl is not None:
+            conn.execute('DELETE FROM analysis_cache WHERE stored_at < ?', (now - self.ttl,))
+        excess = conn.execute('SELECT COUNT(*) FROM analysis_cache').fetchone()[0] - self.max_disk_entries
+        if excess > 0:
+            conn.execute('''
+                DELETE FROM analysis_cache WHERE key IN (
+                    SELECT key FROM analysis_cache ORDER BY stored_at LIMIT ?
+                )
+            ''', (excess,))
+
+    def clear(self):
+        """Drop every cached entry (memory and disk)"""
+        with self._lock:
+            self._entries.clear()
+        if self.db_path:
+            with closing(self._connect()) as conn, conn:
+                conn.execute('DELETE FROM analysis_cache')
+
+    def stats(self):
+        """Hit/miss counters and current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'disk_hits': self.disk_hits,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'disk_tier': bool(self.db_path)
+            }
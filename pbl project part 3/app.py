@@ -1,9 +1,13 @@
-from flask import Flask, request, jsonify, render_template, redirect, url_for, session
-from flask_sqlalchemy import SQLAlchemy
+from flask import Flask, Blueprint, Response, current_app, request, jsonify, render_template, redirect, url_for, session, stream_with_context
+from sqlalchemy import inspect
+from sqlalchemy.exc import IntegrityError
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
+from werkzeug.local import LocalProxy
+import click
 import sqlite3
 import os
+import time
 from datetime import datetime, timedelta
 import json
 import base64
@@ -11,18 +15,31 @@ import io
 from PIL import Image
 import requests
 import random
+import uuid
 import re
 import numpy as np
 from indian_food_database import INDIAN_FOOD_DATABASE, search_food_by_keywords, get_food_info
-from advanced_food_detector import detect_food_advanced
+from nutrition_table import NUTRITION_TABLE
+from advanced_food_detector import detect_food_advanced, detect_food_batch, food_detector, FallbackGuess
+from analysis_cache import AnalysisCache, image_content_hash, analysis_cache_key
+from catalogue import ProductCatalogue, PRODUCT_FIELDS, parse_product_fields, catalogue_page
+from product_import import DEMO_PRODUCTS_PATH, DEFAULT_BATCH_SIZE, DIALECT_INSERTS, read_product_file, upsert_products
+from auth import issue_token, read_token, VerifiedUserCache
+from meal_planning import MEAL_PLANNING
+from meal_planner import MEAL_PLANNER
+from diet_charts import split_chart_data, assemble_chart_data, chart_total_calories, chart_dietary_preference
+from job_queue import JobQueue, JobQueueFull, FINISHED_STATUSES, DONE
+from config import CONFIG_PROFILES, DEFAULT_SECRET_KEY
+from database import db, init_database, database_health, database_stats
+from migrations import stamp
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-here')
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///workoutvibes.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Routes live on a blueprint so create_app() can build apps per configuration
+main = Blueprint('main', __name__, cli_group=None)
 
-
-db = SQLAlchemy(app)
+# Per-app services, created in create_app()
+analysis_cache = LocalProxy(lambda: current_app.extensions['analysis_cache'])
+job_queue = LocalProxy(lambda: current_app.extensions['job_queue'])
+product_catalogue = LocalProxy(lambda: current_app.extensions['product_catalogue'])
 
 # Database Models
 class User(db.Model):
@@ -37,23 +54,48 @@ class Product(db.Model):
     description = db.Column(db.Text)
     image = db.Column(db.String(500))
     price = db.Column(db.Float, nullable=False)
+    
+    __table_args__ = (
+        # Products are identified by name when the catalogue is imported
+        db.Index('ux_product_name', 'name', unique=True),
+    )
+
+class CatalogueVersion(db.Model):
+    """One row, bumped in the same transaction as every product write"""
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
 
 class Cart(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_email = db.Column(db.String(120), nullable=False)
-    product_id = db.Column(db.Integer, nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
     quantity = db.Column(db.Integer, default=1)
+    
+    __table_args__ = (
+        db.Index('ix_cart_user_email_product_id', 'user_email', 'product_id'),
+    )
 
 class Order(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_email = db.Column(db.String(120), nullable=False)
     order_time = db.Column(db.DateTime, default=datetime.utcnow)
+    idempotency_key = db.Column(db.String(64))  # client-supplied, makes checkout retries safe
+    
+    __table_args__ = (
+        db.Index('ix_order_user_email_order_time', 'user_email', 'order_time'),
+        db.Index('ux_order_user_email_idempotency_key', 'user_email', 'idempotency_key', unique=True),
+    )
 
 class OrderItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, nullable=False)
-    product_id = db.Column(db.Integer, nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
     quantity = db.Column(db.Integer, nullable=False)
+    price = db.Column(db.Float)  # unit price at purchase time
+    
+    __table_args__ = (
+        db.Index('ix_order_item_order_id', 'order_id'),
+    )
 
 class Membership(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -61,6 +103,10 @@ class Membership(db.Model):
     plan = db.Column(db.String(50), nullable=False)
     start_date = db.Column(db.DateTime, nullable=False)
     end_date = db.Column(db.DateTime, nullable=False)
+    
+    __table_args__ = (
+        db.Index('ix_membership_user_email_start_date', 'user_email', 'start_date'),
+    )
 
 class DietChart(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -70,58 +116,182 @@ class DietChart(db.Model):
     user_data = db.Column(db.Text, nullable=False)   # JSON string of user profile
     goal = db.Column(db.String(100), nullable=False)
     target_calories = db.Column(db.Integer, nullable=False)
+    total_calories = db.Column(db.Integer)
+    dietary_preference = db.Column(db.String(50))
     created_date = db.Column(db.DateTime, default=datetime.utcnow)
     is_active = db.Column(db.Boolean, default=True)
+    merge_job_id = db.Column(db.String(32))  # job that merged this chart, makes job retries safe
+    meals = db.relationship('DietChartMeal', order_by='DietChartMeal.position', cascade='all, delete-orphan')
+    
+    __table_args__ = (
+        db.Index('ix_diet_chart_user_email_is_active_created_date', 'user_email', 'is_active', 'created_date'),
+        db.Index('ux_diet_chart_merge_job_id', 'merge_job_id', unique=True),
+    )
+
+class DietChartMeal(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    chart_id = db.Column(db.Integer, db.ForeignKey('diet_chart.id'), nullable=False)
+    position = db.Column(db.Integer, nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+    time = db.Column(db.String(20))
+    calories = db.Column(db.Integer)
+    protein = db.Column(db.Float)  # grams
+    carbs = db.Column(db.Float)
+    fats = db.Column(db.Float)
+    macros = db.Column(db.String(100))  # display text as the client sent it
+    foods_listed = db.Column(db.Boolean)  # foods were sent as a list rather than one string
+    extras = db.Column(db.Text)  # JSON of meal values without a column of their own, as sent
+    foods = db.relationship('DietChartMealFood', order_by='DietChartMealFood.position', cascade='all, delete-orphan')
+    
+    __table_args__ = (
+        db.Index('ix_diet_chart_meal_chart_id_position', 'chart_id', 'position'),
+        db.Index('ix_diet_chart_meal_name_calories', 'name', 'calories'),
+    )
+
+class DietChartMealFood(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    meal_id = db.Column(db.Integer, db.ForeignKey('diet_chart_meal.id'), nullable=False)
+    position = db.Column(db.Integer, nullable=False)
+    name = db.Column(db.Text, nullable=False)
+    
+    __table_args__ = (
+        db.Index('ix_diet_chart_meal_food_meal_id_position', 'meal_id', 'position'),
+    )
 
-# Helper function to check if user is registered
-def is_registered_user(user_email):
-    if not user_email or user_email.strip() == '':
-        return False
+class Job(db.Model):
+    """Queued merges and analyses; read and written by job_queue.py"""
+    id = db.Column(db.String(32), primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    user_email = db.Column(db.String(120), nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # JSON
+    payload_blob = db.Column(db.LargeBinary)  # uploaded image, dropped once the job finishes
+    status = db.Column(db.String(20), nullable=False)
+    result = db.Column(db.Text)  # JSON
+    error = db.Column(db.Text)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False)
+    # Times are Unix timestamps
+    created_at = db.Column(db.Float, nullable=False)
+    run_after = db.Column(db.Float, nullable=False)
+    started_at = db.Column(db.Float)
+    finished_at = db.Column(db.Float)
+    lease_expires = db.Column(db.Float)
+    lease_token = db.Column(db.String(32))
+    worker = db.Column(db.String(200))
+    
+    __table_args__ = (
+        db.Index('ix_job_status_run_after', 'status', 'run_after'),
+        db.Index('ix_job_user_email_status', 'user_email', 'status'),
+    )
+
+# Users already checked against the user table, so most requests skip that query
+verified_users = LocalProxy(lambda: current_app.extensions['verified_users'])
+
+@db.event.listens_for(User, 'after_insert')
+@db.event.listens_for(User, 'after_delete')
+def invalidate_verified_user(mapper, connection, user):
+    verified_users.invalidate(user.email)
+
+def bump_catalogue_version(connection):
+    """Mark the catalogue changed for every server process (call inside the writing transaction)"""
+    statement = DIALECT_INSERTS[connection.dialect.name](CatalogueVersion.__table__).values(id=1, version=1)
+    connection.execute(statement.on_conflict_do_update(
+        index_elements=['id'],
+        set_={'version': CatalogueVersion.__table__.c.version + 1}
+    ))
+
+def read_catalogue_version():
+    return db.session.execute(db.select(CatalogueVersion.version).filter_by(id=1)).scalar() or 0
+
+# A product write bumps the catalogue version once per transaction, which the
+# other server processes see before serving from their caches. This process
+# drops its cache once the write commits; dropping it at flush time would let
+# a concurrent request re-cache the old rows before the commit
+@db.event.listens_for(Product, 'after_insert')
+@db.event.listens_for(Product, 'after_update')
+@db.event.listens_for(Product, 'after_delete')
+def note_product_write(mapper, connection, product):
+    info = inspect(product).session.info
+    if not info.get('products_changed'):
+        bump_catalogue_version(connection)
+        info['products_changed'] = True
+
+@db.event.listens_for(db.session, 'after_commit')
+def invalidate_product_catalogue(session):
+    if session.info.pop('products_changed', False):
+        product_catalogue.invalidate()
+
+@db.event.listens_for(db.session, 'after_rollback')
+def forget_product_write(session):
+    session.info.pop('products_changed', None)
+
+# Helper function to get the signed-in user's email
+def authenticated_user_email():
+    """
+    Email of the signed-in, registered user, or None
+    Identity comes from the signed session cookie set at login or from an
+    'Authorization: Bearer <token>' header, never from request parameters
+    """
+    user_email = session.get('user_email')
+    if not user_email:
+        auth_header = request.headers.get('Authorization', '')
+        if auth_header.startswith('Bearer '):
+            user_email = read_token(current_app.config['SECRET_KEY'], auth_header[len('Bearer '):].strip(),
+                                    current_app.config['AUTH_TOKEN_MAX_AGE'])
+    if not user_email:
+        return None
+    
+    if verified_users.is_verified(user_email):
+        return user_email
+    
     user = User.query.filter_by(email=user_email).first()
-    return user is not None
+    if user is None:
+        session.pop('user_email', None)
+        return None
+    verified_users.add(user_email)
+    return user_email
 
 # Routes
-@app.route('/')
+@main.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/login.html')
+@main.route('/login.html')
 def login_page():
     return render_template('login.html')
 
-@app.route('/signup.html')
+@main.route('/signup.html')
 def signup_page():
     return render_template('signup.html')
 
-@app.route('/diet-chart.html')
+@main.route('/diet-chart.html')
 def diet_chart_page():
     return render_template('diet-chart.html')
 
-@app.route('/shop.html')
+@main.route('/shop.html')
 def shop_page():
-    user_email = request.args.get('user_email')
-    if not user_email or user_email.strip() == '':
-        return redirect(url_for('login_page'))
+    if not authenticated_user_email():
+        return redirect(url_for('main.login_page'))
     return render_template('shop.html')
 
-@app.route('/history.html')
+@main.route('/history.html')
 def history_page():
     return render_template('history.html')
 
-@app.route('/membership-history.html')
+@main.route('/membership-history.html')
 def membership_history_page():
     return render_template('membership-history.html')
 
-@app.route('/calories-analysis.html')
+@main.route('/calories-analysis.html')
 def calories_analysis_page():
     return render_template('calories-analysis.html')
 
-@app.route('/merge-diet-chart.html')
+@main.route('/merge-diet-chart.html')
 def merge_diet_chart_page():
     return render_template('merge-diet-chart.html')
 
 # API Routes
-@app.route('/api/signup', methods=['POST'])
+@main.route('/api/signup', methods=['POST'])
 def signup():
     data = request.get_json()
     name = data.get('name')
@@ -148,7 +318,7 @@ def signup():
         db.session.rollback()
         return jsonify({'success': False, 'message': 'Signup failed.'})
 
-@app.route('/api/login', methods=['POST'])
+@main.route('/api/login', methods=['POST'])
 def login():
     data = request.get_json()
     email = data.get('email')
@@ -164,36 +334,89 @@ def login():
     if not check_password_hash(user.password, password):
         return jsonify({'success': False, 'message': 'Incorrect password.'})
     
-    return jsonify({'success': True, 'userName': user.name})
+    # Browsers get a signed session cookie; API clients can send the token instead
+    session['user_email'] = user.email
+    verified_users.add(user.email)
+    token = issue_token(current_app.config['SECRET_KEY'], user.email)
+    
+    return jsonify({'success': True, 'userName': user.name, 'token': token})
 
 
-@app.route('/logout')
+@main.route('/logout')
 def logout():
     session.clear()
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
+
+def load_catalogue_products():
+    """Every product as a dict, in id order"""
+    rows = db.session.execute(
+        db.select(*(getattr(Product, field) for field in PRODUCT_FIELDS)).order_by(Product.id)
+    ).all()
+    return [dict(zip(PRODUCT_FIELDS, row)) for row in rows]
 
-@app.route('/api/products', methods=['GET'])
+@main.route('/api/products', methods=['GET'])
 def get_products():
-    products = Product.query.all()
-    products_list = []
-    for product in products:
-        products_list.append({
-            'id': product.id,
-            'name': product.name,
-            'description': product.description,
-            'image': product.image,
-            'price': product.price
-        })
-    return jsonify({'success': True, 'products': products_list})
+    """
+    The product catalogue, served from the cache with an ETag (304 if unchanged)
+    Query params: fields, and limit / cursor to page through it (all products by default)
+    """
+    try:
+        fields = parse_product_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)})
+    
+    limit = None
+    if 'limit' in request.args or 'cursor' in request.args:
+        try:
+            limit = page_limit(current_app.config['PRODUCT_PAGE_SIZE'], current_app.config['PRODUCT_MAX_PAGE_SIZE'])
+        except ValueError:
+            return jsonify({'success': False, 'message': 'limit must be a number'})
+    after_id = None
+    if request.args.get('cursor'):
+        try:
+            after_id = int(request.args['cursor'])
+        except ValueError:
+            return jsonify({'success': False, 'message': 'Invalid cursor'})
+    
+    try:
+        body, etag = product_catalogue.get(
+            (fields, after_id, limit),
+            load_catalogue_products,
+            lambda products: current_app.json.dumps(catalogue_page(products, fields, after_id, limit)).encode(),
+            version=read_catalogue_version()
+        )
+    except Exception as e:
+        return jsonify({'success': False, 'message': 'Failed to fetch products'})
+    
+    response = current_app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    # Shared with every visitor, so browsers and proxies may show a catalogue up to
+    # max-age seconds old; after that they revalidate and usually get a 304
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config['PRODUCT_CACHE_MAX_AGE']
+    return response.make_conditional(request)
+
+def stats_hidden():
+    """404 response for the cache and database stats routes unless EXPOSE_STATS is on, else None"""
+    if not current_app.config['EXPOSE_STATS']:
+        return jsonify({'success': False, 'message': 'Not found'}), 404
+    return None
 
-@app.route('/api/cart', methods=['POST'])
+@main.route('/api/products/cache-stats', methods=['GET'])
+def product_catalogue_stats():
+    hidden = stats_hidden()
+    if hidden:
+        return hidden
+    return jsonify({'success': True, 'cache': product_catalogue.stats()})
+
+@main.route('/api/cart', methods=['POST'])
 def add_to_cart():
     data = request.get_json()
-    user_email = data.get('user_email')
+    user_email = authenticated_user_email()
     product_id = data.get('product_id')
     quantity = data.get('quantity', 1)
     
-    if not is_registered_user(user_email) or not product_id:
+    if not user_email or not product_id:
         return jsonify({'success': False, 'message': 'Not authenticated'})
     
     # Check if item already in cart
@@ -212,11 +435,11 @@ def add_to_cart():
         db.session.rollback()
         return jsonify({'success': False})
 
-@app.route('/api/cart', methods=['GET'])
+@main.route('/api/cart', methods=['GET'])
 def get_cart():
-    user_email = request.args.get('user_email')
+    user_email = authenticated_user_email()
     
-    if not is_registered_user(user_email):
+    if not user_email:
         return jsonify({'success': False, 'message': 'Not authenticated'})
     
     # Join cart with products
@@ -235,13 +458,13 @@ def get_cart():
     
     return jsonify({'success': True, 'cart': cart_list})
 
-@app.route('/api/cart', methods=['DELETE'])
+@main.route('/api/cart', methods=['DELETE'])
 def remove_from_cart():
     data = request.get_json()
-    user_email = data.get('user_email')
+    user_email = authenticated_user_email()
     product_id = data.get('product_id')
     
-    if not is_registered_user(user_email) or not product_id:
+    if not user_email or not product_id:
         return jsonify({'success': False, 'message': 'Not authenticated'})
     
     try:
@@ -252,76 +475,195 @@ def remove_from_cart():
         db.session.rollback()
         return jsonify({'success': False})
 
-@app.route('/api/order', methods=['POST'])
+@main.route('/api/order', methods=['POST'])
 def create_order():
-    data = request.get_json()
-    user_email = data.get('user_email')
+    user_email = authenticated_user_email()
     
-    if not is_registered_user(user_email):
+    if not user_email:
         return jsonify({'success': False, 'message': 'Not authenticated'})
     
+    data = request.get_json(silent=True) or {}
+    idempotency_key = request.headers.get('Idempotency-Key') or data.get('idempotency_key')
+    if idempotency_key and len(idempotency_key) > 64:
+        return jsonify({'success': False, 'message': 'Invalid idempotency key'})
+    
+    # A retried checkout returns the order the first attempt created
+    if idempotency_key:
+        existing_order = Order.query.filter_by(user_email=user_email, idempotency_key=idempotency_key).first()
+        if existing_order:
+            return jsonify({'success': True, 'order_id': existing_order.id, 'replayed': True})
+    
     try:
         # Create order
-        new_order = Order(user_email=user_email)
+        new_order = Order(user_email=user_email, idempotency_key=idempotency_key)
         db.session.add(new_order)
         db.session.flush()  # Get the order ID
         
-        # Get cart items
-        cart_items = Cart.query.filter_by(user_email=user_email).all()
+        # Lock the cart rows being ordered (PostgreSQL; SQLite already holds the write lock after the flush),
+        # so only these rows are copied and cleared, even if another request adds to the cart meanwhile
+        cart_ids = db.session.execute(
+            db.select(Cart.id).where(Cart.user_email == user_email).with_for_update()
+        ).scalars().all()
+        if not cart_ids:
+            db.session.rollback()
+            return jsonify({'success': False, 'message': 'Cart is empty'})
         
-        # Add order items
-        for cart_item in cart_items:
-            order_item = OrderItem(
-                order_id=new_order.id,
-                product_id=cart_item.product_id,
-                quantity=cart_item.quantity
-            )
-            db.session.add(order_item)
+        # Copy the cart into order items in one statement, snapshotting prices
+        cart_rows = db.select(
+            db.literal(new_order.id), Cart.product_id, Cart.quantity, Product.price
+        ).join(Product, Cart.product_id == Product.id).where(Cart.id.in_(cart_ids))
+        db.session.execute(
+            db.insert(OrderItem).from_select(['order_id', 'product_id', 'quantity', 'price'], cart_rows)
+        )
         
-        # Clear cart
-        Cart.query.filter_by(user_email=user_email).delete()
+        # Clear the ordered rows only
+        db.session.execute(db.delete(Cart).where(Cart.id.in_(cart_ids)))
         
         db.session.commit()
-        return jsonify({'success': True})
+        return jsonify({'success': True, 'order_id': new_order.id})
+    except IntegrityError:
+        # A concurrent request with the same idempotency key won the race
+        db.session.rollback()
+        if idempotency_key:
+            existing_order = Order.query.filter_by(user_email=user_email, idempotency_key=idempotency_key).first()
+            if existing_order:
+                return jsonify({'success': True, 'order_id': existing_order.id, 'replayed': True})
+        return jsonify({'success': False})
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False})
 
-@app.route('/api/history', methods=['GET'])
+# Order history paging and the fields a client may ask for
+HISTORY_ORDER_FIELDS = ('order_id', 'order_time', 'item_count', 'total_quantity', 'total_amount', 'items')
+HISTORY_ITEM_FIELDS = ('product_id', 'name', 'image', 'quantity', 'price', 'line_total')
+
+def encode_page_cursor(timestamp, row_id):
+    """Opaque cursor pointing just past a row in (timestamp, id) descending order"""
+    position = json.dumps([timestamp.isoformat(), row_id])
+    return base64.urlsafe_b64encode(position.encode()).decode().rstrip('=')
+
+def decode_page_cursor(cursor):
+    """(timestamp, row_id) from a cursor, or None if it is malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        timestamp, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (ValueError, TypeError):
+        return None
+
+def page_limit(default, maximum):
+    """?limit= clamped to 1..maximum (ValueError if not a number)"""
+    return max(1, min(int(request.args.get('limit', default)), maximum))
+
+def parse_history_fields(fields_param):
+    """
+    Split ?fields= into (order_fields, item_fields)
+    Accepts order fields plus items.<field>; bare 'items' means every item field
+    """
+    if not fields_param:
+        return list(HISTORY_ORDER_FIELDS), list(HISTORY_ITEM_FIELDS)
+    
+    order_fields = []
+    item_fields = []
+    for field in (part.strip() for part in fields_param.split(',')):
+        if not field:
+            continue
+        if field.startswith('items.'):
+            item_field = field[len('items.'):]
+            if item_field not in HISTORY_ITEM_FIELDS:
+                raise ValueError(f"Unknown field: {field}")
+            item_fields.append(item_field)
+        elif field in HISTORY_ORDER_FIELDS:
+            order_fields.append(field)
+        else:
+            raise ValueError(f"Unknown field: {field}")
+    
+    if item_fields and 'items' not in order_fields:
+        order_fields.append('items')
+    elif 'items' in order_fields and not item_fields:
+        item_fields = list(HISTORY_ITEM_FIELDS)
+    return list(dict.fromkeys(order_fields)), list(dict.fromkeys(item_fields))
+
+@main.route('/api/history', methods=['GET'])
 def get_order_history():
-    user_email = request.args.get('user_email')
+    """
+    One page of the user's orders, newest first, with items grouped under each order
+    Query params: limit, cursor (next_cursor from the previous page), fields
+    """
+    user_email = authenticated_user_email()
     
-    if not is_registered_user(user_email):
+    if not user_email:
         return jsonify({'success': False, 'message': 'Not authenticated'})
     
-    # Join orders, order_items, and products
-    history = db.session.query(Order, OrderItem, Product).join(
-        OrderItem, Order.id == OrderItem.order_id
-    ).join(
-        Product, OrderItem.product_id == Product.id
-    ).filter(Order.user_email == user_email).order_by(Order.order_time.desc()).all()
+    try:
+        limit = page_limit(current_app.config['HISTORY_PAGE_SIZE'], current_app.config['HISTORY_MAX_PAGE_SIZE'])
+    except ValueError:
+        return jsonify({'success': False, 'message': 'limit must be a number'})
     
-    history_list = []
-    for order, order_item, product in history:
-        history_list.append({
+    try:
+        order_fields, item_fields = parse_history_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)})
+    
+    # Keyset pagination on (order_time, id), served by ix_order_user_email_order_time
+    query = Order.query.filter(Order.user_email == user_email)
+    cursor = request.args.get('cursor')
+    if cursor:
+        position = decode_page_cursor(cursor)
+        if position is None:
+            return jsonify({'success': False, 'message': 'Invalid cursor'})
+        cursor_time, cursor_id = position
+        # Row-value comparison keeps this a single index range scan
+        query = query.filter(db.tuple_(Order.order_time, Order.id) < (cursor_time, cursor_id))
+    # One extra row tells us whether another page exists
+    orders = query.order_by(Order.order_time.desc(), Order.id.desc()).limit(limit + 1).all()
+    has_more = len(orders) > limit
+    orders = orders[:limit]
+    
+    # Items for the whole page in one query
+    items_by_order = {order.id: [] for order in orders}
+    if orders:
+        page_items = db.session.query(OrderItem, Product).join(
+            Product, OrderItem.product_id == Product.id
+        ).filter(OrderItem.order_id.in_(list(items_by_order))).order_by(OrderItem.id).all()
+        for order_item, product in page_items:
+            price = order_item.price if order_item.price is not None else product.price
+            items_by_order[order_item.order_id].append({
+                'product_id': product.id,
+                'name': product.name,
+                'image': product.image,
+                'quantity': order_item.quantity,
+                'price': price,
+                'line_total': round(price * order_item.quantity, 2)
+            })
+    
+    orders_list = []
+    for order in orders:
+        items = items_by_order[order.id]
+        full_order = {
             'order_id': order.id,
             'order_time': order.order_time.isoformat(),
-            'product_id': product.id,
-            'quantity': order_item.quantity,
-            'name': product.name,
-            'price': product.price,
-            'image': product.image
-        })
-    
-    return jsonify({'success': True, 'history': history_list})
+            'item_count': len(items),
+            'total_quantity': sum(item['quantity'] for item in items),
+            'total_amount': round(sum(item['line_total'] for item in items), 2),
+            'items': [{field: item[field] for field in item_fields} for item in items]
+        }
+        orders_list.append({field: full_order[field] for field in order_fields})
+    
+    return jsonify({
+        'success': True,
+        'orders': orders_list,
+        'has_more': has_more,
+        'next_cursor': encode_page_cursor(orders[-1].order_time, orders[-1].id) if has_more else None
+    })
 
-@app.route('/api/membership/buy', methods=['POST'])
+@main.route('/api/membership/buy', methods=['POST'])
 def buy_membership():
     data = request.get_json()
-    user_email = data.get('user_email')
+    user_email = authenticated_user_email()
     plan = data.get('plan')
     
-    if not is_registered_user(user_email) or not plan:
+    if not user_email or not plan:
         return jsonify({'success': False, 'message': 'Not authenticated'})
     
     # Calculate membership duration
@@ -349,31 +691,24 @@ def buy_membership():
         return jsonify({'success': False})
 
 # Diet Chart API Routes
-@app.route('/api/diet-chart/save', methods=['POST'])
+@main.route('/api/diet-chart/save', methods=['POST'])
 def save_diet_chart():
     data = request.get_json()
-    user_email = data.get('user_email')
+    user_email = authenticated_user_email()
     chart_name = data.get('chart_name')
     chart_data = data.get('chart_data')
     user_data = data.get('user_data')
     goal = data.get('goal')
     target_calories = data.get('target_calories')
     
-    if not is_registered_user(user_email):
+    if not user_email:
         return jsonify({'success': False, 'message': 'Not authenticated'})
     
     if not all([chart_name, chart_data, user_data, goal, target_calories]):
         return jsonify({'success': False, 'message': 'Missing required data'})
     
     try:
-        new_diet_chart = DietChart(
-            user_email=user_email,
-            chart_name=chart_name,
-            chart_data=json.dumps(chart_data),
-            user_data=json.dumps(user_data),
-            goal=goal,
-            target_calories=target_calories
-        )
+        new_diet_chart = build_diet_chart(user_email, chart_name, chart_data, user_data, goal, target_calories)
         db.session.add(new_diet_chart)
         db.session.commit()
         return jsonify({'success': True, 'message': 'Diet chart saved successfully'})
@@ -381,39 +716,150 @@ def save_diet_chart():
         db.session.rollback()
         return jsonify({'success': False, 'message': 'Failed to save diet chart'})
 
-@app.route('/api/diet-chart/list', methods=['GET'])
+def build_diet_chart(user_email, chart_name, chart_data, user_data, goal, target_calories):
+    """DietChart with its meals and foods as rows; only chart-level extras stay JSON"""
+    meals, extras = split_chart_data(chart_data)
+    return DietChart(
+        user_email=user_email,
+        chart_name=chart_name,
+        chart_data=json.dumps(extras),
+        user_data=json.dumps(user_data),
+        goal=goal,
+        target_calories=target_calories,
+        total_calories=chart_total_calories(chart_data, meals),
+        dietary_preference=chart_dietary_preference(user_data),
+        meals=[
+            DietChartMeal(
+                position=position,
+                name=meal['name'],
+                time=meal['time'],
+                calories=meal['calories'],
+                protein=meal['protein'],
+                carbs=meal['carbs'],
+                fats=meal['fats'],
+                macros=meal['macros'],
+                foods_listed=meal['foods_listed'],
+                extras=json.dumps(meal['extras']) if meal['extras'] else None,
+                foods=[DietChartMealFood(position=food_position, name=food) for food_position, food in enumerate(meal['foods'])]
+            )
+            for position, meal in enumerate(meals)
+        ]
+    )
+
+def diet_chart_summary(chart):
+    return {
+        'id': chart.id,
+        'chart_name': chart.chart_name,
+        'goal': chart.goal,
+        'target_calories': chart.target_calories,
+        'total_calories': chart.total_calories,
+        'created_date': chart.created_date.isoformat()
+    }
+
+def diet_chart_detail(chart):
+    """Summary plus the reassembled chart document and user profile"""
+    meals = [{
+        'name': meal.name,
+        'time': meal.time,
+        'calories': meal.calories,
+        'macros': meal.macros,
+        'foods': [food.name for food in meal.foods],
+        'foods_listed': meal.foods_listed,
+        'extras': json.loads(meal.extras) if meal.extras else None
+    } for meal in chart.meals]
+    detail = diet_chart_summary(chart)
+    detail['chart_data'] = assemble_chart_data(json.loads(chart.chart_data), meals)
+    detail['user_data'] = json.loads(chart.user_data)
+    return detail
+
+def conditional_json(payload):
+    """JSON response with an ETag; 304 Not Modified if the client's copy matches"""
+    response = jsonify(payload)
+    response.add_etag()
+    # Browsers may keep a copy but must revalidate it every time
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+@main.route('/api/diet-chart/list', methods=['GET'])
 def get_diet_charts():
-    user_email = request.args.get('user_email')
+    """
+    One page of active charts, newest first
+    Summaries by default, ?view=full for meals and profile; query params limit and cursor
+    """
+    user_email = authenticated_user_email()
     
-    if not is_registered_user(user_email):
+    if not user_email:
         return jsonify({'success': False, 'message': 'Not authenticated'})
     
     try:
-        diet_charts = DietChart.query.filter_by(user_email=user_email, is_active=True).order_by(DietChart.created_date.desc()).all()
+        limit = page_limit(current_app.config['DIET_CHART_PAGE_SIZE'], current_app.config['DIET_CHART_MAX_PAGE_SIZE'])
+    except ValueError:
+        return jsonify({'success': False, 'message': 'limit must be a number'})
+    
+    try:
+        query = DietChart.query.filter_by(user_email=user_email, is_active=True)
+        cursor = request.args.get('cursor')
+        if cursor:
+            position = decode_page_cursor(cursor)
+            if position is None:
+                return jsonify({'success': False, 'message': 'Invalid cursor'})
+            query = query.filter(db.tuple_(DietChart.created_date, DietChart.id) < position)
+        query = query.order_by(DietChart.created_date.desc(), DietChart.id.desc()).limit(limit + 1)
         
-        charts_list = []
-        for chart in diet_charts:
-            charts_list.append({
-                'id': chart.id,
-                'chart_name': chart.chart_name,
-                'goal': chart.goal,
-                'target_calories': chart.target_calories,
-                'created_date': chart.created_date.isoformat(),
-                'chart_data': json.loads(chart.chart_data),
-                'user_data': json.loads(chart.user_data)
-            })
+        full_view = request.args.get('view') == 'full'
+        if full_view:
+            # Meals and foods for the page in two extra queries
+            diet_charts = query.options(
+                db.selectinload(DietChart.meals).selectinload(DietChartMeal.foods)
+            ).all()
+        else:
+            # Summary columns only, so the JSON text columns are never read
+            diet_charts = query.options(db.load_only(
+                DietChart.id, DietChart.chart_name, DietChart.goal, DietChart.target_calories,
+                DietChart.total_calories, DietChart.created_date
+            )).all()
+        
+        has_more = len(diet_charts) > limit
+        diet_charts = diet_charts[:limit]
+        charts_list = [diet_chart_detail(chart) if full_view else diet_chart_summary(chart) for chart in diet_charts]
+        last_chart = diet_charts[-1] if diet_charts else None
         
-        return jsonify({'success': True, 'charts': charts_list})
+        return conditional_json({
+            'success': True,
+            'charts': charts_list,
+            'has_more': has_more,
+            'next_cursor': encode_page_cursor(last_chart.created_date, last_chart.id) if has_more else None
+        })
     except Exception as e:
         return jsonify({'success': False, 'message': 'Failed to fetch diet charts'})
 
-@app.route('/api/diet-chart/delete', methods=['DELETE'])
+@main.route('/api/diet-chart/<int:chart_id>', methods=['GET'])
+def get_diet_chart(chart_id):
+    """Full detail of one active chart"""
+    user_email = authenticated_user_email()
+    
+    if not user_email:
+        return jsonify({'success': False, 'message': 'Not authenticated'})
+    
+    try:
+        diet_chart = DietChart.query.options(
+            db.selectinload(DietChart.meals).selectinload(DietChartMeal.foods)
+        ).filter_by(id=chart_id, user_email=user_email, is_active=True).first()
+        if not diet_chart:
+            return jsonify({'success': False, 'message': 'Diet chart not found'})
+        
+        return conditional_json({'success': True, 'chart': diet_chart_detail(diet_chart)})
+    except Exception as e:
+        return jsonify({'success': False, 'message': 'Failed to fetch diet chart'})
+
+@main.route('/api/diet-chart/delete', methods=['DELETE'])
 def delete_diet_chart():
     data = request.get_json()
-    user_email = data.get('user_email')
+    user_email = authenticated_user_email()
     chart_id = data.get('chart_id')
     
-    if not is_registered_user(user_email) or not chart_id:
+    if not user_email or not chart_id:
         return jsonify({'success': False, 'message': 'Not authenticated or missing chart ID'})
     
     try:
@@ -428,16 +874,53 @@ def delete_diet_chart():
         db.session.rollback()
         return jsonify({'success': False, 'message': 'Failed to remove diet chart'})
 
-@app.route('/api/diet-chart/merge', methods=['POST'])
+@main.route('/api/diet-chart/merge', methods=['POST'])
 def merge_diet_charts():
     data = request.get_json()
-    user_email = data.get('user_email')
+    user_email = authenticated_user_email()
     selected_chart_ids = data.get('selected_chart_ids')
     merge_goal = data.get('merge_goal')
     
-    if not is_registered_user(user_email) or not selected_chart_ids or not merge_goal:
+    if not user_email or not selected_chart_ids or not merge_goal:
         return jsonify({'success': False, 'message': 'Missing required data'})
     
+    try:
+        return jsonify(perform_diet_chart_merge(user_email, selected_chart_ids, merge_goal))
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Failed to merge diet charts: {str(e)}'})
+
+def merged_chart_payload(merged_chart, merged_chart_data):
+    return {
+        'success': True, 
+        'message': 'Diet charts merged successfully',
+        'merged_chart': {
+            'id': merged_chart.id,
+            'chart_name': merged_chart.chart_name,
+            'goal': merged_chart.goal,
+            'target_calories': merged_chart.target_calories,
+            'chart_data': merged_chart_data
+        }
+    }
+
+def merge_job_replay(user_email, job_id):
+    """Payload for the chart a merge job already created, or None"""
+    merged_chart = DietChart.query.filter_by(user_email=user_email, merge_job_id=job_id).first()
+    if not merged_chart:
+        return None
+    payload = merged_chart_payload(merged_chart, diet_chart_detail(merged_chart)['chart_data'])
+    payload['replayed'] = True
+    return payload
+
+def perform_diet_chart_merge(user_email, selected_chart_ids, merge_goal, job_id=None):
+    """
+    Merge the selected charts into one active chart; returns the API payload (raises on database errors)
+    With a job_id, a retry after the merge committed returns that chart instead of merging again
+    """
+    if job_id:
+        replay = merge_job_replay(user_email, job_id)
+        if replay:
+            return replay
+    
     try:
         # Get selected diet charts
         selected_charts = DietChart.query.filter(
@@ -447,27 +930,24 @@ def merge_diet_charts():
         ).all()
         
         if not selected_charts:
-            return jsonify({'success': False, 'message': 'No valid charts found'})
+            return {'success': False, 'message': 'No valid charts found'}
         
         # Generate merged diet chart
         merged_chart_data = generate_merged_diet_chart(selected_charts, merge_goal)
         
         # Create merged chart name
-        chart_names = [chart.chart_name for chart in selected_charts]
         merged_name = f"Merged Diet Plan - {merge_goal} ({len(selected_charts)} charts)"
         
         # Calculate average target calories
         avg_calories = sum(chart.target_calories for chart in selected_charts) // len(selected_charts)
         
         # Save merged diet chart
-        merged_chart = DietChart(
-            user_email=user_email,
-            chart_name=merged_name,
-            chart_data=json.dumps(merged_chart_data),
-            user_data=json.dumps(json.loads(selected_charts[0].user_data)),  # Use first chart's user data
-            goal=merge_goal,
-            target_calories=avg_calories
+        merged_chart = build_diet_chart(
+            user_email, merged_name, merged_chart_data,
+            json.loads(selected_charts[0].user_data),  # Use first chart's user data
+            merge_goal, avg_calories
         )
+        merged_chart.merge_job_id = job_id
         db.session.add(merged_chart)
         
         # Deactivate all previous diet charts for this user
@@ -478,103 +958,46 @@ def merge_diet_charts():
         
         db.session.commit()
         
-        return jsonify({
-            'success': True, 
-            'message': 'Diet charts merged successfully',
-            'merged_chart': {
-                'id': merged_chart.id,
-                'chart_name': merged_chart.chart_name,
-                'goal': merged_chart.goal,
-                'target_calories': merged_chart.target_calories,
-                'chart_data': merged_chart_data
-            }
-        })
-    except Exception as e:
+        return merged_chart_payload(merged_chart, merged_chart_data)
+    except IntegrityError:
+        # Another attempt at the same job (its lease ran out mid-merge) committed first
         db.session.rollback()
-        return jsonify({'success': False, 'message': f'Failed to merge diet charts: {str(e)}'})
+        replay = merge_job_replay(user_email, job_id) if job_id else None
+        if replay:
+            return replay
+        raise
+    except Exception:
+        db.session.rollback()
+        raise
 
 def generate_merged_diet_chart(selected_charts, merge_goal):
     """Generate an optimized merged diet chart from selected charts"""
     
-    # Extract all meals from selected charts
-    all_meals = []
-    total_calories = 0
-    user_preferences = set()
-    
-    for chart in selected_charts:
-        chart_data = json.loads(chart.chart_data)
-        user_data = json.loads(chart.user_data)
-        
-        if 'meals' in chart_data:
-            all_meals.extend(chart_data['meals'])
-            total_calories += chart_data.get('totalCalories', 0)
-        
-        # Collect user preferences
-        user_preferences.add(user_data.get('dietaryPreferences', 'vegetarian'))
+    # Totals and preferences come from chart columns, no JSON parsing
+    # (charts saved without a meal total fall back to their target)
+    total_calories = sum(chart.total_calories or chart.target_calories or 0 for chart in selected_charts)
+    user_preferences = {chart.dietary_preference or 'vegetarian' for chart in selected_charts}
     
     # Calculate target calories based on goal
     avg_calories = total_calories // len(selected_charts) if selected_charts else 2000
+    target_calories = avg_calories + MEAL_PLANNING.goal_adjustment(merge_goal)
     
-    goal_adjustments = {
-        'Weight Loss': -200,
-        'Weight Gain': +300,
-        'Muscle Building': +250,
-        'Maintenance': 0,
-        'Athletic Performance': +150
-    }
+    # Plan for the strictest preference so the result suits every chart
+    primary_preference = MEAL_PLANNER.strictest_preference(user_preferences)
     
-    target_calories = avg_calories + goal_adjustments.get(merge_goal, 0)
-    
-    # Create optimized meal distribution based on goal
-    if merge_goal == 'Weight Loss':
-        meal_distribution = {
-            'Breakfast': 0.30,  # Larger breakfast for weight loss
-            'Mid-Morning': 0.10,
-            'Lunch': 0.35,
-            'Evening': 0.10,
-            'Dinner': 0.15      # Smaller dinner
-        }
-    elif merge_goal == 'Muscle Building':
-        meal_distribution = {
-            'Breakfast': 0.25,
-            'Mid-Morning': 0.15,  # More snacks for muscle building
-            'Lunch': 0.30,
-            'Evening': 0.15,
-            'Dinner': 0.15
-        }
-    else:
-        meal_distribution = {
-            'Breakfast': 0.25,
-            'Mid-Morning': 0.10,
-            'Lunch': 0.35,
-            'Evening': 0.10,
-            'Dinner': 0.20
-        }
-    
-    # Get primary dietary preference
-    primary_preference = list(user_preferences)[0] if user_preferences else 'vegetarian'
-    
-    # Generate truly optimized meals with variety
-    optimized_meals = []
-    for meal_name, percentage in meal_distribution.items():
-        meal_calories = int(target_calories * percentage)
-        
-        optimized_meal = {
-            'time': get_default_meal_time(meal_name),
-            'name': meal_name,
-            'calories': meal_calories,
-            'foods': generate_optimal_food_options(meal_name, merge_goal, primary_preference, meal_calories),
-            'macros': calculate_optimal_macros(meal_calories, meal_name, merge_goal)
-        }
-        
-        optimized_meals.append(optimized_meal)
+    # Concrete dishes per meal, fitted to the meal's calories and macro split
+    optimized_meals, within_tolerance = MEAL_PLANNER.plan_day(merge_goal, primary_preference, target_calories)
     
     # Generate comprehensive optimization notes
-    optimization_notes = generate_comprehensive_optimization_notes(merge_goal, len(selected_charts), target_calories, primary_preference)
+    optimization_notes = MEAL_PLANNING.optimization_notes(merge_goal, len(selected_charts), target_calories, primary_preference)
     
     return {
         'meals': optimized_meals,
-        'totalCalories': target_calories,
+        'totalCalories': sum(meal['calories'] for meal in optimized_meals),
+        'targetCalories': target_calories,
+        'mealsWithinTolerance': within_tolerance,
+        # Meals the planner couldn't fit within tolerance are reported, not hidden
+        'knownLimitations': MEAL_PLANNING.known_limitations(sum(within_tolerance), len(within_tolerance)),
         'goal': merge_goal,
         'optimizationNotes': optimization_notes,
         'chartsUsed': len(selected_charts),
@@ -582,233 +1005,16 @@ def generate_merged_diet_chart(selected_charts, merge_goal):
             f'Intelligently merged {len(selected_charts)} diet charts for {merge_goal}',
             f'Goal-optimized calorie distribution: {target_calories} total calories',
             f'Customized for {primary_preference} dietary preferences',
-            'Meal-specific food variety and nutritional balance',
+            f"Dishes fitted to each meal's calories and macros ({sum(within_tolerance)}/{len(within_tolerance)} meals within tolerance)",
             'Optimized meal timing for metabolic efficiency'
         ]
     }
 
-def generate_optimal_food_options(meal_name, goal, dietary_preference, calories):
-    """Generate optimal food options for specific meal, goal, and preferences"""
-    
-    food_database = {
-        'Breakfast': {
-            'vegetarian': {
-                'Weight Loss': ['Greek yogurt with berries and nuts', 'Vegetable omelet with whole grain toast', 'Oatmeal with protein powder and fruits'],
-                'Weight Gain': ['Protein smoothie with banana and peanut butter', 'Avocado toast with eggs', 'Granola with full-fat yogurt and nuts'],
-                'Muscle Building': ['Protein pancakes with Greek yogurt', 'Scrambled eggs with quinoa and vegetables', 'Cottage cheese with fruits and nuts'],
-                'Maintenance': ['Balanced oatmeal with fruits and nuts', 'Vegetable omelet with whole grain bread', 'Greek yogurt parfait'],
-                'Athletic Performance': ['High-protein smoothie bowl', 'Energy-dense oatmeal with nuts and seeds', 'Protein-rich egg scramble']
-            },
-            'non-vegetarian': {
-                'Weight Loss': ['Egg white omelet with vegetables', 'Grilled chicken with avocado', 'Protein smoothie with berries'],
-                'Weight Gain': ['Whole eggs with turkey bacon', 'Protein pancakes with chicken sausage', 'High-calorie smoothie with protein'],
-                'Muscle Building': ['Lean beef with sweet potato hash', 'Chicken and egg scramble', 'Protein-packed omelet with lean meat'],
-                'Maintenance': ['Balanced egg and meat breakfast', 'Chicken with whole grain toast', 'Protein smoothie with lean meat'],
-                'Athletic Performance': ['High-protein meat and egg combo', 'Performance smoothie with whey', 'Lean meat with complex carbs']
-            }
-        },
-        'Mid-Morning': {
-            'vegetarian': {
-                'Weight Loss': ['Apple with almond butter', 'Greek yogurt with cucumber', 'Mixed nuts and seeds'],
-                'Weight Gain': ['Trail mix with dried fruits', 'Protein bar with nuts', 'Smoothie with protein powder'],
-                'Muscle Building': ['Protein shake with banana', 'Cottage cheese with nuts', 'Greek yogurt with granola'],
-                'Maintenance': ['Fresh fruit with nuts', 'Yogurt with berries', 'Healthy granola bar'],
-                'Athletic Performance': ['Energy balls with dates and nuts', 'Protein smoothie', 'Mixed nuts and dried fruits']
-            },
-            'non-vegetarian': {
-                'Weight Loss': ['Hard-boiled eggs', 'Turkey jerky', 'Protein shake'],
-                'Weight Gain': ['Protein bar with nuts', 'Chicken salad wrap', 'High-calorie smoothie'],
-                'Muscle Building': ['Whey protein shake', 'Lean meat snack', 'Protein-rich energy bar'],
-                'Maintenance': ['Balanced protein snack', 'Lean meat with crackers', 'Protein smoothie'],
-                'Athletic Performance': ['Performance protein bar', 'Lean meat snack', 'High-protein smoothie']
-            }
-        },
-        'Lunch': {
-            'vegetarian': {
-                'Weight Loss': ['Large salad with quinoa and chickpeas', 'Vegetable curry with brown rice', 'Lentil soup with whole grain bread'],
-                'Weight Gain': ['Quinoa bowl with avocado and nuts', 'Pasta with creamy vegetable sauce', 'Rice and dal with ghee'],
-                'Muscle Building': ['Protein-rich lentil curry with quinoa', 'Paneer with vegetables and rice', 'High-protein pasta with cheese'],
-                'Maintenance': ['Balanced dal-rice with vegetables', 'Quinoa salad with mixed vegetables', 'Vegetable curry with roti'],
-                'Athletic Performance': ['Power bowl with quinoa and legumes', 'High-energy vegetable curry', 'Performance pasta with vegetables']
-            },
-            'non-vegetarian': {
-                'Weight Loss': ['Grilled chicken salad with vegetables', 'Fish with steamed vegetables', 'Lean meat with quinoa'],
-                'Weight Gain': ['Chicken curry with rice', 'Fish with sweet potato', 'Meat with pasta and sauce'],
-                'Muscle Building': ['Grilled chicken with brown rice', 'Salmon with quinoa and vegetables', 'Lean beef with sweet potato'],
-                'Maintenance': ['Balanced chicken with rice and vegetables', 'Fish with mixed grains', 'Lean meat with balanced sides'],
-                'Athletic Performance': ['High-protein chicken bowl', 'Performance fish with complex carbs', 'Power meat and grain combo']
-            }
-        },
-        'Evening': {
-            'vegetarian': {
-                'Weight Loss': ['Roasted chickpeas', 'Vegetable sticks with hummus', 'Green tea with almonds'],
-                'Weight Gain': ['Protein smoothie with nuts', 'Granola with yogurt', 'Nut butter with fruits'],
-                'Muscle Building': ['Protein bar with nuts', 'Greek yogurt with granola', 'Cottage cheese with fruits'],
-                'Maintenance': ['Mixed nuts and fruits', 'Healthy snack bar', 'Yogurt with berries'],
-                'Athletic Performance': ['Energy-dense nuts and seeds', 'Performance snack bar', 'High-protein smoothie']
-            },
-            'non-vegetarian': {
-                'Weight Loss': ['Grilled chicken strips', 'Hard-boiled eggs', 'Protein shake'],
-                'Weight Gain': ['Protein bar with meat', 'Chicken salad', 'High-calorie smoothie'],
-                'Muscle Building': ['Lean meat snack', 'Protein shake with extras', 'Chicken with crackers'],
-                'Maintenance': ['Balanced protein snack', 'Lean meat portion', 'Protein smoothie'],
-                'Athletic Performance': ['Performance meat snack', 'High-protein bar', 'Power smoothie']
-            }
-        },
-        'Dinner': {
-            'vegetarian': {
-                'Weight Loss': ['Vegetable curry with small roti', 'Lentil soup with salad', 'Grilled vegetables with quinoa'],
-                'Weight Gain': ['Dal with rice and ghee', 'Paneer curry with naan', 'Pasta with creamy sauce'],
-                'Muscle Building': ['High-protein dal with quinoa', 'Paneer with vegetables and rice', 'Protein-rich curry with bread'],
-                'Maintenance': ['Balanced vegetable curry with roti', 'Dal-rice with vegetables', 'Quinoa with mixed curry'],
-                'Athletic Performance': ['Power vegetable curry', 'High-energy dal-rice combo', 'Performance quinoa bowl']
-            },
-            'non-vegetarian': {
-                'Weight Loss': ['Grilled fish with vegetables', 'Chicken soup with salad', 'Lean meat with steamed vegetables'],
-                'Weight Gain': ['Chicken curry with rice', 'Fish with creamy sauce', 'Meat with pasta'],
-                'Muscle Building': ['Grilled chicken with sweet potato', 'Salmon with quinoa', 'Lean beef with vegetables'],
-                'Maintenance': ['Balanced chicken with rice', 'Fish with mixed vegetables', 'Lean meat with grains'],
-                'Athletic Performance': ['High-protein fish dinner', 'Performance chicken bowl', 'Power meat with complex carbs']
-            }
-        }
-    }
-    
-    # Get appropriate food options
-    meal_foods = food_database.get(meal_name, {})
-    preference_foods = meal_foods.get(dietary_preference, meal_foods.get('vegetarian', {}))
-    goal_foods = preference_foods.get(goal, preference_foods.get('Maintenance', []))
-    
-    if goal_foods:
-        return ', '.join(goal_foods[:3])  # Return top 3 options
-    else:
-        return f"Optimized {meal_name.lower()} for {goal} ({dietary_preference})"
-
-def calculate_optimal_macros(calories, meal_name, goal='Maintenance'):
-    """Calculate optimal macronutrient distribution for a meal based on goal"""
-    
-    # Goal-specific macro adjustments
-    goal_macro_adjustments = {
-        'Weight Loss': {'protein': 0.35, 'carbs': 0.35, 'fats': 0.30},
-        'Weight Gain': {'protein': 0.25, 'carbs': 0.50, 'fats': 0.25},
-        'Muscle Building': {'protein': 0.40, 'carbs': 0.35, 'fats': 0.25},
-        'Athletic Performance': {'protein': 0.30, 'carbs': 0.45, 'fats': 0.25},
-        'Maintenance': {'protein': 0.30, 'carbs': 0.45, 'fats': 0.25}
-    }
-    
-    # Meal-specific base ratios
-    meal_base_ratios = {
-        'Breakfast': {'protein': 0.25, 'carbs': 0.50, 'fats': 0.25},
-        'Mid-Morning': {'protein': 0.35, 'carbs': 0.45, 'fats': 0.20},
-        'Lunch': {'protein': 0.30, 'carbs': 0.45, 'fats': 0.25},
-        'Evening': {'protein': 0.40, 'carbs': 0.40, 'fats': 0.20},
-        'Dinner': {'protein': 0.35, 'carbs': 0.35, 'fats': 0.30}
-    }
-    
-    # Combine goal and meal ratios
-    base_ratios = meal_base_ratios.get(meal_name, meal_base_ratios['Breakfast'])
-    goal_ratios = goal_macro_adjustments.get(goal, goal_macro_adjustments['Maintenance'])
-    
-    # Average the ratios for optimal distribution
-    optimal_ratios = {
-        'protein': (base_ratios['protein'] + goal_ratios['protein']) / 2,
-        'carbs': (base_ratios['carbs'] + goal_ratios['carbs']) / 2,
-        'fats': (base_ratios['fats'] + goal_ratios['fats']) / 2
-    }
-    
-    protein_g = round((calories * optimal_ratios['protein']) / 4)
-    carbs_g = round((calories * optimal_ratios['carbs']) / 4)
-    fats_g = round((calories * optimal_ratios['fats']) / 9)
-    
-    return f"P: {protein_g}g, C: {carbs_g}g, F: {fats_g}g"
-
-def generate_comprehensive_optimization_notes(goal, charts_used, target_calories, dietary_preference):
-    """Generate comprehensive optimization notes for merged diet chart"""
-    
-    goal_specific_notes = {
-        'Weight Loss': [
-            f"🔥 Calorie deficit optimized: {target_calories} calories for sustainable weight loss",
-            "🍽️ Larger breakfast (30%) and smaller dinner (15%) for better metabolism",
-            "🥗 High-protein meals (35-40%) to maintain muscle mass during weight loss",
-            "⏰ Meal timing optimized for fat burning and energy maintenance"
-        ],
-        'Weight Gain': [
-            f"📈 Calorie surplus optimized: {target_calories} calories for healthy weight gain",
-            "🥜 Nutrient-dense, calorie-rich foods selected for efficient weight gain",
-            "🍽️ Balanced meal distribution with emphasis on healthy fats (25%)",
-            "💪 Protein intake optimized to support lean muscle growth"
-        ],
-        'Muscle Building': [
-            f"💪 High-protein optimization: {target_calories} calories for muscle synthesis",
-            "🥩 Protein intake increased to 40% for optimal muscle protein synthesis",
-            "🍌 Strategic carb timing around workouts for energy and recovery",
-            "⚡ Frequent meals (15% snacks) to maintain positive nitrogen balance"
-        ],
-        'Athletic Performance': [
-            f"🏃‍♂️ Performance-focused: {target_calories} calories for peak athletic output",
-            "⚡ Carbohydrate emphasis (45%) for sustained energy and glycogen replenishment",
-            "🔋 Strategic meal timing for pre/post workout optimization",
-            "💧 Enhanced hydration and electrolyte balance considerations"
-        ],
-        'Maintenance': [
-            f"⚖️ Balanced maintenance: {target_calories} calories for weight stability",
-            "🍽️ Classic meal distribution (25-35-20%) for sustained energy",
-            "🥗 Balanced macronutrients (30-45-25%) for overall health",
-            "🌱 Focus on nutrient variety and meal satisfaction"
-        ]
-    }
-    
-    base_notes = [
-        f"🧠 AI-powered merge of {charts_used} personalized diet charts",
-        f"🎯 Goal-specific optimization for {goal} with {dietary_preference} preferences",
-        "🔄 Progressive refinement algorithm applied for maximum effectiveness",
-        "📊 Scientifically-backed macro and calorie distribution",
-        "🌟 Meal variety optimized to prevent dietary boredom"
-    ]
-    
-    specific_notes = goal_specific_notes.get(goal, goal_specific_notes['Maintenance'])
-    
-    return base_notes + specific_notes
-
-def get_default_meal_time(meal_name):
-    """Get default time for meal types"""
-    meal_times = {
-        'Breakfast': '7:00 AM',
-        'Mid-Morning': '10:00 AM', 
-        'Lunch': '1:00 PM',
-        'Evening': '4:00 PM',
-        'Dinner': '7:00 PM'
-    }
-    return meal_times.get(meal_name, '12:00 PM')
-
-def generate_default_meals(target_calories, goal):
-    """Generate default meals when no options available"""
-    base_meals = {
-        'weight_loss': ['Oats with berries', 'Greek yogurt with nuts', 'Green smoothie'],
-        'muscle_gain': ['Protein pancakes', 'Eggs with toast', 'Protein smoothie'],
-        'weight_loss_muscle_gain': ['Egg white omelet', 'Protein oats', 'Lean protein shake'],
-        'weight_loss_endurance': ['Quinoa porridge', 'Fruit bowl with nuts', 'Energy smoothie'],
-        'muscle_gain_endurance': ['Power breakfast bowl', 'Protein-rich meal', 'Recovery shake']
-    }
-    
-    return base_meals.get(goal, ['Balanced meal', 'Nutritious option', 'Healthy choice'])
-
-def generate_optimization_notes(goal):
-    """Generate optimization notes for merged diet chart"""
-    notes = {
-        'weight_loss': 'Optimized for fat loss with moderate calorie deficit and high protein retention',
-        'weight_loss_muscle_gain': 'Balanced approach for simultaneous fat loss and muscle preservation',
-        'muscle_gain': 'High protein and calorie surplus for optimal muscle building',
-        'weight_loss_endurance': 'Endurance-focused with sustained energy and fat burning',
-        'muscle_gain_endurance': 'Muscle building with endurance support and recovery optimization'
-    }
-    
-    return notes.get(goal, 'Optimized for general health and fitness goals')
-
-@app.route('/api/membership/history', methods=['GET'])
+@main.route('/api/membership/history', methods=['GET'])
 def get_membership_history():
-    user_email = request.args.get('user_email')
+    user_email = authenticated_user_email()
     
-    if not is_registered_user(user_email):
+    if not user_email:
         return jsonify({'success': False, 'message': 'Not authenticated'})
     
     memberships = Membership.query.filter_by(user_email=user_email).order_by(Membership.start_date.desc()).all()
@@ -841,38 +1047,56 @@ FOOD_DETECTION_PATTERNS = {
     'mixed_vegetables': ['pav_bhaji', 'bhel_puri', 'aloo_gobi']
 }
 
+# Longest side of the thumbnail analyze_image_properties works on, and the
+# bits kept per channel when binning its colors
+PROPERTIES_IMAGE_SIZE = 128
+PROPERTIES_COLOR_BITS = 4
+
 def analyze_image_properties(image_data):
     """Analyze basic image properties to help with food detection"""
     try:
         image = Image.open(io.BytesIO(image_data))
         
-        # Convert to RGB if needed
+        # Decode at reduced resolution and shrink to a small thumbnail so memory
+        # stays bounded no matter how large the upload is
+        image.draft('RGB', (PROPERTIES_IMAGE_SIZE, PROPERTIES_IMAGE_SIZE))
         if image.mode != 'RGB':
             image = image.convert('RGB')
+        image.thumbnail((PROPERTIES_IMAGE_SIZE, PROPERTIES_IMAGE_SIZE), Image.Resampling.BILINEAR)
         
-        # Get dominant colors (simplified)
-        colors = image.getcolors(maxcolors=256*256*256)
-        if colors:
-            # Sort by frequency and get most common colors
-            colors.sort(key=lambda x: x[0], reverse=True)
-            dominant_colors = colors[:5]
-            
-            # Analyze color patterns
-            color_analysis = []
-            for count, color in dominant_colors:
-                r, g, b = color
-                if r > 200 and g > 150 and b < 100:  # Golden/yellow (rice, bread)
-                    color_analysis.append('golden')
-                elif r > 150 and g < 100 and b < 100:  # Red/brown (curry, meat)
-                    color_analysis.append('reddish')
-                elif r < 100 and g > 150 and b < 100:  # Green (vegetables)
-                    color_analysis.append('green')
-                elif r > 200 and g > 200 and b > 200:  # White (rice, bread)
-                    color_analysis.append('white')
-                elif r < 100 and g < 100 and b < 100:  # Dark (dal, gravy)
-                    color_analysis.append('dark')
-            
-            return color_analysis
+        # Quantised color histogram over packed RGB
+        pixels = np.asarray(image).reshape(-1, 3)
+        shift = 8 - PROPERTIES_COLOR_BITS
+        bins = ((pixels[:, 0].astype(np.int32) >> shift) << (2 * PROPERTIES_COLOR_BITS)) | \
+               ((pixels[:, 1].astype(np.int32) >> shift) << PROPERTIES_COLOR_BITS) | \
+               (pixels[:, 2].astype(np.int32) >> shift)
+        num_bins = 1 << (3 * PROPERTIES_COLOR_BITS)
+        counts = np.bincount(bins, minlength=num_bins)
+        
+        # Most common bins, represented by the mean color of their pixels
+        top_bins = np.argsort(-counts, kind='stable')[:5]
+        top_bins = top_bins[counts[top_bins] > 0]
+        channel_sums = [np.bincount(bins, weights=pixels[:, channel], minlength=num_bins) for channel in range(3)]
+        dominant_colors = [
+            tuple(int(channel_sums[channel][bin_index] / counts[bin_index]) for channel in range(3))
+            for bin_index in top_bins
+        ]
+        
+        # Analyze color patterns
+        color_analysis = []
+        for r, g, b in dominant_colors:
+            if r > 200 and g > 150 and b < 100:  # Golden/yellow (rice, bread)
+                color_analysis.append('golden')
+            elif r > 150 and g < 100 and b < 100:  # Red/brown (curry, meat)
+                color_analysis.append('reddish')
+            elif r < 100 and g > 150 and b < 100:  # Green (vegetables)
+                color_analysis.append('green')
+            elif r > 200 and g > 200 and b > 200:  # White (rice, bread)
+                color_analysis.append('white')
+            elif r < 100 and g < 100 and b < 100:  # Dark (dal, gravy)
+                color_analysis.append('dark')
+        
+        return color_analysis
     except Exception as e:
         print(f"Image analysis error: {e}")
     
@@ -887,10 +1111,7 @@ def detect_indian_food(image_data, filename=""):
     # Use filename hints if available
     filename_hints = []
     if filename:
-        filename_lower = filename.lower()
-        for food_name in INDIAN_FOOD_DATABASE.keys():
-            if food_name.replace('_', ' ') in filename_lower or food_name in filename_lower:
-                filename_hints.append(food_name)
+        filename_hints = food_detector.filename_matcher.matching_foods(filename, INDIAN_FOOD_DATABASE)
     
     # Smart detection based on patterns
     possible_foods = []
@@ -921,115 +1142,115 @@ def detect_indian_food(image_data, filename=""):
 def analyze_food_image(image_data, filename=""):
     """
     Advanced food recognition and nutrition analysis using computer vision
+    The result's timings hold the detector's per-stage milliseconds (empty on a cache hit)
     """
     
     try:
-        # Use advanced detection system
-        detected_food, confidence = detect_food_advanced(image_data, filename)
-        
-        # Get nutrition data from database
-        food_data = INDIAN_FOOD_DATABASE.get(detected_food, {})
-        
-        if not food_data:
-            # Fallback to a default food
-            detected_food = 'dal_tadka'
-            food_data = INDIAN_FOOD_DATABASE[detected_food]
-            confidence = 0.3
+        timings = {}
+        content_hash = image_content_hash(image_data)
+        cache_key = analysis_cache_key(content_hash, filename)
         
-        # Extract nutrition information
-        nutrition = {
-            'calories': food_data.get('calories', 200),
-            'protein': food_data.get('protein', 8),
-            'carbs': food_data.get('carbs', 30),
-            'fats': food_data.get('fats', 5),
-            'fiber': food_data.get('fiber', 3),
-            'sugar': food_data.get('sugar', 5)
-        }
-        
-        # Add realistic variation based on confidence (higher confidence = less variation)
-        variation_range = 0.15 * (1 - confidence)  # Less variation for higher confidence
-        variation = random.uniform(1 - variation_range, 1 + variation_range)
-        for key in nutrition:
-            nutrition[key] = round(nutrition[key] * variation, 1)
-        
-        # Get description
-        description = food_data.get('description', f'Traditional Indian {detected_food.replace("_", " ")}')
-        
-        # Generate health tips based on nutrition
-        health_tips = []
-        if nutrition['calories'] > 350:
-            health_tips.append("⚠️ High calorie food - consider portion control")
-        elif nutrition['calories'] < 100:
-            health_tips.append("🍃 Low calorie option - great for weight management")
-        
-        if nutrition['protein'] > 20:
-            health_tips.append("💪 Excellent protein source for muscle building")
-        elif nutrition['protein'] > 10:
-            health_tips.append("💪 Good protein content")
-        
-        if nutrition['fiber'] > 5:
-            health_tips.append("🌾 High fiber content - excellent for digestive health")
-        elif nutrition['fiber'] > 3:
-            health_tips.append("🌾 Good fiber content for digestive health")
-        
-        if nutrition['fats'] > 20:
-            health_tips.append("🥑 High in fats - ensure balanced intake")
-        elif nutrition['fats'] < 3:
-            health_tips.append("✅ Low fat option")
-        
-        if nutrition['sugar'] > 15:
-            health_tips.append("🍯 Contains sugars - monitor intake if diabetic")
-        
-        # Add Indian food specific tips
-        if detected_food in ['biryani', 'pulao', 'fried_rice']:
-            health_tips.append("🍚 Rich in carbohydrates - perfect post-workout meal")
-        elif detected_food in ['dal_tadka', 'rajma', 'chole', 'moong_dal', 'masoor_dal']:
-            health_tips.append("🌱 Plant-based protein powerhouse")
-        elif detected_food in ['paneer_makhani', 'butter_chicken', 'dal_makhani']:
-            health_tips.append("🥛 Rich and creamy - enjoy in moderation")
-        elif detected_food in ['samosa', 'pakora', 'vada']:
-            health_tips.append("🔥 Deep-fried item - balance with lighter meals")
-        elif detected_food in ['idli', 'dosa', 'uttapam']:
-            health_tips.append("🌟 Fermented food - great for gut health")
-        
-        # Add confidence-based tip
-        if confidence > 0.8:
-            health_tips.append("🎯 High detection confidence - analysis is very accurate")
-        elif confidence > 0.6:
-            health_tips.append("✅ Good detection confidence - analysis is reliable")
-        elif confidence < 0.4:
-            health_tips.append("⚠️ Lower detection confidence - consider uploading a clearer image")
-        
-        if not health_tips:
-            health_tips.append("✅ Well-balanced traditional Indian dish")
+        # Use advanced detection system (unless this exact upload was seen before)
+        cached = analysis_cache.get(cache_key)
+        if cached:
+            detected_food, confidence = cached['food'], cached['confidence']
+        else:
+            detected_food, confidence = detect_food_advanced(image_data, filename, timings)
+            # A random fallback guess must not stick to the image for the cache ttl
+            if not isinstance(detected_food, FallbackGuess):
+                analysis_cache.set(cache_key, {'food': detected_food, 'confidence': float(confidence)})
         
-        return {
-            'food_name': detected_food.replace('_', ' ').title(),
-            'description': description,
-            'nutrition': nutrition,
-            'health_tips': health_tips,
-            'image_url': food_data.get('image_url', ''),
-            'confidence': round(confidence * 100, 1)
-        }
+        analysis = build_food_analysis(detected_food, confidence, seed=content_hash)
+        analysis['timings'] = {stage: round(ms, 1) for stage, ms in timings.items()}
+        return analysis
         
     except Exception as e:
         print(f"Advanced analysis error: {e}")
         # Fallback to basic detection
         return analyze_food_image_basic(image_data, filename)
 
+def build_food_analysis(detected_food, confidence, seed=None):
+    """Build the nutrition analysis for a detected food (seed makes the variation repeatable)"""
+    # Get nutrition data from database
+    food_data = INDIAN_FOOD_DATABASE.get(detected_food, {})
+    
+    if not food_data:
+        # Fallback to a default food
+        detected_food = 'dal_tadka'
+        food_data = INDIAN_FOOD_DATABASE[detected_food]
+        confidence = 0.3
+    
+    # Extract nutrition information, with realistic variation based on confidence
+    # (higher confidence = less variation)
+    variation_range = 0.15 * (1 - confidence)
+    variation = random.Random(seed).uniform(1 - variation_range, 1 + variation_range)
+    nutrition = NUTRITION_TABLE.nutrition(detected_food, portion=variation)
+    
+    # Get description
+    description = food_data.get('description', f'Traditional Indian {detected_food.replace("_", " ")}')
+    
+    # Generate health tips based on nutrition
+    health_tips = []
+    if nutrition['calories'] > 350:
+        health_tips.append("⚠️ High calorie food - consider portion control")
+    elif nutrition['calories'] < 100:
+        health_tips.append("🍃 Low calorie option - great for weight management")
+    
+    if nutrition['protein'] > 20:
+        health_tips.append("💪 Excellent protein source for muscle building")
+    elif nutrition['protein'] > 10:
+        health_tips.append("💪 Good protein content")
+    
+    if nutrition['fiber'] > 5:
+        health_tips.append("🌾 High fiber content - excellent for digestive health")
+    elif nutrition['fiber'] > 3:
+        health_tips.append("🌾 Good fiber content for digestive health")
+    
+    if nutrition['fats'] > 20:
+        health_tips.append("🥑 High in fats - ensure balanced intake")
+    elif nutrition['fats'] < 3:
+        health_tips.append("✅ Low fat option")
+    
+    if nutrition['sugar'] > 15:
+        health_tips.append("🍯 Contains sugars - monitor intake if diabetic")
+    
+    # Add Indian food specific tips
+    if detected_food in ['biryani', 'pulao', 'fried_rice']:
+        health_tips.append("🍚 Rich in carbohydrates - perfect post-workout meal")
+    elif detected_food in ['dal_tadka', 'rajma', 'chole', 'moong_dal', 'masoor_dal']:
+        health_tips.append("🌱 Plant-based protein powerhouse")
+    elif detected_food in ['paneer_makhani', 'butter_chicken', 'dal_makhani']:
+        health_tips.append("🥛 Rich and creamy - enjoy in moderation")
+    elif detected_food in ['samosa', 'pakora', 'vada']:
+        health_tips.append("🔥 Deep-fried item - balance with lighter meals")
+    elif detected_food in ['idli', 'dosa', 'uttapam']:
+        health_tips.append("🌟 Fermented food - great for gut health")
+    
+    # Add confidence-based tip
+    if confidence > 0.8:
+        health_tips.append("🎯 High detection confidence - analysis is very accurate")
+    elif confidence > 0.6:
+        health_tips.append("✅ Good detection confidence - analysis is reliable")
+    elif confidence < 0.4:
+        health_tips.append("⚠️ Lower detection confidence - consider uploading a clearer image")
+    
+    if not health_tips:
+        health_tips.append("✅ Well-balanced traditional Indian dish")
+    
+    return {
+        'food_name': detected_food.replace('_', ' ').title(),
+        'description': description,
+        'nutrition': nutrition,
+        'health_tips': health_tips,
+        'image_url': food_data.get('image_url', ''),
+        'confidence': round(confidence * 100, 1)
+    }
+
 def analyze_food_image_basic(image_data, filename=""):
     """Fallback basic food detection"""
     detected_food = detect_indian_food(image_data, filename)
     food_data = INDIAN_FOOD_DATABASE.get(detected_food, INDIAN_FOOD_DATABASE['dal_tadka'])
-    
-    nutrition = {
-        'calories': food_data.get('calories', 200),
-        'protein': food_data.get('protein', 8),
-        'carbs': food_data.get('carbs', 30),
-        'fats': food_data.get('fats', 5),
-        'fiber': food_data.get('fiber', 3),
-        'sugar': food_data.get('sugar', 5)
-    }
+    nutrition = NUTRITION_TABLE.nutrition(detected_food if detected_food in NUTRITION_TABLE else 'dal_tadka')
     
     return {
         'food_name': detected_food.replace('_', ' ').title(),
@@ -1040,7 +1261,22 @@ def analyze_food_image_basic(image_data, filename=""):
         'confidence': 30.0
     }
 
-@app.route('/api/analyze-food', methods=['POST'])
+ALLOWED_IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp')
+
+def food_analysis_response(analysis_result):
+    """Shape an analysis result for the analyze-food API"""
+    return {
+        'success': True,
+        'food_name': analysis_result['food_name'],
+        'description': analysis_result['description'],
+        'nutrition': analysis_result['nutrition'],
+        'health_tips': analysis_result['health_tips'],
+        'reference_image': analysis_result.get('image_url', ''),
+        'confidence': analysis_result.get('confidence', 50.0),
+        'timings': analysis_result.get('timings', {})
+    }
+
+@main.route('/api/analyze-food', methods=['POST'])
 def analyze_food():
     try:
         if 'image' not in request.files:
@@ -1050,101 +1286,306 @@ def analyze_food():
         if file.filename == '':
             return jsonify({'success': False, 'message': 'No image selected'})
         
-        if file and file.filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
+        if file and file.filename.lower().endswith(ALLOWED_IMAGE_EXTENSIONS):
             # Read and process the image
             image_data = file.read()
             
             # Analyze the food image with filename for better detection
             analysis_result = analyze_food_image(image_data, file.filename)
             
-            return jsonify({
-                'success': True,
-                'food_name': analysis_result['food_name'],
-                'description': analysis_result['description'],
-                'nutrition': analysis_result['nutrition'],
-                'health_tips': analysis_result['health_tips'],
-                'reference_image': analysis_result.get('image_url', ''),
-                'confidence': analysis_result.get('confidence', 50.0)
-            })
+            return jsonify(food_analysis_response(analysis_result))
         else:
             return jsonify({'success': False, 'message': 'Invalid image format'})
             
     except Exception as e:
         return jsonify({'success': False, 'message': f'Analysis failed: {str(e)}'})
 
-@app.route('/api/demo-products', methods=['GET'])
-def add_demo_products():
-    demo_products = [
-        {
-            'name': 'Creatine Monohydrate',
-            'description': 'Micronized creatine powder for muscle growth, strength, and performance. 100 servings.',
-            'image': 'https://m.media-amazon.com/images/I/61auT4jdRQL._UF1000,1000_QL80_.jpg',
-            'price': 1399.00
-        },
-        {
-            'name': 'Whey Protein',
-            'description': 'High-quality whey protein for muscle recovery and building. 1kg, chocolate flavor.',
-            'image': 'https://m.media-amazon.com/images/I/71l2r6yqQ0L._AC_SL1500_.jpg',
-            'price': 2499.00
-        },
-        {
-            'name': 'BCAA Powder',
-            'description': 'Branched-chain amino acids for muscle recovery and endurance. 30 servings.',
-            'image': 'https://m.media-amazon.com/images/I/71QKQ9mwV7L._AC_SL1500_.jpg',
-            'price': 1199.00
-        },
-        {
-            'name': 'Electrol Hydration Drink',
-            'description': 'Electrolyte drink for instant hydration and energy during workouts.',
-            'image': 'https://m.media-amazon.com/images/I/61Q5p1QKQwL._AC_SL1000_.jpg',
-            'price': 299.00
-        },
-        {
-            'name': 'Gym Shaker Bottle',
-            'description': 'Leak-proof shaker bottle for protein shakes and supplements. 700ml.',
-            'image': 'https://m.media-amazon.com/images/I/61Q5p1QKQwL._AC_SL1000_.jpg',
-            'price': 349.00
-        },
-        {
-            'name': 'Gym Bag',
-            'description': 'Spacious and durable gym bag with shoe compartment and water-resistant material.',
-            'image': 'https://m.media-amazon.com/images/I/81Q5p1QKQwL._AC_SL1500_.jpg',
-            'price': 899.00
-        },
-        {
-            'name': 'Resistance Bands Set',
-            'description': 'Set of 5 resistance bands for strength training, stretching, and mobility.',
-            'image': 'https://m.media-amazon.com/images/I/71QKQ9mwV7L._AC_SL1500_.jpg',
-            'price': 499.00
-        },
-        {
-            'name': 'Yoga Mat',
-            'description': 'Non-slip yoga mat for workouts, pilates, and stretching. 6mm thick.',
-            'image': 'https://m.media-amazon.com/images/I/81Q5p1QKQwL._AC_SL1500_.jpg',
-            'price': 599.00
-        }
-    ]
+@main.route('/api/analyze-food/batch', methods=['POST'])
+def analyze_food_batch():
+    files = request.files.getlist('images')
+    if not files:
+        return jsonify({'success': False, 'message': 'No images uploaded'})
+    
+    max_batch = current_app.config['FOOD_ANALYSIS_MAX_BATCH']
+    if len(files) > max_batch:
+        return jsonify({'success': False, 'message': f'Too many images (maximum {max_batch})'})
+    
+    # Validate every upload first so bad files don't reach the worker pool
+    results = [None] * len(files)
+    pending = []
+    for index, file in enumerate(files):
+        if file.filename == '':
+            results[index] = {'success': False, 'message': 'No image selected'}
+        elif not file.filename.lower().endswith(ALLOWED_IMAGE_EXTENSIONS):
+            results[index] = {'success': False, 'filename': file.filename, 'message': 'Invalid image format'}
+        else:
+            image_data = file.read()
+            pending.append((index, file.filename, image_data, image_content_hash(image_data)))
+    
+    # Serve repeat uploads from the cache and fan the rest out to the detector workers
+    detections = {}
+    to_detect = []
+    for index, filename, image_data, content_hash in pending:
+        cached = analysis_cache.get(analysis_cache_key(content_hash, filename))
+        if cached:
+            detections[index] = (cached['food'], cached['confidence'])
+        else:
+            to_detect.append((index, filename, image_data, content_hash))
+    
+    if to_detect:
+        detected = detect_food_batch(
+            [(image_data, filename) for _, filename, image_data, _ in to_detect],
+            max_workers=current_app.config['FOOD_ANALYSIS_WORKERS']
+        )
+        for (index, filename, _, content_hash), detection in zip(to_detect, detected):
+            detections[index] = detection
+            if not isinstance(detection, Exception) and not isinstance(detection[0], FallbackGuess):
+                analysis_cache.set(analysis_cache_key(content_hash, filename),
+                                   {'food': detection[0], 'confidence': float(detection[1])})
+    
+    for index, filename, _, content_hash in pending:
+        detection = detections[index]
+        try:
+            if isinstance(detection, Exception):
+                raise detection
+            detected_food, confidence = detection
+            analysis = build_food_analysis(detected_food, confidence, seed=content_hash)
+            results[index] = food_analysis_response(analysis)
+        except Exception as e:
+            results[index] = {'success': False, 'message': f'Analysis failed: {str(e)}'}
+        results[index]['filename'] = filename
+    
+    failed = sum(1 for result in results if not result['success'])
+    return jsonify({
+        'success': failed < len(results),
+        'results': results,
+        'analyzed': len(results) - failed,
+        'failed': failed
+    })
+
+@main.route('/api/analyze-food/cache-stats', methods=['GET'])
+def analysis_cache_stats():
+    hidden = stats_hidden()
+    if hidden:
+        return hidden
+    return jsonify({'success': True, 'cache': analysis_cache.stats()})
+
+@main.route('/api/health', methods=['GET'])
+def health():
+    ok, details = database_health()
+    # Load balancers and gunicorn checks go by the status code
+    return jsonify({'success': ok, 'database': details}), 200 if ok else 503
+
+@main.route('/api/db/stats', methods=['GET'])
+def db_stats():
+    hidden = stats_hidden()
+    if hidden:
+        return hidden
+    return jsonify({'success': True, 'database': database_stats()})
+
+# Background jobs
+def run_merge_job(job):
+    payload = job['payload']
+    return perform_diet_chart_merge(job['user_email'], payload['selected_chart_ids'], payload['merge_goal'], job['id'])
+
+def run_analysis_job(job):
+    return food_analysis_response(analyze_food_image(job['payload_blob'], job['payload']['filename']))
+
+JOB_HANDLERS = {
+    'diet_chart_merge': run_merge_job,
+    'analyze_food': run_analysis_job
+}
+
+def job_owner():
+    """
+    Queue owner for the caller; anonymous callers get a random client id in
+    their session, so clients behind one proxy address don't share jobs or limits
+    """
+    user_email = authenticated_user_email()
+    if user_email:
+        return user_email
+    if 'job_client' not in session:
+        session['job_client'] = uuid.uuid4().hex
+    return f"anonymous:{session['job_client']}"
+
+def job_status(job):
+    return {
+        'id': job['id'],
+        'kind': job['kind'],
+        'status': job['status'],
+        'attempts': job['attempts'],
+        'max_attempts': job['max_attempts'],
+        'error': job['error'],
+        'created_at': job['created_at'],
+        'started_at': job['started_at'],
+        'finished_at': job['finished_at']
+    }
+
+def job_result(job):
+    if job['status'] == DONE:
+        return {'success': True, 'status': job['status'], 'result': job['result']}
+    if job['status'] in FINISHED_STATUSES:
+        return {'success': False, 'status': job['status'], 'message': job['error'] or 'Job failed'}
+    return {'success': False, 'status': job['status'], 'message': 'Job not finished yet'}
+
+def submit_job(kind, owner, payload, payload_blob=None):
+    try:
+        job_id = job_queue.submit(kind, owner, payload, payload_blob)
+    except JobQueueFull as e:
+        return jsonify({'success': False, 'message': str(e)})
+    return jsonify({'success': True, 'job_id': job_id, 'status': 'queued'})
+
+@main.route('/api/jobs/diet-chart-merge', methods=['POST'])
+def submit_merge_job():
+    data = request.get_json()
+    user_email = authenticated_user_email()
+    selected_chart_ids = data.get('selected_chart_ids')
+    merge_goal = data.get('merge_goal')
     
+    if not user_email or not selected_chart_ids or not merge_goal:
+        return jsonify({'success': False, 'message': 'Missing required data'})
+    
+    return submit_job('diet_chart_merge', user_email, {'selected_chart_ids': selected_chart_ids, 'merge_goal': merge_goal})
+
+@main.route('/api/jobs/analyze-food', methods=['POST'])
+def submit_analysis_job():
+    if 'image' not in request.files:
+        return jsonify({'success': False, 'message': 'No image uploaded'})
+    
+    file = request.files['image']
+    if file.filename == '':
+        return jsonify({'success': False, 'message': 'No image selected'})
+    if not file.filename.lower().endswith(ALLOWED_IMAGE_EXTENSIONS):
+        return jsonify({'success': False, 'message': 'Invalid image format'})
+    
+    return submit_job('analyze_food', job_owner(), {'filename': file.filename}, file.read())
+
+@main.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_queue.get(job_id, job_owner())
+    if not job:
+        return jsonify({'success': False, 'message': 'Job not found'})
+    return jsonify({'success': True, 'job': job_status(job)})
+
+@main.route('/api/jobs/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    job = job_queue.get(job_id, job_owner())
+    if not job:
+        return jsonify({'success': False, 'message': 'Job not found'})
+    return jsonify(job_result(job))
+
+@main.route('/api/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """
+    Server-sent events: 'status' on every change, then 'result' when the job finishes
+    Each open stream occupies a web worker for up to JOB_EVENTS_TIMEOUT, so the
+    pages poll /result instead; this is for clients that can't poll
+    """
+    owner = job_owner()
+    if not job_queue.get(job_id, owner):
+        return jsonify({'success': False, 'message': 'Job not found'})
+    
+    def stream():
+        last_status = None
+        deadline = time.monotonic() + current_app.config['JOB_EVENTS_TIMEOUT']
+        while True:
+            job = job_queue.get(job_id, owner)
+            if job is None:
+                yield f"event: missing\ndata: {json.dumps({'message': 'Job not found'})}\n\n"
+                return
+            if job['status'] != last_status:
+                last_status = job['status']
+                yield f"event: status\ndata: {json.dumps(job_status(job))}\n\n"
+            if job['status'] in FINISHED_STATUSES:
+                yield f"event: result\ndata: {json.dumps(job_result(job))}\n\n"
+                return
+            if time.monotonic() > deadline:
+                # Clients reconnect or fall back to polling /result (see JOB_EVENTS_TIMEOUT)
+                yield f"event: timeout\ndata: {json.dumps({'status': job['status']})}\n\n"
+                return
+            time.sleep(0.5)
+    
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@main.cli.command('init-db')
+def init_db_command():
+    """Create missing tables; run once per deploy instead of on every start"""
+    fresh = not inspect(db.engine).get_table_names()
+    db.create_all()
+    if fresh:
+        # The models already include every revision in migrations.py
+        with db.engine.begin() as conn:
+            stamp(conn)
+        click.echo('Database schema created')
+    else:
+        click.echo('Missing tables created; apply schema changes with: python migrate.py')
+
+@main.cli.command('import-products')
+@click.argument('path', required=False, type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', default=DEFAULT_BATCH_SIZE, show_default=True, help='Products per INSERT batch')
+def import_products_command(path, batch_size):
+    """Upsert products by name from a JSON or CSV file (default: the demo products)"""
     try:
-        for product_data in demo_products:
-            # Check if product already exists
-            existing = Product.query.filter_by(name=product_data['name']).first()
-            if not existing:
-                product = Product(
-                    name=product_data['name'],
-                    description=product_data['description'],
-                    image=product_data['image'],
-                    price=product_data['price']
-                )
-                db.session.add(product)
-        
-        db.session.commit()
-        return jsonify({'success': True, 'message': 'Demo products added.'})
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({'success': False, 'message': 'Failed to add demo products.'})
+        products = read_product_file(path or DEMO_PRODUCTS_PATH)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    
+    start = time.perf_counter()
+    count_products = db.select(db.func.count(Product.id))
+    with db.engine.begin() as conn:
+        before = conn.execute(count_products).scalar()
+        upsert_products(conn, Product.__table__, products, batch_size)
+        # Core statements skip the ORM events, so the version is bumped here;
+        # running servers reload the catalogue on their next request
+        bump_catalogue_version(conn)
+        added = conn.execute(count_products).scalar() - before
+    click.echo(f'Imported {len(products)} products ({added} new, {len(products) - added} updated) '
+               f'in {time.perf_counter() - start:.2f}s')
 
-if __name__ == '__main__':
+def create_app(config_name=None, config_overrides=None):
+    """Build the app for a configuration profile (default: APP_CONFIG, else development)"""
+    config_name = config_name or os.getenv('APP_CONFIG', 'development')
+    app = Flask(__name__)
+    app.config.from_object(CONFIG_PROFILES[config_name])
+    app.config.update(config_overrides or {})
+    if config_name == 'production' and app.config['SECRET_KEY'] == DEFAULT_SECRET_KEY:
+        raise RuntimeError('Set SECRET_KEY before running with the production profile')
+    
+    init_database(app)
+    
+    # Detection results keyed by image content, so re-uploads skip the vision pipeline
+    app.extensions['analysis_cache'] = AnalysisCache(
+        max_entries=app.config['ANALYSIS_CACHE_SIZE'],
+        ttl=app.config['ANALYSIS_CACHE_TTL'],
+        db_path=app.config['ANALYSIS_CACHE_PATH'],
+        max_disk_entries=app.config['ANALYSIS_CACHE_DISK_SIZE']
+    )
+    app.extensions['verified_users'] = VerifiedUserCache(ttl=app.config['AUTH_CACHE_TTL'])
+    app.extensions['product_catalogue'] = ProductCatalogue(ttl=app.config['PRODUCT_CACHE_TTL'])
+    
+    # Heavy merges and analyses run in job_worker.py processes, off the web workers;
+    # the queue is the job table, so every node sharing the database sees every job
     with app.app_context():
-        db.create_all()
-    app.run(debug=True, port=3000)
+        engine = db.engine
+    app.extensions['job_queue'] = JobQueue(
+        engine,
+        per_user_running=app.config['JOB_PER_USER_RUNNING'],
+        per_user_pending=app.config['JOB_PER_USER_PENDING'],
+        max_attempts=app.config['JOB_MAX_ATTEMPTS'],
+        lease_seconds=app.config['JOB_LEASE_SECONDS']
+    )
+    
+    app.register_blueprint(main)
+    return app
+
+if __name__ == '__main__':
+    # Development server only; production runs wsgi:app under gunicorn (see gunicorn.conf.py)
+    # and creates the schema with `flask --app app init-db`
+    app = create_app()
+    # The development server runs its own job workers unless job_worker.py is used
+    # (with the debug reloader, only in the child process, which is the one serving requests)
+    if not app.debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        from job_worker import start_worker_threads
+        start_worker_threads(app, app.config['JOB_WORKER_THREADS'] or 1)
+    app.run(debug=app.config['DEBUG'], port=3000)
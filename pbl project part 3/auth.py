@@ -0,0 +1,65 @@
+"""
+Identity helpers for the API
+Signed auth tokens plus an in-process TTL cache of users already verified
+against the database, so authenticated requests skip the user-table query
+"""
+
+import threading
+import time
+
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+
+TOKEN_SALT = 'workoutvibes-auth'
+
+
+def issue_token(secret_key, email):
+    """Signed, timestamped token identifying a user"""
+    return URLSafeTimedSerializer(secret_key, salt=TOKEN_SALT).dumps({'email': email})
+
+
+def read_token(secret_key, token, max_age):
+    """Email inside a valid token, or None if it is forged, malformed or expired"""
+    try:
+        payload = URLSafeTimedSerializer(secret_key, salt=TOKEN_SALT).loads(token, max_age=max_age)
+    except (BadSignature, SignatureExpired):
+        return None
+    return payload.get('email') if isinstance(payload, dict) else None
+
+
+class VerifiedUserCache:
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._verified = {}  # email -> expiry timestamp
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def is_verified(self, email):
+        """True if email was verified within the last ttl seconds"""
+        now = time.monotonic()
+        with self._lock:
+            expires_at = self._verified.get(email)
+            if expires_at is not None and expires_at > now:
+                self.hits += 1
+                return True
+            if expires_at is not None:
+                del self._verified[email]
+            self.misses += 1
+            return False
+
+    def add(self, email):
+        with self._lock:
+            self._verified[email] = time.monotonic() + self.ttl
+
+    def invalidate(self, email):
+        """Forget a user (call on signup and deletion)"""
+        with self._lock:
+            self._verified.pop(email, None)
+
+    def clear(self):
+        with self._lock:
+            self._verified.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._verified), 'ttl': self.ttl, 'hits': self.hits, 'misses': self.misses}
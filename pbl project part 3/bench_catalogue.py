@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Benchmark for /api/products
+Seeds a throwaway SQLite database and times the catalogue request uncached
+(every request rebuilds the payload), cached, and revalidated with If-None-Match
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+
+def time_requests(client, requests, headers=None):
+    start = time.perf_counter()
+    for _ in range(requests):
+        response = client.get('/api/products', headers=headers or {})
+    return (time.perf_counter() - start) / requests * 1000, response
+
+
+def run_benchmark(products=2000, requests=200):
+    with tempfile.TemporaryDirectory() as tmp:
+        from app import create_app, db, Product
+
+        app = create_app('testing', {
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+            'PRODUCT_CACHE_TTL': 0
+        })
+        with app.app_context():
+            db.create_all()
+            db.session.add_all([
+                Product(name=f'Product {number}', description='Bench product ' * 8,
+                        image=f'/static/images/{number}.jpg', price=99.0 + number)
+                for number in range(products)
+            ])
+            db.session.commit()
+        client = app.test_client()
+
+        # ttl 0: the catalogue is reloaded and reserialised on every request, like before the cache
+        uncached, _ = time_requests(client, requests)
+        app.extensions['product_catalogue'].ttl = 60
+        cached, response = time_requests(client, requests)
+        revalidated, not_modified = time_requests(client, requests, {'If-None-Match': response.headers['ETag']})
+        assert not_modified.status_code == 304
+
+        print(f"{products:,} products, {len(response.data) / 1024:.0f} KiB payload, {requests} requests each")
+        print(f"uncached     {uncached:8.2f}ms/request")
+        print(f"cached       {cached:8.2f}ms/request")
+        print(f"304          {revalidated:8.2f}ms/request")
+        with app.app_context():
+            db.engine.dispose()
+
+
+if __name__ == '__main__':
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
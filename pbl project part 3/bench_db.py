@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the per-user lookup queries
+Seeds a throwaway SQLite database with the original schema, then shows
+query plans and timings before and after the query index revision
+"""
+
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from migrations import upgrade
+
+ORIGINAL_SCHEMA = [
+    'CREATE TABLE user (id INTEGER NOT NULL, name VARCHAR(100) NOT NULL, email VARCHAR(120) NOT NULL, password VARCHAR(200) NOT NULL, PRIMARY KEY (id), UNIQUE (email))',
+    'CREATE TABLE product (id INTEGER NOT NULL, name VARCHAR(200) NOT NULL, description TEXT, image VARCHAR(500), price FLOAT NOT NULL, PRIMARY KEY (id))',
+    'CREATE TABLE cart (id INTEGER NOT NULL, user_email VARCHAR(120) NOT NULL, product_id INTEGER NOT NULL, quantity INTEGER, PRIMARY KEY (id))',
+    'CREATE TABLE "order" (id INTEGER NOT NULL, user_email VARCHAR(120) NOT NULL, order_time DATETIME, PRIMARY KEY (id))',
+    'CREATE TABLE order_item (id INTEGER NOT NULL, order_id INTEGER NOT NULL, product_id INTEGER NOT NULL, quantity INTEGER NOT NULL, PRIMARY KEY (id))',
+    'CREATE TABLE membership (id INTEGER NOT NULL, user_email VARCHAR(120) NOT NULL, "plan" VARCHAR(50) NOT NULL, start_date DATETIME NOT NULL, end_date DATETIME NOT NULL, PRIMARY KEY (id))',
+    'CREATE TABLE diet_chart (id INTEGER NOT NULL, user_email VARCHAR(120) NOT NULL, chart_name VARCHAR(200) NOT NULL, chart_data TEXT NOT NULL, user_data TEXT NOT NULL, goal VARCHAR(100) NOT NULL, target_calories INTEGER NOT NULL, created_date DATETIME, is_active BOOLEAN, PRIMARY KEY (id))',
+]
+
+# (label, sql) for the lookups the API routes run; :email is a seeded user
+QUERIES = [
+    ('diet chart list', 'SELECT id, chart_name FROM diet_chart WHERE user_email = :email AND is_active = 1 ORDER BY created_date DESC'),
+    ('cart item lookup', 'SELECT id, quantity FROM cart WHERE user_email = :email AND product_id = :product_id'),
+    ('cart with products', 'SELECT cart.id, product.name FROM cart JOIN product ON cart.product_id = product.id WHERE cart.user_email = :email'),
+    ('order history', 'SELECT "order".id, order_item.quantity, product.name FROM "order" JOIN order_item ON "order".id = order_item.order_id JOIN product ON order_item.product_id = product.id WHERE "order".user_email = :email ORDER BY "order".order_time DESC'),
+    ('membership history', 'SELECT id, "plan" FROM membership WHERE user_email = :email ORDER BY start_date DESC'),
+]
+
+NUM_USERS = 10000
+NUM_PRODUCTS = 1000
+
+
+def seed(conn, rows):
+    """Fill every table with `rows` rows spread over NUM_USERS users"""
+    rng = random.Random(0)
+    start = datetime(2024, 1, 1)
+    emails = [f'user{i}@example.com' for i in range(NUM_USERS)]
+
+    conn.executemany('INSERT INTO user (id, name, email, password) VALUES (?, ?, ?, ?)',
+                     ((i + 1, f'User {i}', email, 'x') for i, email in enumerate(emails)))
+    conn.executemany('INSERT INTO product (id, name, price) VALUES (?, ?, ?)',
+                     ((i + 1, f'Product {i}', 100.0 + i) for i in range(NUM_PRODUCTS)))
+    conn.executemany('INSERT INTO cart (user_email, product_id, quantity) VALUES (?, ?, ?)',
+                     ((rng.choice(emails), rng.randint(1, NUM_PRODUCTS), 1) for _ in range(rows)))
+    conn.executemany('INSERT INTO "order" (id, user_email, order_time) VALUES (?, ?, ?)',
+                     ((i + 1, rng.choice(emails), start + timedelta(minutes=i)) for i in range(rows)))
+    conn.executemany('INSERT INTO order_item (order_id, product_id, quantity) VALUES (?, ?, ?)',
+                     ((rng.randint(1, rows), rng.randint(1, NUM_PRODUCTS), 1) for _ in range(rows)))
+    conn.executemany('INSERT INTO membership (user_email, "plan", start_date, end_date) VALUES (?, ?, ?, ?)',
+                     ((rng.choice(emails), '1month', start, start + timedelta(days=30)) for _ in range(rows)))
+    conn.executemany('INSERT INTO diet_chart (user_email, chart_name, chart_data, user_data, goal, target_calories, created_date, is_active) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                     ((rng.choice(emails), 'Chart', '{}', '{}', 'Maintenance', 2000, start + timedelta(minutes=i), rng.random() < 0.5) for i in range(rows)))
+    conn.commit()
+
+
+def report(conn, title):
+    params = {'email': 'user42@example.com', 'product_id': 7}
+    print(f"\n== {title}")
+    for label, sql in QUERIES:
+        plan = '; '.join(row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params))
+        best = float('inf')
+        for _ in range(3):
+            start = time.perf_counter()
+            conn.execute(sql, params).fetchall()
+            best = min(best, time.perf_counter() - start)
+        print(f"{label:<20} {best * 1000:>9.2f}ms  {plan}")
+
+
+def run_benchmark(rows=1_000_000):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        conn = sqlite3.connect(db_path)
+        for statement in ORIGINAL_SCHEMA:
+            conn.execute(statement)
+        start = time.perf_counter()
+        seed(conn, rows)
+        print(f"Seeded {rows:,} rows per table in {time.perf_counter() - start:.1f}s")
+        report(conn, 'before migration')
+        conn.close()
+
+        start = time.perf_counter()
+        upgrade(db_path, up_to='0002_query_indexes')
+        print(f"Migration took {time.perf_counter() - start:.1f}s")
+
+        conn = sqlite3.connect(db_path)
+        report(conn, 'after migration')
+        conn.close()
+
+
+if __name__ == '__main__':
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the advanced food detector
+Times each detection stage over the bundled static/images JPEGs
+
+Usage:
+    python bench_detector.py [repeat]   # per-stage timings
+    python bench_detector.py colors [max_drift]
+                                        # color engine speed and palette drift check; exits
+                                        # non-zero if an engine drifts from k-means by more
+                                        # than max_drift (default MAX_PALETTE_DRIFT)
+    python bench_detector.py decode     # full vs draft-mode decoding of a 12 MP JPEG
+    python bench_detector.py properties # memory of the basic-fallback color scan
+"""
+
+import glob
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from advanced_food_detector import AdvancedFoodDetector
+
+IMAGE_GLOB = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'images', '**', '*.jpg')
+
+# Largest allowed RGB distance between a k-means color and the nearest color
+# of a fast engine's palette (k-means itself moves by this much between runs)
+MAX_PALETTE_DRIFT = 30.0
+
+
+def load_images():
+    """Read the raw bytes of every bundled JPEG"""
+    images = []
+    for path in sorted(glob.glob(IMAGE_GLOB, recursive=True)):
+        with open(path, 'rb') as f:
+            images.append((os.path.basename(path), f.read()))
+    return images
+
+
+def time_call(fn, *args, repeat=1):
+    """Best-of-N wall time of fn(*args) in milliseconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def run_benchmark(repeat=1):
+    detector = AdvancedFoodDetector()
+    images = load_images()
+    if not images:
+        print("No images found under static/images")
+        return
+
+    columns = ('decode', 'colors', 'shapes', 'textures', 'total', 'decode*', 'analysis*')
+    totals = {}
+    print(f"{'image':<20} " + " ".join(f"{column:>9}" for column in columns))
+    for name, image_data in images:
+        image = detector._load_image(image_data)
+        cv_image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
+
+        row = {
+            'decode': time_call(detector._load_image, image_data, repeat=repeat),
+            'colors': time_call(detector._analyze_colors, image, repeat=repeat),
+            'shapes': time_call(detector._analyze_shapes, cv_image, repeat=repeat),
+            'textures': time_call(detector._analyze_textures, cv_image, repeat=repeat),
+            'total': time_call(detector.analyze_image_advanced, image_data, name, repeat=repeat),
+        }
+        # What the API reports: the stage times analyze_image_advanced records in one run
+        timings = {}
+        detector.analyze_image_advanced(image_data, name, timings)
+        row['decode*'] = timings['decode_ms']
+        row['analysis*'] = timings['analysis_ms']
+        for key, value in row.items():
+            totals[key] = totals.get(key, 0) + value
+        print(f"{name:<20} " + " ".join(f"{row[key]:>7.1f}ms" for key in columns))
+
+    print(f"{'mean':<20} " + " ".join(f"{totals[key] / len(images):>7.1f}ms" for key in columns))
+    print("* timings reported by analyze_image_advanced (the analyze-food response's timings)")
+
+
+def full_decode(image_data):
+    """The original loader: full decode, RGB convert, LANCZOS to a 512x512 square"""
+    image = Image.open(io.BytesIO(image_data))
+    image = image.convert('RGB')
+    decoded_pixels = image.size[0] * image.size[1]
+    return image.resize((512, 512), Image.Resampling.LANCZOS), decoded_pixels
+
+
+def draft_decode(detector, image_data):
+    """The detector's loader, reporting how many pixels the decoder produced"""
+    image = Image.open(io.BytesIO(image_data))
+    scale = 512 / max(image.size)
+    image.draft('RGB', (int(image.size[0] * scale), int(image.size[1] * scale)))
+    decoded_pixels = image.size[0] * image.size[1]
+    return detector._load_image(image_data), decoded_pixels
+
+
+def run_decode_benchmark(repeat=3):
+    """Compare full decoding with draft-mode decoding on a 12 MP phone-sized JPEG"""
+    detector = AdvancedFoodDetector()
+    name, image_data = load_images()[0]
+    photo = Image.open(io.BytesIO(image_data)).convert('RGB').resize((4000, 3000), Image.Resampling.BICUBIC)
+    buffer = io.BytesIO()
+    photo.save(buffer, 'JPEG', quality=90)
+    photo_data = buffer.getvalue()
+
+    full_ms = time_call(full_decode, photo_data, repeat=repeat)
+    draft_ms = time_call(draft_decode, detector, photo_data, repeat=repeat)
+    full_image, full_pixels = full_decode(photo_data)
+    draft_image, draft_pixels = draft_decode(detector, photo_data)
+
+    print(f"12 MP JPEG built from {name} ({len(photo_data) // 1024} KiB)")
+    print(f"full decode:  {full_ms:>7.1f}ms  decoded RGB buffer {full_pixels * 3 / 2**20:>6.1f} MiB  -> {full_image.size}")
+    print(f"draft decode: {draft_ms:>7.1f}ms  decoded RGB buffer {draft_pixels * 3 / 2**20:>6.1f} MiB  -> {draft_image.size}")
+
+
+def palette_drift(reference, palette):
+    """Largest distance from a reference color to its nearest palette color"""
+    reference = np.array(reference, dtype=np.float64)
+    palette = np.array(palette, dtype=np.float64)
+    distances = np.sqrt(np.sum((reference[:, None, :] - palette[None, :, :]) ** 2, axis=2))
+    return distances.min(axis=1).max()
+
+
+def run_color_engine_check(max_drift=MAX_PALETTE_DRIFT):
+    """
+    Compare every dominant color engine against full-resolution k-means
+    Returns the failures as (image, engine, problem); empty when every palette
+    is deterministic and within max_drift of the k-means colors
+    """
+    detector = AdvancedFoodDetector()
+    images = load_images()
+    engines = [name for name in detector.dominant_color_engines if name != 'kmeans']
+    if not images:
+        return [('static/images', '-', 'no images to check')]
+
+    # Seeded so the k-means reference, and with it the verdict, is the same every run
+    cv2.setRNGSeed(0)
+    failures = []
+    worst = 0.0
+    print(f"{'image':<20} {'kmeans':>9} " + " ".join(f"{name:>18}" for name in engines))
+    for name, image_data in images:
+        image = Image.open(io.BytesIO(image_data)).convert('RGB').resize((512, 512), Image.Resampling.LANCZOS)
+
+        start = time.perf_counter()
+        reference = detector._kmeans_dominant_colors(image)
+        kmeans_ms = (time.perf_counter() - start) * 1000
+
+        cells = []
+        for engine in engines:
+            start = time.perf_counter()
+            palette = detector.dominant_color_engines[engine](image)
+            elapsed = (time.perf_counter() - start) * 1000
+
+            # Engines other than k-means must be deterministic
+            if palette != detector.dominant_color_engines[engine](image):
+                failures.append((name, engine, 'palette differs between runs'))
+
+            drift = palette_drift(reference, palette)
+            worst = max(worst, drift)
+            if drift > max_drift:
+                failures.append((name, engine, f'drift {drift:.1f} over {max_drift}'))
+            cells.append(f"{elapsed:>7.1f}ms d={drift:>5.1f}")
+        print(f"{name:<20} {kmeans_ms:>7.1f}ms " + " ".join(cells))
+
+    print(f"worst palette drift: {worst:.1f} (limit {max_drift})")
+    return failures
+
+
+
+def legacy_image_properties(image_data):
+    """The original analyze_image_properties color scan (getcolors over every pixel)"""
+    image = Image.open(io.BytesIO(image_data)).convert('RGB')
+    colors = image.getcolors(maxcolors=256*256*256)
+    colors.sort(key=lambda x: x[0], reverse=True)
+    return colors[:5]
+
+
+def run_properties_benchmark():
+    """Peak Python heap and time of the basic-fallback color scan, before and after"""
+    from app import analyze_image_properties
+
+    for name, image_data in load_images()[:4]:
+        cells = []
+        for label, fn in (('getcolors', legacy_image_properties), ('histogram', analyze_image_properties)):
+            tracemalloc.start()
+            start = time.perf_counter()
+            fn(image_data)
+            elapsed = (time.perf_counter() - start) * 1000
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            cells.append(f"{label}: {elapsed:>7.1f}ms peak {peak / 2**20:>6.1f} MiB")
+        print(f"{name:<12} " + "   ".join(cells))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'colors':
+        failures = run_color_engine_check(float(sys.argv[2]) if len(sys.argv) > 2 else MAX_PALETTE_DRIFT)
+        if failures:
+            sys.exit("Color engine check failed:\n" + "\n".join(f"  {image} {engine}: {problem}" for image, engine, problem in failures))
+        sys.exit(0)
+    if len(sys.argv) > 1 and sys.argv[1] == 'properties':
+        run_properties_benchmark()
+        sys.exit(0)
+    if len(sys.argv) > 1 and sys.argv[1] == 'decode':
+        run_decode_benchmark()
+        sys.exit(0)
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 1)
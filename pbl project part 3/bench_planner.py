@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the merged diet chart planner
+Times full 5-meal days across goals, preferences and calorie targets and
+reports how many meals land within the calorie/macro tolerance; exits
+non-zero over the time budget or below MIN_HIT_RATE
+"""
+
+import itertools
+import sys
+import time
+
+from meal_planner import MEAL_PLANNER
+
+GOALS = ['Weight Loss', 'Weight Gain', 'Muscle Building', 'Maintenance', 'Athletic Performance']
+PREFERENCES = ['vegetarian', 'eggetarian', 'pescatarian', 'non_vegetarian', 'vegan']
+TARGETS = [1500, 2000, 2500, 3000]
+
+BUDGET_MS = 50.0
+
+# Share of planned meals that must be within the calorie and macro tolerance
+MIN_HIT_RATE = 0.95
+
+
+def run_benchmark(repeat=20):
+    cases = list(itertools.product(GOALS, PREFERENCES, TARGETS))
+    worst = 0.0
+    total = 0.0
+    meals_within = 0
+    meals_planned = 0
+    for goal, preference, target in cases:
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            meals, within_tolerance = MEAL_PLANNER.plan_day(goal, preference, target)
+            best = min(best, time.perf_counter() - start)
+        worst = max(worst, best)
+        total += best
+        meals_within += sum(within_tolerance)
+        meals_planned += len(within_tolerance)
+
+    print(f"{len(cases)} days planned (best of {repeat} each)")
+    print(f"mean {total / len(cases) * 1000:.2f}ms  worst {worst * 1000:.2f}ms  budget {BUDGET_MS:.0f}ms")
+    hit_rate = meals_within / meals_planned
+    print(f"meals within tolerance: {meals_within}/{meals_planned} ({hit_rate:.1%}, minimum {MIN_HIT_RATE:.0%})")
+
+    meals, within_tolerance = MEAL_PLANNER.plan_day('Weight Loss', 'vegetarian', 2000)
+    print("\nExample: Weight Loss, vegetarian, 2000 kcal")
+    for meal, within in zip(meals, within_tolerance):
+        print(f"{meal['name']:<12} {meal['calories']:>5} kcal  {meal['macros']:<24} {'ok  ' if within else 'miss'}  {meal['foods']}")
+
+    if worst * 1000 > BUDGET_MS:
+        sys.exit(f"Slowest day took {worst * 1000:.2f}ms, over the {BUDGET_MS:.0f}ms budget")
+    if hit_rate < MIN_HIT_RATE:
+        sys.exit(f"Only {hit_rate:.1%} of meals within tolerance, below the {MIN_HIT_RATE:.0%} minimum")
+
+
+if __name__ == '__main__':
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Load test for concurrent reads and writes on the app's SQLite database
+Reader processes run the cart lookup while writer processes commit cart inserts,
+once with the driver defaults (rollback journal) and once with the pool and
+pragmas from database.py, and reports read latency and lock errors
+"""
+
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from config import Config
+from database import engine_options, install_sqlite_pragmas, sqlite_pragmas
+
+READERS = 4
+WRITERS = 2
+NUM_USERS = 1000
+ROWS_PER_WRITE = 20
+WRITE_WORK_SECONDS = 0.005  # time a request spends between its writes and the commit
+STALL_SECONDS = 0.010
+
+
+def settings(db_path):
+    config = {key: getattr(Config, key) for key in dir(Config) if key.isupper()}
+    config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    config['DB_POOL_SIZE'] = READERS + WRITERS
+    return config
+
+
+def make_engine(db_path, tuned):
+    if not tuned:
+        return create_engine(f'sqlite:///{db_path}', pool_size=READERS + WRITERS,
+                             connect_args={'check_same_thread': False})
+    config = settings(db_path)
+    engine = create_engine(config['SQLALCHEMY_DATABASE_URI'], **engine_options(config))
+    install_sqlite_pragmas(engine, sqlite_pragmas(config))
+    return engine
+
+
+def seed(engine):
+    rng = random.Random(0)
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE cart (id INTEGER PRIMARY KEY, user_email VARCHAR(120) NOT NULL, product_id INTEGER NOT NULL, quantity INTEGER)'))
+        conn.execute(text('CREATE INDEX ix_cart_user_email_product_id ON cart (user_email, product_id)'))
+        conn.execute(text('INSERT INTO cart (user_email, product_id, quantity) VALUES (:email, :product_id, 1)'),
+                     [{'email': f'user{rng.randrange(NUM_USERS)}@example.com', 'product_id': rng.randrange(500)} for _ in range(100_000)])
+
+
+def reader(db_path, tuned, start_at, stop_at, seed_value, results):
+    engine = make_engine(db_path, tuned)
+    rng = random.Random(seed_value)
+    latencies = []
+    errors = 0
+    time.sleep(max(0.0, start_at - time.time()))
+    while time.time() < stop_at:
+        start = time.perf_counter()
+        try:
+            with engine.connect() as conn:
+                conn.execute(text('SELECT product_id, quantity FROM cart WHERE user_email = :email'),
+                             {'email': f'user{rng.randrange(NUM_USERS)}@example.com'}).fetchall()
+        except OperationalError:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - start)
+    results.put(('read', latencies, errors))
+
+
+def writer(db_path, tuned, start_at, stop_at, seed_value, results):
+    engine = make_engine(db_path, tuned)
+    rng = random.Random(seed_value)
+    writes = 0
+    errors = 0
+    time.sleep(max(0.0, start_at - time.time()))
+    while time.time() < stop_at:
+        try:
+            with engine.begin() as conn:
+                conn.execute(text('INSERT INTO cart (user_email, product_id, quantity) VALUES (:email, :product_id, 1)'),
+                             [{'email': f'user{rng.randrange(NUM_USERS)}@example.com', 'product_id': rng.randrange(500)}
+                              for _ in range(ROWS_PER_WRITE)])
+                time.sleep(WRITE_WORK_SECONDS)
+            writes += 1
+        except OperationalError:
+            errors += 1
+    results.put(('write', writes, errors))
+
+
+def run(db_path, tuned, seconds):
+    """Readers and writers as separate processes, like gunicorn workers"""
+    results = multiprocessing.Queue()
+    start_at = time.time() + 1.0
+    processes = [multiprocessing.Process(target=reader, args=(db_path, tuned, start_at, start_at + seconds, i, results))
+                 for i in range(READERS)]
+    processes += [multiprocessing.Process(target=writer, args=(db_path, tuned, start_at, start_at + seconds, 100 + i, results))
+                  for i in range(WRITERS)]
+    for process in processes:
+        process.start()
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    latencies = sorted(latency for kind, values, _ in outcomes if kind == 'read' for latency in values)
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else float('nan')
+    return {
+        'reads': len(latencies),
+        'writes': sum(values for kind, values, _ in outcomes if kind == 'write'),
+        'p50': percentile(0.5),
+        'p99': percentile(0.99),
+        'max': latencies[-1] * 1000 if latencies else float('nan'),
+        'stalls': sum(1 for latency in latencies if latency > STALL_SECONDS),
+        'errors': {kind: sum(errors for outcome_kind, _, errors in outcomes if outcome_kind == kind) for kind in ('read', 'write')}
+    }
+
+
+def run_benchmark(seconds=5.0):
+    print(f"{READERS} readers, {WRITERS} writers ({ROWS_PER_WRITE} rows per commit), {seconds:g}s each")
+    for label, tuned in (('driver defaults', False), ('database.py', True)):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, 'bench.db')
+            engine = make_engine(db_path, tuned)
+            seed(engine)
+            with engine.connect() as conn:
+                journal_mode = conn.execute(text('PRAGMA journal_mode')).scalar()
+            engine.dispose()
+            result = run(db_path, tuned, seconds)
+        print(f"{label:<16} journal={journal_mode:<7} reads {result['reads']:>7}  writes {result['writes']:>5}  "
+              f"read p50 {result['p50']:6.2f}ms  p99 {result['p99']:7.2f}ms  max {result['max']:8.2f}ms  "
+              f"stalls >{STALL_SECONDS * 1000:.0f}ms {result['stalls']:>5}  "
+              f"lock errors r={result['errors']['read']} w={result['errors']['write']}")
+
+
+if __name__ == '__main__':
+    run_benchmark(float(sys.argv[1]) if len(sys.argv) > 1 else 5.0)
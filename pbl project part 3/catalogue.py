@@ -0,0 +1,133 @@
+"""
+Cached product catalogue for /api/products
+Products are read once and each response variant (field selection, page) is
+serialised once, with its ETag, until a product write invalidates the cache.
+Writes made by another server process (or the import command) are noticed
+through the catalogue version they bump in the database: callers pass the
+current version to get(), and a cache built for another version is reloaded.
+ttl is a safety net for writes that bypass the version
+"""
+
+import bisect
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+PRODUCT_FIELDS = ('id', 'name', 'description', 'image', 'price')
+
+
+def parse_product_fields(fields_param):
+    """?fields= as a tuple of product fields, in catalogue order (ValueError on unknown fields)"""
+    if not fields_param:
+        return PRODUCT_FIELDS
+    requested = {part.strip() for part in fields_param.split(',') if part.strip()}
+    unknown = requested.difference(PRODUCT_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown field: {sorted(unknown)[0]}")
+    return tuple(field for field in PRODUCT_FIELDS if field in requested)
+
+
+def catalogue_page(products, fields, after_id=None, limit=None):
+    """
+    Response payload for a slice of the catalogue (products in id order)
+    Without a limit the whole catalogue is returned, as the shop page expects
+    """
+    start = bisect.bisect_right([product['id'] for product in products], after_id) if after_id is not None else 0
+    page = products[start:start + limit] if limit is not None else products[start:]
+    payload = {
+        'success': True,
+        'products': [{field: product[field] for field in fields} for product in page]
+    }
+    if limit is not None:
+        has_more = start + limit < len(products)
+        payload['has_more'] = has_more
+        payload['next_cursor'] = str(page[-1]['id']) if has_more else None
+    return payload
+
+
+class ProductCatalogue:
+    def __init__(self, ttl=60, max_variants=256):
+        self.ttl = ttl
+        self.max_variants = max_variants
+        self._products = None  # product dicts in id order
+        self._loaded_at = 0.0
+        self._version = None  # catalogue version the products were loaded at
+        self._variants = OrderedDict()  # key -> (body, etag)
+        self._generation = 0  # bumped by invalidate(), so a build racing a write is discarded
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.invalidations = 0
+
+    def _fresh(self, now, version):
+        return (self._products is not None and (self.ttl is None or now - self._loaded_at <= self.ttl)
+                and (version is None or version == self._version))
+
+    def get(self, key, load, render, version=None):
+        """
+        (body, etag) for a response variant
+        load() returns the product dicts in id order; render(products) the body bytes.
+        version is the catalogue version read just before the call (None: ttl only)
+        """
+        with self._lock:
+            if self._fresh(time.monotonic(), version) and key in self._variants:
+                self._variants.move_to_end(key)
+                self.hits += 1
+                return self._variants[key]
+
+        # One build at a time, so a burst of misses reads the table once
+        with self._build_lock:
+            with self._lock:
+                now = time.monotonic()
+                if self._fresh(now, version) and key in self._variants:
+                    self.hits += 1
+                    return self._variants[key]
+                self.misses += 1
+                generation = self._generation
+                products = self._products if self._fresh(now, version) else None
+                loaded_at = self._loaded_at
+
+            if products is None:
+                products = load()
+                loaded_at = time.monotonic()
+            body = render(products)
+            entry = (body, hashlib.sha256(body).hexdigest()[:32])
+
+            with self._lock:
+                if generation == self._generation:
+                    if self._products is not products:
+                        self.loads += 1
+                        self._products = products
+                        self._loaded_at = loaded_at
+                        self._version = version
+                        self._variants.clear()
+                    self._variants[key] = entry
+                    while len(self._variants) > self.max_variants:
+                        self._variants.popitem(last=False)
+            return entry
+
+    def invalidate(self):
+        """Drop everything (call after a product write is committed)"""
+        with self._lock:
+            self._generation += 1
+            self._products = None
+            self._variants.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'products': len(self._products) if self._products is not None else None,
+                'version': self._version,
+                'variants': len(self._variants),
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'loads': self.loads,
+                'invalidations': self.invalidations,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+            }
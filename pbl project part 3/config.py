@@ -0,0 +1,90 @@
+"""
+Configuration profiles for the Flask app
+create_app() picks a profile by name, defaulting to the APP_CONFIG environment
+variable; individual settings can still be overridden through the environment
+"""
+
+import os
+
+DEFAULT_SECRET_KEY = 'your-secret-key-here'
+
+# Relative SQLite paths are resolved against the app's instance folder
+DEFAULT_DATABASE_URL = 'sqlite:///workoutvibes.db'
+
+
+def normalize_database_url(url):
+    """Accept postgres:// and postgresql:// URLs and use the psycopg (v3) driver for them"""
+    for prefix in ('postgres://', 'postgresql://'):
+        if url.startswith(prefix):
+            return 'postgresql+psycopg://' + url[len(prefix):]
+    return url
+
+
+class Config:
+    DEBUG = False
+    TESTING = False
+    SECRET_KEY = os.getenv('SECRET_KEY', DEFAULT_SECRET_KEY)
+    # Any SQLAlchemy URL; SQLite and PostgreSQL are supported
+    SQLALCHEMY_DATABASE_URI = normalize_database_url(os.getenv('DATABASE_URL', DEFAULT_DATABASE_URL))
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Connection pool per process; see database.py for the SQLite pragmas
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))  # server databases only
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 10))
+    DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', 10))
+    SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    SQLITE_CACHE_SIZE_KB = int(os.getenv('SQLITE_CACHE_SIZE_KB', 16 * 1024))
+    SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+    FOOD_ANALYSIS_WORKERS = int(os.getenv('FOOD_ANALYSIS_WORKERS', os.cpu_count() or 1))
+    FOOD_ANALYSIS_MAX_BATCH = int(os.getenv('FOOD_ANALYSIS_MAX_BATCH', 20))
+    ANALYSIS_CACHE_SIZE = int(os.getenv('ANALYSIS_CACHE_SIZE', 1024))
+    ANALYSIS_CACHE_TTL = int(os.getenv('ANALYSIS_CACHE_TTL', 24 * 3600))
+    ANALYSIS_CACHE_PATH = os.getenv('ANALYSIS_CACHE_PATH')  # optional SQLite file for a disk tier
+    ANALYSIS_CACHE_DISK_SIZE = int(os.getenv('ANALYSIS_CACHE_DISK_SIZE', 100_000))  # rows kept in the disk tier
+    AUTH_TOKEN_MAX_AGE = int(os.getenv('AUTH_TOKEN_MAX_AGE', 7 * 24 * 3600))
+    AUTH_CACHE_TTL = int(os.getenv('AUTH_CACHE_TTL', 300))
+    # /api/db/stats and the cache-stats routes; they reveal row counts, pool and cache internals
+    EXPOSE_STATS = os.getenv('EXPOSE_STATS', '1') == '1'
+    HISTORY_PAGE_SIZE = int(os.getenv('HISTORY_PAGE_SIZE', 20))
+    HISTORY_MAX_PAGE_SIZE = int(os.getenv('HISTORY_MAX_PAGE_SIZE', 100))
+    DIET_CHART_PAGE_SIZE = int(os.getenv('DIET_CHART_PAGE_SIZE', 24))
+    DIET_CHART_MAX_PAGE_SIZE = int(os.getenv('DIET_CHART_MAX_PAGE_SIZE', 100))
+    PRODUCT_CACHE_TTL = int(os.getenv('PRODUCT_CACHE_TTL', 60))  # safety net; other processes' writes are seen via catalogue_version
+    PRODUCT_CACHE_MAX_AGE = int(os.getenv('PRODUCT_CACHE_MAX_AGE', 60))  # Cache-Control for browsers and proxies
+    PRODUCT_PAGE_SIZE = int(os.getenv('PRODUCT_PAGE_SIZE', 50))
+    PRODUCT_MAX_PAGE_SIZE = int(os.getenv('PRODUCT_MAX_PAGE_SIZE', 200))
+    JOB_PER_USER_RUNNING = int(os.getenv('JOB_PER_USER_RUNNING', 1))
+    JOB_PER_USER_PENDING = int(os.getenv('JOB_PER_USER_PENDING', 10))
+    JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 3))
+    JOB_LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', 300))
+    # An event stream holds a whole sync worker, so keep it well under gunicorn's 60s timeout
+    JOB_EVENTS_TIMEOUT = int(os.getenv('JOB_EVENTS_TIMEOUT', 20))
+    JOB_WORKER_THREADS = int(os.getenv('JOB_WORKER_THREADS', 0))  # in-process workers for `python app.py`
+
+
+class DevelopmentConfig(Config):
+    DEBUG = True
+
+
+class ProductionConfig(Config):
+    # Behind gunicorn (see gunicorn.conf.py); the debugger and reloader are never enabled
+    SESSION_COOKIE_SECURE = os.getenv('SESSION_COOKIE_SECURE', '1') == '1'
+    SESSION_COOKIE_HTTPONLY = True
+    EXPOSE_STATS = os.getenv('EXPOSE_STATS', '0') == '1'
+    # gunicorn sync workers serve one request at a time, so each needs only a couple of connections
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 2))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 2))
+
+
+class TestingConfig(Config):
+    TESTING = True
+    # In-memory SQLite stands in for the server database unless TEST_DATABASE_URL points at one
+    SQLALCHEMY_DATABASE_URI = normalize_database_url(os.getenv('TEST_DATABASE_URL', 'sqlite://'))
+
+
+CONFIG_PROFILES = {
+    'development': DevelopmentConfig,
+    'production': ProductionConfig,
+    'testing': TestingConfig
+}
@@ -0,0 +1,140 @@
+"""
+Database engine setup for the Flask app
+The app runs on any SQLAlchemy URL; SQLite and PostgreSQL are supported.
+Every SQLite connection is opened in WAL mode with a busy timeout, so readers
+don't wait behind a writer and concurrent writers queue instead of failing with
+"database is locked". The connection pool is sized from the configuration to
+match the server's worker model
+"""
+
+import os
+import time
+
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+
+db = SQLAlchemy()
+
+# Pragmas reported by database_stats()
+REPORTED_PRAGMAS = ('journal_mode', 'synchronous', 'busy_timeout', 'cache_size', 'mmap_size', 'foreign_keys')
+
+SYNCHRONOUS_LEVELS = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+
+def is_sqlite_file(uri):
+    """True for an on-disk SQLite URL (not sqlite:// or :memory:)"""
+    url = make_url(uri)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+
+def engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured database"""
+    options = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() == 'sqlite':
+        if not is_sqlite_file(url):
+            return options
+        connect_args = dict(options.get('connect_args') or {})
+        # The driver's own lock wait, in seconds, matching the busy_timeout pragma
+        connect_args.setdefault('timeout', config['SQLITE_BUSY_TIMEOUT_MS'] / 1000)
+        # Pooled connections are handed between threads (dev server, job worker threads)
+        connect_args.setdefault('check_same_thread', False)
+        options['connect_args'] = connect_args
+    else:
+        # Server connections can be dropped by the server or a proxy while idle
+        options.setdefault('pool_pre_ping', True)
+        options.setdefault('pool_recycle', config['DB_POOL_RECYCLE'])
+
+    options.setdefault('pool_size', config['DB_POOL_SIZE'])
+    options.setdefault('max_overflow', config['DB_MAX_OVERFLOW'])
+    options.setdefault('pool_timeout', config['DB_POOL_TIMEOUT'])
+    return options
+
+
+def sqlite_pragmas(config):
+    """(pragma, value) pairs applied to every new SQLite connection"""
+    synchronous = config['SQLITE_SYNCHRONOUS'].upper()
+    if synchronous not in SYNCHRONOUS_LEVELS:
+        raise ValueError(f"SQLITE_SYNCHRONOUS must be one of {', '.join(SYNCHRONOUS_LEVELS)}")
+    return (
+        ('journal_mode', 'WAL'),
+        # NORMAL is durable in WAL mode except for the last commits before a power loss
+        ('synchronous', synchronous),
+        ('busy_timeout', config['SQLITE_BUSY_TIMEOUT_MS']),
+        ('cache_size', -config['SQLITE_CACHE_SIZE_KB']),  # negative means KiB rather than pages
+        ('mmap_size', config['SQLITE_MMAP_SIZE']),
+        ('temp_store', 'MEMORY'),
+        # SQLite only enforces foreign keys when each connection asks for it
+        ('foreign_keys', 'ON'),
+    )
+
+
+def init_database(app):
+    """Bind db to the app, with pragmas and pool settings for SQLite files"""
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+    db.init_app(app)
+
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    if is_sqlite_file(uri):
+        with app.app_context():
+            install_sqlite_pragmas(db.engine, sqlite_pragmas(app.config))
+    elif make_url(uri).get_backend_name() == 'sqlite':
+        # In-memory databases still get foreign key enforcement
+        with app.app_context():
+            install_sqlite_pragmas(db.engine, (('foreign_keys', 'ON'),))
+
+
+def install_sqlite_pragmas(engine, pragmas):
+    """Run the pragmas on every connection the engine opens"""
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas:
+                cursor.execute(f'PRAGMA {name}={value}')
+        finally:
+            cursor.close()
+
+    event.listen(engine, 'connect', set_sqlite_pragmas)
+
+
+def database_health():
+    """Round-trip a trivial query; returns (ok, details)"""
+    start = time.perf_counter()
+    try:
+        db.session.execute(text('SELECT 1')).scalar()
+    except Exception as e:
+        db.session.rollback()
+        return False, {'error': str(e)}
+    return True, {'latency_ms': round((time.perf_counter() - start) * 1000, 3)}
+
+
+def database_stats():
+    """Pool usage, the connection's pragmas and, for SQLite, the database and WAL file sizes"""
+    engine = db.engine
+    pool = engine.pool
+    stats = {
+        'dialect': engine.dialect.name,
+        'pool': {
+            'class': type(pool).__name__,
+            'status': pool.status()
+        }
+    }
+    for attribute in ('size', 'checkedin', 'checkedout', 'overflow'):
+        if hasattr(pool, attribute):
+            stats['pool'][attribute] = getattr(pool, attribute)()
+
+    if engine.dialect.name == 'postgresql':
+        stats['database_bytes'] = db.session.execute(text('SELECT pg_database_size(current_database())')).scalar()
+    elif engine.dialect.name == 'sqlite':
+        connection = db.session.connection()
+        stats['pragmas'] = {
+            name: connection.execute(text(f'PRAGMA {name}')).scalar() for name in REPORTED_PRAGMAS
+        }
+        database_path = engine.url.database
+        if database_path and database_path != ':memory:':
+            stats['files'] = {
+                label: os.path.getsize(path) if os.path.exists(path) else 0
+                for label, path in (('database_bytes', database_path), ('wal_bytes', database_path + '-wal'))
+            }
+    return stats
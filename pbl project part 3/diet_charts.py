@@ -0,0 +1,167 @@
+"""
+Normalisation helpers for saved diet charts
+Splits a client chart document into meal rows (numeric calories and macros)
+plus the remaining chart-level fields, and puts the document back together.
+Meal values that don't fit their column (unknown keys, non-numeric calories,
+foods that aren't strings) are kept as they were sent in the meal's extras,
+so documents round-trip unchanged (a meal sent without a name comes back
+with an empty one)
+"""
+
+import re
+
+MACROS_PATTERN = re.compile(r'P:\s*([\d.]+)g,\s*C:\s*([\d.]+)g,\s*F:\s*([\d.]+)g')
+
+# Separator the meal generators use between food options
+FOOD_SEPARATOR = ', '
+
+# Meal keys with their own columns; anything else goes to the meal's extras
+MEAL_KEYS = ('time', 'name', 'calories', 'foods', 'macros')
+
+
+def parse_macros(macros):
+    """(protein, carbs, fats) grams from 'P: 23g, C: 47g, F: 10g', or Nones"""
+    match = MACROS_PATTERN.search(macros) if isinstance(macros, str) else None
+    if not match:
+        return None, None, None
+    return tuple(float(value) for value in match.groups())
+
+
+def to_calories(value):
+    """Whole calories from an int, float or numeric string, else None"""
+    if isinstance(value, bool):
+        return None
+    try:
+        return int(round(float(value)))
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+def _meal_row(meal):
+    extras = {key: value for key, value in meal.items() if key not in MEAL_KEYS}
+
+    # Columns get the value when it has the column's type; otherwise the original is kept in extras
+    name = meal.get('name', '')
+    if not isinstance(name, str):
+        extras['name'] = name
+    text = {}
+    for key in ('time', 'macros'):
+        value = meal.get(key)
+        text[key] = value if isinstance(value, str) else None
+        if key in meal and text[key] is None:
+            extras[key] = value
+    calories = meal.get('calories')
+    if 'calories' in meal and not (isinstance(calories, int) and not isinstance(calories, bool)):
+        extras['calories'] = calories
+
+    foods = meal.get('foods')
+    foods_listed = False
+    if isinstance(foods, list) and foods and all(isinstance(food, str) for food in foods):
+        food_names, foods_listed = list(foods), True
+    elif isinstance(foods, str) and foods:
+        food_names = foods.split(FOOD_SEPARATOR)
+    else:
+        food_names = []
+        if 'foods' in meal:
+            extras['foods'] = foods
+
+    protein, carbs, fats = parse_macros(text['macros'])
+    return {
+        'name': str(name),
+        'time': text['time'],
+        'calories': to_calories(calories),
+        'macros': text['macros'],
+        'protein': protein,
+        'carbs': carbs,
+        'fats': fats,
+        'foods': food_names,
+        'foods_listed': foods_listed,
+        'extras': extras
+    }
+
+
+def split_chart_data(chart_data):
+    """
+    Split a chart document into (meals, extras)
+    meals is a list of meal rows; extras is the document with the meal list
+    emptied in place, so assemble_chart_data can restore the original shape.
+    Handles the three shapes clients have saved:
+      {'meals': [meal, ...]}                     merged charts
+      {'meals': {'meals': [meal, ...], ...}}     diet-chart page
+      {'meals': {'breakfast': [food, ...], ...}} early charts
+    Anything else is kept whole in extras
+    """
+    if not isinstance(chart_data, dict):
+        return [], chart_data
+    extras = dict(chart_data)
+    meals_field = extras.get('meals')
+
+    if isinstance(meals_field, list) and all(isinstance(meal, dict) for meal in meals_field):
+        extras['meals'] = []
+        meals = [_meal_row(meal) for meal in meals_field]
+    elif (isinstance(meals_field, dict) and isinstance(meals_field.get('meals'), list)
+          and all(isinstance(meal, dict) for meal in meals_field['meals'])):
+        extras['meals'] = dict(meals_field, meals=[])
+        meals = [_meal_row(meal) for meal in meals_field['meals']]
+    elif isinstance(meals_field, dict) and 'meals' not in meals_field:
+        extras['meals'] = {}
+        meals = [_meal_row({'name': name, 'foods': foods}) for name, foods in meals_field.items()]
+    else:
+        meals = []
+    return meals, extras
+
+
+def _meal_document(meal, listed_by_default=False):
+    document = {}
+    if meal['time'] is not None:
+        document['time'] = meal['time']
+    document['name'] = meal['name']
+    if meal['calories'] is not None:
+        document['calories'] = meal['calories']
+    if meal['foods']:
+        # Rows saved before foods_listed existed (None) used the shape's usual form
+        listed = meal['foods_listed'] if meal['foods_listed'] is not None else listed_by_default
+        document['foods'] = list(meal['foods']) if listed else FOOD_SEPARATOR.join(meal['foods'])
+    if meal['macros'] is not None:
+        document['macros'] = meal['macros']
+    document.update(meal['extras'] or {})
+    return document
+
+
+def assemble_chart_data(extras, meals):
+    """Inverse of split_chart_data"""
+    if not isinstance(extras, dict):
+        return extras
+    chart_data = dict(extras)
+    meals_field = chart_data.get('meals')
+
+    # Only the emptied placeholders split_chart_data leaves are filled; anything else was kept whole
+    if meals_field == []:
+        chart_data['meals'] = [_meal_document(meal) for meal in meals]
+    elif isinstance(meals_field, dict) and meals_field.get('meals') == []:
+        chart_data['meals'] = dict(meals_field, meals=[_meal_document(meal) for meal in meals])
+    elif meals_field == {}:
+        chart_data['meals'] = {meal['name']: _meal_document(meal, listed_by_default=True).get('foods') for meal in meals}
+    return chart_data
+
+
+def chart_total_calories(chart_data, meals):
+    """Daily calories of a chart: the document's own total, else the sum of its meals (None if neither is numeric)"""
+    total = None
+    if isinstance(chart_data, dict):
+        total = to_calories(chart_data.get('totalCalories'))
+        meals_field = chart_data.get('meals')
+        if total is None and isinstance(meals_field, dict):
+            total = to_calories(meals_field.get('totalCalories'))
+    if total is None:
+        calories = [meal['calories'] for meal in meals if meal['calories'] is not None]
+        total = sum(calories) if calories else None
+    return total
+
+
+def chart_dietary_preference(user_data):
+    """Dietary preference from a saved user profile (None if the profile isn't an object)"""
+    if not isinstance(user_data, dict):
+        return None
+    preference = user_data.get('dietaryPreference') or user_data.get('dietaryPreferences') or 'vegetarian'
+    return preference[:50] if isinstance(preference, str) else None
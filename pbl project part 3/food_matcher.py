@@ -0,0 +1,100 @@
+"""
+Compiled filename-hint matching for food detection
+Builds one Aho-Corasick automaton over every food name and keyword so a
+filename is scored in a single pass, however large the catalogue gets
+"""
+
+from collections import deque
+
+
+class AhoCorasick:
+    def __init__(self, terms):
+        self.terms = list(dict.fromkeys(terms))
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+
+        # Trie of every term
+        for term_id, term in enumerate(self.terms):
+            state = 0
+            for char in term:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                state = next_state
+            self._output[state].append(term_id)
+
+        # Failure links, breadth first
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def find_all(self, text):
+        """Set of every term that occurs anywhere in text (overlaps included)"""
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for term_id in self._output[state]:
+                found.add(self.terms[term_id])
+        return found
+
+
+class FoodFilenameMatcher:
+    def __init__(self, food_keywords):
+        """food_keywords maps each food name to its visual keywords (may be empty)"""
+        self.food_names = list(food_keywords.keys())
+        self._rank = {food_name: index for index, food_name in enumerate(self.food_names)}
+
+        # term -> foods it names exactly ('butter chicken' / 'butter_chicken')
+        self._spaced_names = {}
+        self._raw_names = {}
+        # term -> foods that list it as a keyword
+        self._keywords = {}
+        for food_name, keywords in food_keywords.items():
+            self._spaced_names.setdefault(food_name.replace('_', ' '), []).append(food_name)
+            self._raw_names.setdefault(food_name, []).append(food_name)
+            for keyword in keywords:
+                self._keywords.setdefault(keyword, []).append(food_name)
+
+        self._automaton = AhoCorasick(
+            list(self._spaced_names) + list(self._raw_names) + list(self._keywords)
+        )
+
+    def match(self, filename):
+        """
+        Scan a filename once and return (name_hits, keyword_hits)
+        name_hits maps foods named in the filename to 1.0 (spaced name) or
+        0.9 (underscore name); keyword_hits maps foods to their keyword hit count
+        """
+        found = self._automaton.find_all((filename or '').lower())
+
+        name_hits = {}
+        keyword_hits = {}
+        for term in found:
+            for food_name in self._spaced_names.get(term, ()):
+                name_hits[food_name] = 1.0
+            for food_name in self._raw_names.get(term, ()):
+                name_hits.setdefault(food_name, 0.9)
+            for food_name in self._keywords.get(term, ()):
+                keyword_hits[food_name] = keyword_hits.get(food_name, 0) + 1
+        return name_hits, keyword_hits
+
+    def matching_foods(self, filename, candidates=None):
+        """Foods named in the filename, in catalogue order (optionally limited to candidates)"""
+        name_hits, _ = self.match(filename)
+        foods = [food_name for food_name in name_hits if candidates is None or food_name in candidates]
+        return sorted(foods, key=self._rank.get)
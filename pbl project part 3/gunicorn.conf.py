@@ -0,0 +1,100 @@
+"""
+gunicorn settings for the production server: gunicorn -c gunicorn.conf.py wsgi:app
+
+Worker model: food detection is CPU-bound Python/numpy work, so threads in one
+process would serialise on the GIL. We prefork one sync worker per core instead
+and preload the app in the master, so the detector, nutrition tables and meal
+planner are built once and shared copy-on-write by every worker. Each worker
+also gets a small share of the cores for its batch-detection process pool, so
+workers x pool processes does not oversubscribe the machine.
+
+Merges and single-image analyses submitted as jobs run in job_worker.py, not
+in the web workers. The master starts it (JOB_WORKER_PROCESSES worker
+processes, default 1), restarts it if it exits, and stops it on shutdown. Set
+JOB_WORKER_PROCESSES=0 when job_worker.py is run as its own service instead;
+without a job worker, submitted jobs are never run.
+"""
+
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import threading
+
+cores = multiprocessing.cpu_count()
+
+bind = os.getenv('BIND', '0.0.0.0:3000')
+workers = int(os.getenv('WEB_CONCURRENCY', cores))
+worker_class = 'sync'
+threads = 1
+preload_app = True
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers now and then to bound memory growth from image decoding
+max_requests = 1000
+max_requests_jitter = 100
+accesslog = '-'
+
+# Split the cores between the web workers' batch-detection pools
+os.environ.setdefault('APP_CONFIG', 'production')
+os.environ.setdefault('FOOD_ANALYSIS_WORKERS', str(max(1, cores // workers)))
+
+
+def post_fork(server, worker):
+    # Connections opened in the master (while preloading) must not be shared across processes
+    from wsgi import app
+    from app import db
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+
+JOB_WORKER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'job_worker.py')
+JOB_WORKER_RESTART_DELAY = 5
+
+
+def when_ready(server):
+    processes = int(os.getenv('JOB_WORKER_PROCESSES', 1))
+    if processes <= 0:
+        server.log.info("JOB_WORKER_PROCESSES=0: run job_worker.py separately or jobs stay queued")
+        return
+    server.job_worker_stop = threading.Event()
+    threading.Thread(target=supervise_job_worker, args=(server, processes), daemon=True).start()
+
+
+def supervise_job_worker(server, processes):
+    """Run job_worker.py in its own process group, restarting it until the master exits"""
+    while not server.job_worker_stop.is_set():
+        server.job_worker = subprocess.Popen(
+            [sys.executable, JOB_WORKER_PATH, str(processes)],
+            cwd=os.path.dirname(JOB_WORKER_PATH), start_new_session=True
+        )
+        server.log.info("Started job worker (pid %s, %s processes)", server.job_worker.pid, processes)
+        code = server.job_worker.wait()
+        stop_process_group(server.job_worker.pid, signal.SIGTERM)  # its children, if it died first
+        if not server.job_worker_stop.is_set():
+            server.log.error("Job worker exited with %s; restarting in %ss", code, JOB_WORKER_RESTART_DELAY)
+            server.job_worker_stop.wait(JOB_WORKER_RESTART_DELAY)
+
+
+def stop_process_group(pid, sig):
+    try:
+        os.killpg(pid, sig)
+    except ProcessLookupError:
+        pass
+
+
+def on_exit(server):
+    stop = getattr(server, 'job_worker_stop', None)
+    if stop is None:
+        return
+    stop.set()
+    job_worker = getattr(server, 'job_worker', None)
+    if job_worker is not None and job_worker.poll() is None:
+        # The whole group, so job_worker.py's child processes stop too
+        stop_process_group(job_worker.pid, signal.SIGTERM)
+        try:
+            job_worker.wait(graceful_timeout)
+        except subprocess.TimeoutExpired:
+            stop_process_group(job_worker.pid, signal.SIGKILL)
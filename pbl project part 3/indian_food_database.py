@@ -1,6 +1,9 @@
 # Comprehensive Indian Food Database
 # Contains 600+ Indian food items with nutritional information
 
+from bisect import bisect_left
+from functools import lru_cache
+
 INDIAN_FOOD_DATABASE = {
     # Rice Dishes
     'biryani': {
@@ -181,6 +184,28 @@ EXTENDED_INDIAN_FOODS = {
     'litti_chokha': {'calories': 285, 'protein': 9.8, 'carbs': 48, 'fats': 7.2, 'fiber': 6.8, 'sugar': 5.2, 'keywords': ['litti', 'chokha', 'bihari'], 'description': 'Bihari stuffed wheat balls with mashed vegetables'},
     'momo': {'calories': 185, 'protein': 8.2, 'carbs': 25, 'fats': 6.8, 'fiber': 2.8, 'sugar': 3.2, 'keywords': ['momo', 'dumpling', 'tibetan'], 'description': 'Tibetan steamed dumplings'},
     
+    # High-Protein Dishes
+    'paneer_tikka': {'calories': 265, 'protein': 18.5, 'carbs': 6.2, 'fats': 18.8, 'fiber': 1.2, 'sugar': 3.2, 'keywords': ['paneer', 'tikka', 'grilled', 'tandoori'], 'description': 'Grilled marinated cottage cheese cubes'},
+    'paneer_bhurji': {'calories': 250, 'protein': 16.5, 'carbs': 7.2, 'fats': 17.5, 'fiber': 1.5, 'sugar': 3.5, 'keywords': ['paneer', 'bhurji', 'scrambled'], 'description': 'Scrambled cottage cheese with onion and tomato'},
+    'hung_curd': {'calories': 100, 'protein': 10.2, 'carbs': 4.2, 'fats': 4.8, 'fiber': 0, 'sugar': 4.0, 'keywords': ['hung', 'curd', 'dahi', 'yogurt'], 'description': 'Thick strained yogurt'},
+    'soya_chunk_curry': {'calories': 180, 'protein': 17.5, 'carbs': 14, 'fats': 6.2, 'fiber': 5.2, 'sugar': 3.8, 'keywords': ['soya', 'chunks', 'nutrela', 'curry'], 'description': 'Soya chunks in spiced onion-tomato gravy'},
+    'tofu_bhurji': {'calories': 150, 'protein': 13.2, 'carbs': 5.2, 'fats': 9.0, 'fiber': 1.8, 'sugar': 2.2, 'keywords': ['tofu', 'bhurji', 'scrambled'], 'description': 'Scrambled tofu with onion and spices'},
+    'tofu_tikka': {'calories': 150, 'protein': 15, 'carbs': 4.0, 'fats': 8.5, 'fiber': 1.2, 'sugar': 1.5, 'keywords': ['tofu', 'tikka', 'grilled'], 'description': 'Grilled spiced tofu cubes'},
+    'soya_chaat': {'calories': 160, 'protein': 18, 'carbs': 14, 'fats': 3.5, 'fiber': 5.5, 'sugar': 2.5, 'keywords': ['soya', 'chunks', 'chaat'], 'description': 'Boiled soya chunks tossed with onion, tomato and lemon'},
+    'moong_sprouts_chaat': {'calories': 110, 'protein': 7.6, 'carbs': 17, 'fats': 1.2, 'fiber': 4.5, 'sugar': 2.8, 'keywords': ['moong', 'sprouts', 'chaat', 'salad'], 'description': 'Sprouted green gram salad with lemon and spices'},
+    'moong_dal_chilla': {'calories': 165, 'protein': 10.5, 'carbs': 22, 'fats': 4.0, 'fiber': 3.8, 'sugar': 1.5, 'keywords': ['moong', 'chilla', 'cheela', 'pancake'], 'description': 'Savory split green gram pancake'},
+    'besan_chilla': {'calories': 180, 'protein': 9.8, 'carbs': 22, 'fats': 6.0, 'fiber': 4.2, 'sugar': 2.2, 'keywords': ['besan', 'chilla', 'cheela', 'gram'], 'description': 'Savory gram flour pancake'},
+    'sattu_sharbat': {'calories': 120, 'protein': 7.5, 'carbs': 19, 'fats': 1.8, 'fiber': 3.5, 'sugar': 2.5, 'keywords': ['sattu', 'sharbat', 'drink', 'bihari'], 'description': 'Roasted gram flour drink with lemon'},
+    'roasted_chana': {'calories': 364, 'protein': 22, 'carbs': 58, 'fats': 5.2, 'fiber': 17, 'sugar': 10.5, 'keywords': ['roasted', 'chana', 'chickpeas', 'snack'], 'description': 'Dry-roasted chickpeas'},
+    'boiled_eggs': {'calories': 155, 'protein': 12.6, 'carbs': 1.1, 'fats': 10.6, 'fiber': 0, 'sugar': 1.1, 'keywords': ['boiled', 'egg', 'eggs'], 'description': 'Hard-boiled eggs'},
+    'egg_bhurji': {'calories': 185, 'protein': 12.5, 'carbs': 3.5, 'fats': 13.5, 'fiber': 0.8, 'sugar': 1.8, 'keywords': ['egg', 'bhurji', 'scrambled'], 'description': 'Indian-style scrambled eggs'},
+    'egg_curry': {'calories': 175, 'protein': 10.5, 'carbs': 6.5, 'fats': 12.0, 'fiber': 1.5, 'sugar': 3.2, 'keywords': ['egg', 'curry', 'anda'], 'description': 'Boiled eggs in onion-tomato gravy'},
+    'tandoori_chicken': {'calories': 195, 'protein': 27, 'carbs': 4.0, 'fats': 8.0, 'fiber': 0.8, 'sugar': 1.5, 'keywords': ['tandoori', 'chicken', 'grilled'], 'description': 'Yogurt-marinated chicken roasted in a tandoor'},
+    'chicken_tikka': {'calories': 165, 'protein': 25, 'carbs': 3.5, 'fats': 5.5, 'fiber': 0.5, 'sugar': 1.2, 'keywords': ['chicken', 'tikka', 'grilled'], 'description': 'Grilled boneless chicken pieces'},
+    'chicken_curry': {'calories': 210, 'protein': 19.5, 'carbs': 6.0, 'fats': 12.0, 'fiber': 1.2, 'sugar': 2.8, 'keywords': ['chicken', 'curry'], 'description': 'Home-style chicken curry'},
+    'fish_curry': {'calories': 165, 'protein': 19, 'carbs': 5.0, 'fats': 7.5, 'fiber': 1.0, 'sugar': 2.0, 'keywords': ['fish', 'curry', 'machli'], 'description': 'Fish simmered in tangy spiced gravy'},
+    'fish_tikka': {'calories': 140, 'protein': 24, 'carbs': 2.0, 'fats': 4.5, 'fiber': 0.3, 'sugar': 0.8, 'keywords': ['fish', 'tikka', 'grilled'], 'description': 'Grilled marinated fish pieces'},
+    
     # Beverages & Drinks (40+ varieties)
     'lassi': {'calories': 125, 'protein': 4.8, 'carbs': 18, 'fats': 3.8, 'fiber': 0.2, 'sugar': 16.5, 'keywords': ['lassi', 'yogurt', 'drink'], 'description': 'Yogurt-based refreshing drink'},
     'chaas': {'calories': 65, 'protein': 3.2, 'carbs': 8, 'fats': 1.8, 'fiber': 0.1, 'sugar': 7.2, 'keywords': ['chaas', 'buttermilk'], 'description': 'Spiced buttermilk'},
@@ -199,17 +224,70 @@ def get_food_info(food_name):
     """Get nutritional information for a specific food item"""
     return INDIAN_FOOD_DATABASE.get(food_name.lower().replace(' ', '_'))
 
-def search_food_by_keywords(keywords):
-    """Search for food items based on keywords"""
-    matches = []
-    for food_name, food_data in INDIAN_FOOD_DATABASE.items():
-        if 'keywords' in food_data:
-            for keyword in keywords:
-                if any(keyword.lower() in kw.lower() for kw in food_data['keywords']):
-                    matches.append((food_name, food_data))
-                    break
-    return matches
+# Keyword search index, built once at import:
+#   _keyword_foods: lowercase keyword -> indices of the foods that list it
+#   _suffixes: every suffix of every keyword, sorted, so the suffixes that
+#   start with a substring query are one contiguous range, found by two bisects
+_food_names = []
+_keyword_foods = {}
+_suffixes = []
+_suffix_keywords = []
+
+def build_keyword_index():
+    """(Re)build the keyword search index from INDIAN_FOOD_DATABASE"""
+    global _food_names, _keyword_foods, _suffixes, _suffix_keywords
+    food_names = []
+    keyword_foods = {}
+    for index, (food_name, food_data) in enumerate(INDIAN_FOOD_DATABASE.items()):
+        food_names.append(food_name)
+        for keyword in food_data.get('keywords', []):
+            keyword_foods.setdefault(keyword.lower(), set()).add(index)
+    
+    suffix_entries = sorted(
+        (keyword[start:], keyword) for keyword in keyword_foods for start in range(len(keyword))
+    )
+    _food_names = food_names
+    _keyword_foods = keyword_foods
+    _suffixes = [suffix for suffix, _ in suffix_entries]
+    _suffix_keywords = [keyword for _, keyword in suffix_entries]
+    _foods_matching.cache_clear()
+
+@lru_cache(maxsize=4096)
+def _foods_matching(keyword):
+    """
+    Indices of foods with a keyword that contains the query keyword
+    The matching range costs two bisects, but collecting it is linear in its
+    size (a one-letter query spans thousands of suffixes), so results are
+    cached per query until the index is rebuilt
+    """
+    query = keyword.lower()
+    if not query:
+        return frozenset().union(*_keyword_foods.values())
+    
+    start = bisect_left(_suffixes, query)
+    end = bisect_left(_suffixes, query + '\U0010ffff', start)
+    matched_keywords = set(_suffix_keywords[start:end])
+    return frozenset().union(*(_keyword_foods[kw] for kw in matched_keywords))
+
+def search_food_by_keywords(keywords, rank=False):
+    """
+    Search for food items based on keywords
+    A query keyword matches a food if it is part of any of the food's keywords.
+    Results are in database order, or by number of matched query keywords when rank=True
+    """
+    match_counts = {}
+    for keyword in keywords:
+        for index in _foods_matching(keyword):
+            match_counts[index] = match_counts.get(index, 0) + 1
+    
+    if rank:
+        ordered = sorted(match_counts, key=lambda index: (-match_counts[index], index))
+    else:
+        ordered = sorted(match_counts)
+    return [(_food_names[index], INDIAN_FOOD_DATABASE[_food_names[index]]) for index in ordered]
 
 def get_all_foods():
     """Get all available food items"""
-    return list(INDIAN_FOOD_DATABASE.keys())
\ No newline at end of file
+    return list(INDIAN_FOOD_DATABASE.keys())
+
+build_keyword_index()
@@ -0,0 +1,198 @@
+"""
+Job queue for heavy work (diet-chart merges, image analyses)
+Jobs are rows in the app database's job table (the Job model), so every web
+node and job worker sharing DATABASE_URL sees the same queue and no external
+broker is needed. Workers claim jobs under a lease (renewed while the job
+runs), failed jobs are retried with backoff, and each user has a cap on
+running and pending jobs.
+Each claim gets a new lease token, and only its holder can finish the job
+"""
+
+import json
+import time
+import uuid
+import zlib
+
+from sqlalchemy import bindparam, text
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+FINISHED_STATUSES = (DONE, FAILED)
+
+# PostgreSQL advisory lock taken by submit() and claim(), the counterpart of SQLite's write lock
+QUEUE_LOCK_KEY = zlib.crc32(b'job_queue')
+
+
+class JobQueueFull(Exception):
+    """The user already has the maximum number of pending jobs"""
+
+
+class JobQueue:
+    def __init__(self, engine, per_user_running=1, per_user_pending=10, max_attempts=3,
+                 lease_seconds=300, retry_delay=2.0, keep_finished=24 * 3600):
+        self.engine = engine
+        self.per_user_running = per_user_running
+        self.per_user_pending = per_user_pending
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.retry_delay = retry_delay
+        self.keep_finished = keep_finished
+
+    def _serialized(self, conn):
+        """
+        Make conn's transaction the only one submitting or claiming, so the
+        per-user caps hold with several web nodes and workers
+        """
+        if conn.dialect.name == 'sqlite':
+            conn.exec_driver_sql('BEGIN IMMEDIATE')
+        elif conn.dialect.name == 'postgresql':
+            conn.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': QUEUE_LOCK_KEY})
+
+    def submit(self, kind, user_email, payload, payload_blob=None):
+        """Queue a job and return its id (JobQueueFull if the user is at their limit)"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self.engine.begin() as conn:
+            self._serialized(conn)
+            pending = conn.execute(
+                text('SELECT COUNT(*) FROM job WHERE user_email = :user_email AND status IN (:queued, :running)'),
+                {'user_email': user_email, 'queued': QUEUED, 'running': RUNNING}
+            ).scalar()
+            if pending >= self.per_user_pending:
+                raise JobQueueFull(f'Too many pending jobs (maximum {self.per_user_pending})')
+            conn.execute(text('''
+                INSERT INTO job (id, kind, user_email, payload, payload_blob, status, attempts, max_attempts,
+                                 created_at, run_after)
+                VALUES (:id, :kind, :user_email, :payload, :payload_blob, :status, 0, :max_attempts, :now, :now)
+            '''), {'id': job_id, 'kind': kind, 'user_email': user_email, 'payload': json.dumps(payload),
+                  'payload_blob': payload_blob, 'status': QUEUED, 'max_attempts': self.max_attempts, 'now': now})
+        return job_id
+
+    def claim(self, worker_id, kinds=None):
+        """
+        Lease the oldest runnable job to a worker, or return None
+        Skips users already running per_user_running jobs and puts jobs whose
+        lease ran out (a crashed worker) back in the queue first
+        """
+        now = time.time()
+        with self.engine.begin() as conn:
+            self._serialized(conn)
+            self._expire_leases(conn, now)
+            query = '''
+                SELECT * FROM job
+                WHERE status = :queued AND run_after <= :now
+                  AND (SELECT COUNT(*) FROM job AS running
+                       WHERE running.user_email = job.user_email AND running.status = :running) < :per_user_running
+                  {kind_filter}
+                ORDER BY run_after, created_at
+                LIMIT 1
+            '''
+            params = {'queued': QUEUED, 'now': now, 'running': RUNNING, 'per_user_running': self.per_user_running}
+            if kinds:
+                statement = text(query.format(kind_filter='AND kind IN :kinds')).bindparams(bindparam('kinds', expanding=True))
+                params['kinds'] = list(kinds)
+            else:
+                statement = text(query.format(kind_filter=''))
+            row = conn.execute(statement, params).mappings().first()
+            if row is None:
+                return None
+            lease_token = uuid.uuid4().hex
+            conn.execute(text('''
+                UPDATE job SET status = :running, attempts = attempts + 1, started_at = :now, lease_expires = :lease_expires,
+                               lease_token = :lease_token, worker = :worker
+                WHERE id = :id
+            '''), {'running': RUNNING, 'now': now, 'lease_expires': now + self.lease_seconds,
+                  'lease_token': lease_token, 'worker': worker_id, 'id': row['id']})
+        job = dict(row)
+        job['attempts'] += 1
+        job['lease_token'] = lease_token
+        job['payload'] = json.loads(job['payload'])
+        return job
+
+    def _expire_leases(self, conn, now):
+        conn.execute(text('''
+            UPDATE job SET status = CASE WHEN attempts < max_attempts THEN :queued ELSE :failed END,
+                           error = 'Worker lease expired', lease_expires = NULL, lease_token = NULL, worker = NULL,
+                           finished_at = CASE WHEN attempts < max_attempts THEN NULL ELSE :now END
+            WHERE status = :running AND lease_expires < :now
+        '''), {'queued': QUEUED, 'failed': FAILED, 'now': now, 'running': RUNNING})
+
+    def renew(self, job_id, lease_token):
+        """Extend a running job's lease; False if the lease was lost (expired and reclaimed)"""
+        with self.engine.begin() as conn:
+            return conn.execute(
+                text('UPDATE job SET lease_expires = :lease_expires WHERE id = :id AND status = :running AND lease_token = :lease_token'),
+                {'lease_expires': time.time() + self.lease_seconds, 'id': job_id, 'running': RUNNING, 'lease_token': lease_token}
+            ).rowcount == 1
+
+    def complete(self, job_id, lease_token, result):
+        """Store the handler's result; False (result dropped) if the lease was lost"""
+        now = time.time()
+        with self.engine.begin() as conn:
+            updated = conn.execute(text('''
+                UPDATE job SET status = :done, result = :result, error = NULL, finished_at = :now, lease_expires = NULL,
+                               lease_token = NULL, payload_blob = NULL
+                WHERE id = :id AND status = :running AND lease_token = :lease_token
+            '''), {'done': DONE, 'result': json.dumps(result), 'now': now, 'id': job_id, 'running': RUNNING,
+                  'lease_token': lease_token}).rowcount
+            # Finished jobs are kept for keep_finished seconds so clients can fetch results
+            conn.execute(
+                text('DELETE FROM job WHERE status IN (:done, :failed) AND finished_at < :cutoff'),
+                {'done': DONE, 'failed': FAILED, 'cutoff': now - self.keep_finished}
+            )
+        return updated == 1
+
+    def fail(self, job_id, lease_token, error):
+        """
+        Record a failed attempt: retry with exponential backoff, or give up after max_attempts
+        False (nothing recorded) if the lease was lost
+        """
+        now = time.time()
+        with self.engine.begin() as conn:
+            row = conn.execute(
+                text('SELECT attempts, max_attempts FROM job WHERE id = :id AND status = :running AND lease_token = :lease_token'),
+                {'id': job_id, 'running': RUNNING, 'lease_token': lease_token}
+            ).mappings().first()
+            if row is None:
+                return False
+            if row['attempts'] < row['max_attempts']:
+                delay = self.retry_delay * 2 ** (row['attempts'] - 1)
+                conn.execute(text('''
+                    UPDATE job SET status = :queued, error = :error, run_after = :run_after, lease_expires = NULL,
+                                   lease_token = NULL, worker = NULL
+                    WHERE id = :id AND lease_token = :lease_token
+                '''), {'queued': QUEUED, 'error': error, 'run_after': now + delay, 'id': job_id, 'lease_token': lease_token})
+            else:
+                conn.execute(text('''
+                    UPDATE job SET status = :failed, error = :error, finished_at = :now, lease_expires = NULL,
+                                   lease_token = NULL, payload_blob = NULL
+                    WHERE id = :id AND lease_token = :lease_token
+                '''), {'failed': FAILED, 'error': error, 'now': now, 'id': job_id, 'lease_token': lease_token})
+        return True
+
+    def get(self, job_id, user_email=None):
+        """Job status (and result once done) as a dict, or None; user_email restricts to the owner"""
+        query = '''
+            SELECT id, kind, user_email, status, result, error, attempts, max_attempts,
+                   created_at, started_at, finished_at
+            FROM job WHERE id = :id
+        '''
+        params = {'id': job_id}
+        if user_email is not None:
+            query += ' AND user_email = :user_email'
+            params['user_email'] = user_email
+        with self.engine.connect() as conn:
+            row = conn.execute(text(query), params).mappings().first()
+        if row is None:
+            return None
+        job = dict(row)
+        job['result'] = json.loads(job['result']) if job['result'] is not None else None
+        return job
+
+    def stats(self):
+        """Job counts by status"""
+        with self.engine.connect() as conn:
+            counts = dict(conn.execute(text('SELECT status, COUNT(*) FROM job GROUP BY status')).all())
+        return {status: counts.get(status, 0) for status in (QUEUED, RUNNING, DONE, FAILED)}
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Worker processes for the job queue
+Started by the gunicorn master (see gunicorn.conf.py), or run as its own
+service with: python job_worker.py [processes]
+(uses the APP_CONFIG profile, like the web server)
+Each worker claims jobs from the job table in the app database (DATABASE_URL),
+runs the handler registered in app.JOB_HANDLERS inside an app context and
+stores the result
+"""
+
+import multiprocessing
+import os
+import socket
+import sys
+import threading
+import time
+import traceback
+
+POLL_INTERVAL = 0.5
+
+
+def run_worker(worker_id, stop_event=None, app=None):
+    """Claim and run jobs until stop_event is set (forever if None)"""
+    from app import create_app, db, job_queue, JOB_HANDLERS
+
+    app = app or create_app()
+    print(f"Job worker {worker_id} started")
+    with app.app_context():
+        while stop_event is None or not stop_event.is_set():
+            job = job_queue.claim(worker_id, kinds=list(JOB_HANDLERS))
+            if job is None:
+                time.sleep(POLL_INTERVAL)
+                continue
+
+            finished = threading.Event()
+            threading.Thread(target=keep_lease, args=(job_queue._get_current_object(), job, finished), daemon=True).start()
+            try:
+                result = JOB_HANDLERS[job['kind']](job)
+                if not job_queue.complete(job['id'], job['lease_token'], result):
+                    print(f"Job {job['id']}: lease lost, result discarded")
+            except Exception as e:
+                traceback.print_exc()
+                job_queue.fail(job['id'], job['lease_token'], str(e))
+            finally:
+                finished.set()
+                # Fresh session per job so one failure can't leak into the next
+                db.session.remove()
+
+
+def keep_lease(queue, job, finished):
+    """Renew the job's lease until it finishes, so a long job isn't handed to a second worker"""
+    while not finished.wait(queue.lease_seconds / 3):
+        if not queue.renew(job['id'], job['lease_token']):
+            return
+
+
+def start_worker_threads(app, count):
+    """Run workers as daemon threads inside the current process (development server)"""
+    stop_event = threading.Event()
+    for number in range(count):
+        worker_id = f"{socket.gethostname()}:{os.getpid()}:thread-{number}"
+        threading.Thread(target=run_worker, args=(worker_id, stop_event, app), daemon=True).start()
+    return stop_event
+
+
+def _process_main(number):
+    run_worker(f"{socket.gethostname()}:{os.getpid()}:{number}")
+
+
+if __name__ == '__main__':
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else int(os.getenv('JOB_WORKER_PROCESSES', 1))
+    if processes == 1:
+        _process_main(0)
+    else:
+        workers = [multiprocessing.Process(target=_process_main, args=(number,)) for number in range(processes)]
+        for worker in workers:
+            worker.start()
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            for worker in workers:
+                worker.terminate()
@@ -0,0 +1,226 @@
+"""
+Dish-level planner for merged diet charts
+Picks concrete dishes from INDIAN_FOOD_DATABASE for each meal so the meal
+lands on its calorie target and macro split. Every 1..max_dishes combination
+of a meal's candidate dishes is enumerated once at startup into a nutrient
+matrix. Least-squares servings scale with the calorie target, so they are
+solved once per (meal, goal) for a 1 kcal meal; planning a meal scales and
+scores them for the combinations its diet allows, then snaps the best few
+hundred to portion steps
+"""
+
+from itertools import combinations, product
+
+import numpy as np
+
+from meal_planning import MEAL_PLANNING, MACRO_CALORIES_PER_GRAM
+from nutrition_table import NUTRITION_TABLE, NUTRIENTS
+
+PLANNED_NUTRIENTS = ('calories', 'protein', 'carbs', 'fats')
+
+# kcal per gram of protein, carbs, fats
+MACRO_ENERGY = np.array([calories_per_gram for _, calories_per_gram in MACRO_CALORIES_PER_GRAM], dtype=np.float64)
+
+# Keeps padded (absent) dishes at zero servings and the normal equations solvable
+RIDGE = 1e-6
+
+# Weight of each unit of error outside the calorie/macro tolerance
+TOLERANCE_PENALTY = 10.0
+
+# Combinations (by unrounded fit) whose portion roundings are all tried
+SHORTLIST = 256
+
+
+class MealSlot:
+    def __init__(self, food_names, max_dishes, table):
+        self.food_names = list(food_names)
+        rows = table.rows(self.food_names)
+        columns = [NUTRIENTS.index(nutrient) for nutrient in PLANNED_NUTRIENTS]
+        nutrients = table.values[rows][:, columns].astype(np.float64)
+
+        # combos: dish positions per combination, padded with -1
+        combos = [combo for size in range(1, max_dishes + 1)
+                  for combo in combinations(range(len(self.food_names)), size)]
+        self.combos = np.full((len(combos), max_dishes), -1, dtype=np.intp)
+        for position, combo in enumerate(combos):
+            self.combos[position, :len(combo)] = combo
+
+        # Per-dish nutrients for each combination (combos x dishes x nutrients), zero for padding
+        padded = np.vstack([nutrients, np.zeros((1, len(PLANNED_NUTRIENTS)))])
+        self.dish_nutrients = padded[self.combos]
+        self.present = self.combos >= 0
+
+        # The same in energy terms: calories and kcal from protein, carbs, fats
+        self.dish_energy = self.dish_nutrients * np.concatenate([[1.0], MACRO_ENERGY])
+
+
+class MealPlanner:
+    def __init__(self, knowledge_base, table, settings, food_tags, diet_exclusions, meal_slot_foods):
+        self.knowledge_base = knowledge_base
+        self.max_dishes = settings['max_dishes']
+        self.min_portion = settings['min_portion']
+        self.max_portion = settings['max_portion']
+        self.portion_step = settings['portion_step']
+        self.calorie_tolerance = settings['calorie_tolerance']
+        self.macro_tolerance = settings['macro_tolerance']
+        self.calorie_weight = settings['calorie_weight']
+        self.repeat_penalty = settings['repeat_penalty']
+        self.food_tags = {tag: frozenset(foods) for tag, foods in food_tags.items()}
+        self.diet_exclusions = {diet: tuple(tags) for diet, tags in diet_exclusions.items()}
+        self.slots = {meal_name: MealSlot(foods, self.max_dishes, table) for meal_name, foods in meal_slot_foods.items()}
+        self._allowed = {}  # (meal, preference) -> indices of the combos the diet allows
+        self._unit_servings = {}  # (meal, goal) -> servings per combo for a 1 kcal meal
+        # Every way of rounding each dish's fitted servings down or up a step
+        self._roundings = np.array(list(product((0.0, 1.0), repeat=self.max_dishes)))
+
+    def excluded_foods(self, dietary_preference):
+        """Foods a preference rules out (unknown preferences are treated as vegetarian)"""
+        tags = self.diet_exclusions.get(dietary_preference, self.diet_exclusions['vegetarian'])
+        return frozenset().union(*(self.food_tags[tag] for tag in tags))
+
+    def strictest_preference(self, preferences):
+        """The preference excluding the most foods, so a merged plan suits every chart"""
+        return max(sorted(preferences), key=lambda preference: len(self.excluded_foods(preference)), default='vegetarian')
+
+    def _allowed_combos(self, meal_name, dietary_preference):
+        key = (meal_name, dietary_preference)
+        allowed = self._allowed.get(key)
+        if allowed is None:
+            slot = self.slots[meal_name]
+            excluded = self.excluded_foods(dietary_preference)
+            banned = np.array([food_name in excluded for food_name in slot.food_names] + [False])
+            allowed = np.flatnonzero(~banned[slot.combos].any(axis=1))
+            self._allowed[key] = allowed
+        return allowed
+
+    def _servings_per_calorie(self, meal_name, goal):
+        """
+        Servings per dish for every combination, fitted to a 1 kcal meal
+        Ridge least squares on calories and macro energy; the fit is linear in
+        the target, so a meal of N kcal needs N times these servings
+        """
+        key = (meal_name, goal)
+        servings = self._unit_servings.get(key)
+        if servings is None:
+            slot = self.slots[meal_name]
+            macro_ratios = np.array(self.knowledge_base.macro_ratios(meal_name, goal))
+            weights = np.concatenate([[self.calorie_weight], np.ones(len(macro_ratios))])
+            design = slot.dish_energy.transpose(0, 2, 1) * weights[None, :, None]
+            target = weights * np.concatenate([[1.0], macro_ratios])
+            normal = design.transpose(0, 2, 1) @ design + RIDGE * np.eye(self.max_dishes)
+            servings = np.linalg.solve(normal, (design.transpose(0, 2, 1) @ target)[..., None])[..., 0]
+            self._unit_servings[key] = servings
+        return servings
+
+    def _score(self, servings, dish_nutrients, calories, target_macros):
+        """
+        (score, planned, calorie_error, macro_error) for servings of shape (..., dishes)
+        Calorie miss plus macro misses, all as fractions of the meal's energy;
+        misses beyond the tolerance cost far more, so a plan inside it wins
+        """
+        planned = (servings[..., None] * dish_nutrients).sum(axis=-2)
+        calorie_error = np.abs(planned[..., 0] - calories) / calories
+        macro_error = np.abs(planned[..., 1:] - target_macros) * MACRO_ENERGY / calories
+        excess = (np.maximum(calorie_error - self.calorie_tolerance, 0.0)
+                  + np.maximum(macro_error - self.macro_tolerance, 0.0).sum(axis=-1))
+        score = self.calorie_weight * calorie_error + macro_error.sum(axis=-1) + TOLERANCE_PENALTY * excess
+        return score, planned, calorie_error, macro_error
+
+    def plan_meal(self, meal_name, goal, dietary_preference, calories, used_foods=()):
+        """
+        Best dishes for one meal, as (dishes, nutrients, within_tolerance)
+        dishes is a list of (food_name, servings); nutrients holds calories,
+        protein, carbs and fats of the whole meal. Returns None for meals
+        without candidate dishes or a non-positive calorie target
+        """
+        slot = self.slots.get(meal_name)
+        if slot is None or calories <= 0:
+            return None
+
+        allowed = self._allowed_combos(meal_name, dietary_preference)
+        if not len(allowed):
+            return None
+        combos = slot.combos[allowed]
+        present = slot.present[allowed]
+        macro_ratios = np.array(self.knowledge_base.macro_ratios(meal_name, goal))
+        target_macros = calories * macro_ratios / MACRO_ENERGY
+
+        # Prefer dishes not already served today
+        repeats = 0.0
+        if used_foods:
+            used = np.array([food_name in used_foods for food_name in slot.food_names] + [False])
+            repeats = self.repeat_penalty * used[combos].sum(axis=1)
+
+        # Fitted servings for this target; the combinations whose unrounded fit
+        # scores best are then snapped to portion steps, trying every down/up
+        # rounding of their dishes (shortlist x roundings x dishes)
+        fitted = np.where(present, calories * self._servings_per_calorie(meal_name, goal)[allowed], 0.0)
+        dish_nutrients = slot.dish_nutrients[allowed]
+        fit_score = self._score(
+            np.clip(fitted, 0.0, self.max_portion), dish_nutrients, calories, target_macros
+        )[0] + repeats
+        if len(fit_score) > SHORTLIST:
+            shortlist = np.argpartition(fit_score, SHORTLIST)[:SHORTLIST]
+        else:
+            shortlist = np.arange(len(fit_score))
+
+        steps = np.floor(fitted[shortlist] / self.portion_step)
+        servings = (steps[:, None, :] + self._roundings[None, :, :]) * self.portion_step
+        servings = np.where(present[shortlist][:, None, :], np.clip(servings, self.min_portion, self.max_portion), 0.0)
+        score, planned, calorie_error, macro_error = self._score(
+            servings, dish_nutrients[shortlist][:, None, :, :], calories, target_macros
+        )
+        if used_foods:
+            score = score + repeats[shortlist][:, None]
+
+        best = np.unravel_index(int(np.argmin(score)), score.shape)
+        dishes = [(slot.food_names[position], float(serving))
+                  for position, serving in zip(combos[shortlist[best[0]]], servings[best]) if position >= 0]
+        nutrients = dict(zip(PLANNED_NUTRIENTS, (float(value) for value in planned[best])))
+        within_tolerance = bool(
+            calorie_error[best] <= self.calorie_tolerance and (macro_error[best] <= self.macro_tolerance).all()
+        )
+        return dishes, nutrients, within_tolerance
+
+    def plan_day(self, goal, dietary_preference, target_calories):
+        """
+        Meals for a full day in serving order, as (meals, within_tolerance)
+        meals are chart meal dicts (time, name, calories, foods, macros);
+        within_tolerance holds one flag per meal
+        """
+        meals = []
+        within_tolerance = []
+        used_foods = set()
+        for meal_name, share in self.knowledge_base.meal_distribution(goal).items():
+            meal_calories = int(target_calories * share)
+            plan = self.plan_meal(meal_name, goal, dietary_preference, meal_calories, used_foods)
+            if plan is None:
+                # No dishes fit: fall back to the goal's suggested options
+                meals.append(self.knowledge_base.meal(meal_name, goal, dietary_preference, meal_calories))
+                within_tolerance.append(False)
+                continue
+
+            dishes, nutrients, meal_within_tolerance = plan
+            used_foods.update(food_name for food_name, _ in dishes)
+            meals.append({
+                'time': self.knowledge_base.meal_time(meal_name),
+                'name': meal_name,
+                'calories': round(nutrients['calories']),
+                'foods': ', '.join(format_dish(food_name, servings) for food_name, servings in dishes),
+                'macros': f"P: {round(nutrients['protein'])}g, C: {round(nutrients['carbs'])}g, F: {round(nutrients['fats'])}g"
+            })
+            within_tolerance.append(meal_within_tolerance)
+        return meals, within_tolerance
+
+
+def format_dish(food_name, servings):
+    """'Dal Tadka (1.5 servings)'"""
+    label = food_name.replace('_', ' ').title()
+    unit = 'serving' if servings == 1 else 'servings'
+    return f"{label} ({servings:g} {unit})"
+
+
+MEAL_PLANNER = MealPlanner(
+    MEAL_PLANNING, NUTRITION_TABLE, MEAL_PLANNING.planner_settings, MEAL_PLANNING.food_tags,
+    MEAL_PLANNING.diet_exclusions, MEAL_PLANNING.meal_slot_foods
+)
@@ -0,0 +1,133 @@
+"""
+Meal-planning knowledge base used when merging diet charts
+Loads meal_planning.json once and precomputes every (meal, goal, preference)
+template, so building a merged chart is lookups plus macro arithmetic
+"""
+
+import json
+import os
+from types import MappingProxyType
+
+MEAL_PLANNING_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'meal_planning.json')
+
+MACRO_CALORIES_PER_GRAM = (('protein', 4), ('carbs', 4), ('fats', 9))
+
+
+class MealPlanningKnowledgeBase:
+    def __init__(self, data):
+        self.meal_times = MappingProxyType(dict(data['meal_times']))
+        self.default_meal_time = data['default_meal_time']
+        self.goal_calorie_adjustments = MappingProxyType(dict(data['goal_calorie_adjustments']))
+        self.meal_distributions = MappingProxyType({
+            goal: MappingProxyType(dict(distribution)) for goal, distribution in data['meal_distributions'].items()
+        })
+        self.default_meal_distribution = MappingProxyType(dict(data['default_meal_distribution']))
+        self.base_notes = tuple(data['base_notes'])
+        self.goal_notes = MappingProxyType({goal: tuple(notes) for goal, notes in data['goal_notes'].items()})
+
+        # Dish-level planning data (see meal_planner.py)
+        self.planner_settings = MappingProxyType(dict(data['planner']))
+        self.planner_limitations = tuple(data['planner_limitations'])
+        self.food_tags = MappingProxyType({tag: tuple(foods) for tag, foods in data['food_tags'].items()})
+        self.diet_exclusions = MappingProxyType({diet: tuple(tags) for diet, tags in data['diet_exclusions'].items()})
+        self.meal_slot_foods = MappingProxyType({meal_name: tuple(foods) for meal_name, foods in data['meal_slot_foods'].items()})
+
+        # (meal, preference, goal) -> top three food options as display text
+        self._food_options = MappingProxyType({
+            (meal_name, preference, goal): ', '.join(options[:3])
+            for meal_name, preferences in data['food_options'].items()
+            for preference, goals in preferences.items()
+            for goal, options in goals.items()
+            if options
+        })
+        self._preferences = {meal_name: frozenset(preferences) for meal_name, preferences in data['food_options'].items()}
+        self._food_goals = {
+            (meal_name, preference): frozenset(goals)
+            for meal_name, preferences in data['food_options'].items()
+            for preference, goals in preferences.items()
+        }
+
+        # (meal, goal) -> macro ratios, the average of the meal's and the goal's split
+        meal_ratios = data['meal_macro_ratios']
+        goal_ratios = data['goal_macro_ratios']
+        self._macro_ratios = MappingProxyType({
+            (meal_name, goal): tuple(
+                (meal_ratios[meal_name][macro] + goal_ratios[goal][macro]) / 2 for macro, _ in MACRO_CALORIES_PER_GRAM
+            )
+            for meal_name in meal_ratios
+            for goal in goal_ratios
+        })
+        self._macro_meals = frozenset(meal_ratios)
+        self._macro_goals = frozenset(goal_ratios)
+
+    @classmethod
+    def load(cls, path=MEAL_PLANNING_PATH):
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def meal_time(self, meal_name):
+        return self.meal_times.get(meal_name, self.default_meal_time)
+
+    def goal_adjustment(self, goal):
+        """Calories added to the averaged daily total for a merge goal"""
+        return self.goal_calorie_adjustments.get(goal, 0)
+
+    def meal_distribution(self, goal):
+        """Share of daily calories per meal, in serving order"""
+        return self.meal_distributions.get(goal, self.default_meal_distribution)
+
+    def food_options(self, meal_name, goal, dietary_preference):
+        """Top food options for a meal (vegetarian / Maintenance when the preference or goal is unknown)"""
+        preferences = self._preferences.get(meal_name, ())
+        preference = dietary_preference if dietary_preference in preferences else 'vegetarian'
+        goals = self._food_goals.get((meal_name, preference), ())
+        options = self._food_options.get((meal_name, preference, goal if goal in goals else 'Maintenance'))
+        if options:
+            return options
+        return f"Optimized {meal_name.lower()} for {goal} ({dietary_preference})"
+
+    def macro_ratios(self, meal_name, goal):
+        """(protein, carbs, fats) share of a meal's calories"""
+        meal_name = meal_name if meal_name in self._macro_meals else 'Breakfast'
+        goal = goal if goal in self._macro_goals else 'Maintenance'
+        return self._macro_ratios[(meal_name, goal)]
+
+    def macros(self, calories, meal_name, goal='Maintenance'):
+        """Macro grams for a meal as display text, e.g. 'P: 23g, C: 47g, F: 10g'"""
+        grams = [
+            round((calories * ratio) / calories_per_gram)
+            for ratio, (_, calories_per_gram) in zip(self.macro_ratios(meal_name, goal), MACRO_CALORIES_PER_GRAM)
+        ]
+        return f"P: {grams[0]}g, C: {grams[1]}g, F: {grams[2]}g"
+
+    def meal(self, meal_name, goal, dietary_preference, calories):
+        """One meal of a merged chart"""
+        return {
+            'time': self.meal_time(meal_name),
+            'name': meal_name,
+            'calories': calories,
+            'foods': self.food_options(meal_name, goal, dietary_preference),
+            'macros': self.macros(calories, meal_name, goal)
+        }
+
+    def optimization_notes(self, goal, charts_used, target_calories, dietary_preference):
+        values = {
+            'goal': goal,
+            'charts_used': charts_used,
+            'target_calories': target_calories,
+            'dietary_preference': dietary_preference
+        }
+        goal_notes = self.goal_notes.get(goal, self.goal_notes['Maintenance'])
+        return [note.format(**values) for note in self.base_notes + goal_notes]
+
+    def known_limitations(self, meals_within, meals_planned):
+        """Caveats shown with a planned chart, starting with how many of its meals hit their targets"""
+        values = {
+            'meals_within': meals_within,
+            'meals_planned': meals_planned,
+            'tolerance': round(self.planner_settings['calorie_tolerance'] * 100)
+        }
+        return [note.format(**values) for note in self.planner_limitations]
+
+
+MEAL_PLANNING = MealPlanningKnowledgeBase.load()
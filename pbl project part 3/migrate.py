@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Database migration script: applies the pending revisions in migrations.py
+Replaces the one-off migrate_*.py scripts; applied revisions are recorded in
+the database, so this is safe to run on every deploy
+Usage: python migrate.py [--dry-run] [--list] [--to REVISION] [--chunk-size N] [database URL or SQLite file]
+"""
+
+import argparse
+
+from migrations import DEFAULT_CHUNK_SIZE, REVISIONS, status, upgrade
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Apply pending schema revisions')
+    parser.add_argument('target', nargs='?', help='database URL or SQLite file (default: DATABASE_URL)')
+    parser.add_argument('--dry-run', action='store_true', help='print the SQL and roll everything back')
+    parser.add_argument('--list', action='store_true', help='show applied and pending revisions')
+    parser.add_argument('--to', choices=[revision.id for revision in REVISIONS], help='stop after this revision')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='rows per copy/backfill transaction')
+    args = parser.parse_args()
+
+    if args.list:
+        for revision, applied_at in status(args.target):
+            state = f"applied {applied_at:%Y-%m-%d %H:%M}" if applied_at else 'pending'
+            print(f"{revision.id:<26} {state:<24} {revision.description}")
+        return
+
+    upgrade(args.target, up_to=args.to, dry_run=args.dry_run, chunk_size=args.chunk_size)
+
+
+if __name__ == '__main__':
+    main()
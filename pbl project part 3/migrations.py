@@ -0,0 +1,708 @@
+"""
+Versioned, dialect-safe schema migrations for the app database
+REVISIONS is the ordered list of schema changes; applied revisions are
+recorded in the schema_revision table, so each runs once per database
+(migrate.py runs them, `flask --app app init-db` stamps new databases).
+Revisions prefer additive changes (ADD COLUMN, CREATE INDEX); backfills and
+the table copies SQLite needs are done in id-ordered chunks, each chunk its
+own short transaction, so the app keeps working while a large table migrates.
+Every step also re-checks the live schema (on PostgreSQL, whether foreign keys
+are validated and indexes valid, not just present), so an interrupted run resumes
+"""
+
+import json
+import os
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime
+
+import sqlalchemy as sa
+
+from config import DEFAULT_DATABASE_URL, normalize_database_url
+from diet_charts import split_chart_data, chart_total_calories, chart_dietary_preference
+
+DEFAULT_DB_PATH = os.path.join('instance', 'workoutvibes.db')
+
+DEFAULT_CHUNK_SIZE = 5000
+
+# Columns of the user table the app relies on; anything else is left over from Google sign-in
+USER_COLUMNS = ('id', 'name', 'email', 'password')
+
+Revision = namedtuple('Revision', 'id description upgrade')
+
+revision_metadata = sa.MetaData()
+schema_revision = sa.Table(
+    'schema_revision', revision_metadata,
+    sa.Column('id', sa.String(100), primary_key=True),
+    sa.Column('description', sa.String(200), nullable=False),
+    sa.Column('applied_at', sa.DateTime, nullable=False),
+    sa.Column('duration_ms', sa.Integer)
+)
+
+
+def database_url(target=None):
+    """
+    SQLAlchemy URL for a migration target: a URL, a SQLite file path, or by
+    default DATABASE_URL, falling back to the app's instance/workoutvibes.db
+    """
+    target = target or os.getenv('DATABASE_URL')
+    if not target or target == DEFAULT_DATABASE_URL:
+        target = DEFAULT_DB_PATH
+    if '://' not in target:
+        return f'sqlite:///{target}'
+    return normalize_database_url(target)
+
+
+def missing_sqlite_file(url):
+    """True for a SQLite file URL whose file doesn't exist (connecting would create it)"""
+    parsed = sa.engine.make_url(url)
+    return parsed.get_backend_name() == 'sqlite' and not os.path.exists(parsed.database or '')
+
+
+def migration_engine(url):
+    """Engine whose transactions also cover DDL (pysqlite autocommits DDL by default)"""
+    engine = sa.create_engine(url)
+    if engine.dialect.name == 'sqlite':
+        @sa.event.listens_for(engine, 'connect')
+        def disable_driver_transactions(dbapi_connection, connection_record):
+            dbapi_connection.isolation_level = None
+
+        @sa.event.listens_for(engine, 'begin')
+        def begin_transaction(conn):
+            conn.exec_driver_sql('BEGIN')
+    return engine
+
+
+class MigrationContext:
+    """
+    What a revision gets to work with: short transactions, schema inspection
+    and the chunked helpers. In a dry run every transaction is the same outer
+    one, which the runner rolls back at the end
+    """
+
+    def __init__(self, engine, chunk_size=DEFAULT_CHUNK_SIZE, dry_run_connection=None):
+        self.engine = engine
+        self.dialect = engine.dialect.name
+        self.chunk_size = chunk_size
+        self.dry_run_connection = dry_run_connection
+
+    @property
+    def dry_run(self):
+        return self.dry_run_connection is not None
+
+    @contextmanager
+    def transaction(self):
+        if self.dry_run:
+            yield self.dry_run_connection
+        else:
+            with self.engine.begin() as conn:
+                yield conn
+
+    def quote(self, name):
+        return self.engine.dialect.identifier_preparer.quote(name)
+
+    # Schema inspection
+    def table_names(self):
+        with self.transaction() as conn:
+            return set(sa.inspect(conn).get_table_names())
+
+    def columns(self, table):
+        with self.transaction() as conn:
+            return {column['name']: column for column in sa.inspect(conn).get_columns(table)}
+
+    def index_names(self, table):
+        with self.transaction() as conn:
+            return {index['name'] for index in sa.inspect(conn).get_indexes(table)}
+
+    def has_foreign_keys(self, table):
+        with self.transaction() as conn:
+            return bool(sa.inspect(conn).get_foreign_keys(table))
+
+    def constraint_validated(self, table, name):
+        """PostgreSQL: None if the constraint is missing, else whether it was validated (not left NOT VALID)"""
+        with self.transaction() as conn:
+            return conn.execute(sa.text(
+                'SELECT convalidated FROM pg_constraint WHERE conname = :name AND conrelid = to_regclass(:table)'
+            ), {'name': name, 'table': self.quote(table)}).scalar()
+
+    def index_valid(self, name):
+        """PostgreSQL: None if the index is missing, else whether it is valid (a failed CONCURRENTLY build isn't)"""
+        with self.transaction() as conn:
+            return conn.execute(sa.text(
+                'SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)'
+            ), {'name': self.quote(name)}).scalar()
+
+    # Additive changes
+    def add_column(self, table, column):
+        """ALTER TABLE ... ADD COLUMN unless present, with the type spelled for the dialect"""
+        if column.name in self.columns(table):
+            return
+        print(f"Adding column {table}.{column.name}...")
+        column_type = column.type.compile(dialect=self.engine.dialect)
+        with self.transaction() as conn:
+            conn.execute(sa.text(f'ALTER TABLE {self.quote(table)} ADD COLUMN {self.quote(column.name)} {column_type}'))
+
+    def create_index(self, name, table, column_names, unique=False):
+        """
+        CREATE INDEX unless present; PostgreSQL builds it CONCURRENTLY so
+        writes to the table carry on meanwhile
+        """
+        if self.has_index(table, name):
+            return
+        if self.dialect == 'postgresql' and self.index_valid(name) is False:
+            # Left behind by an interrupted or failed build; it's never used, so rebuild it
+            print(f"Dropping invalid index {name}...")
+            self.drop_index(name)
+        print(f"Creating index {name}...")
+        column_list = ', '.join(self.quote(column) for column in column_names)
+        unique_clause = 'UNIQUE ' if unique else ''
+        if self.dialect == 'postgresql' and not self.dry_run:
+            with self.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+                conn.execute(sa.text(
+                    f'CREATE {unique_clause}INDEX CONCURRENTLY IF NOT EXISTS {self.quote(name)} '
+                    f'ON {self.quote(table)} ({column_list})'
+                ))
+            return
+        with self.transaction() as conn:
+            conn.execute(sa.text(
+                f'CREATE {unique_clause}INDEX IF NOT EXISTS {self.quote(name)} ON {self.quote(table)} ({column_list})'
+            ))
+
+    def has_index(self, table, name):
+        """Index present and usable (an invalid PostgreSQL index doesn't count)"""
+        if self.dialect == 'postgresql':
+            return bool(self.index_valid(name))
+        return name in self.index_names(table)
+
+    def drop_index(self, name):
+        if self.dialect == 'postgresql' and not self.dry_run:
+            with self.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+                conn.execute(sa.text(f'DROP INDEX CONCURRENTLY IF EXISTS {self.quote(name)}'))
+            return
+        with self.transaction() as conn:
+            conn.execute(sa.text(f'DROP INDEX IF EXISTS {self.quote(name)}'))
+
+    # Chunked data changes
+    def id_chunks(self, table, where=None):
+        """(after, upto] id ranges of at most chunk_size rows, in id order"""
+        condition = f' AND ({where})' if where else ''
+        after = 0
+        while True:
+            with self.transaction() as conn:
+                ids = conn.execute(sa.text(
+                    f'SELECT id FROM {self.quote(table)} WHERE id > :after{condition} ORDER BY id LIMIT :limit'
+                ), {'after': after, 'limit': self.chunk_size}).scalars().all()
+            if not ids:
+                return
+            yield after, ids[-1]
+            after = ids[-1]
+
+    def backfill(self, table, assignments, where):
+        """UPDATE table SET assignments for rows matching where, one chunk per transaction"""
+        updated = 0
+        for after, upto in self.id_chunks(table, where):
+            with self.transaction() as conn:
+                updated += conn.execute(sa.text(
+                    f'UPDATE {self.quote(table)} SET {assignments} '
+                    f'WHERE id > :after AND id <= :upto AND ({where})'
+                ), {'after': after, 'upto': upto}).rowcount
+        print(f"Backfilled {updated} {table} rows.")
+        return updated
+
+    def rebuild_table(self, table, create_new_table, columns, expressions):
+        """
+        Online SQLite table rebuild (SQLite cannot alter constraints in place)
+        Triggers mirror writes on the old table into <table>_new while rows
+        are copied over in chunks; only the final swap holds the write lock.
+        expressions are SELECT expressions per column over a row named {row}
+        """
+        new_table = f'{table}_new'
+        old = self.quote(table)
+        column_list = ', '.join(columns)
+
+        def values(row):
+            return ', '.join(expression.format(row=row) for expression in expressions)
+
+        with self.transaction() as conn:
+            conn.execute(sa.text(f'DROP TABLE IF EXISTS {new_table}'))
+            conn.execute(sa.text(create_new_table))
+            for event in ('INSERT', 'UPDATE'):
+                conn.execute(sa.text(f'''
+                    CREATE TRIGGER {new_table}_{event.lower()} AFTER {event} ON {old}
+                    BEGIN
+                        INSERT OR REPLACE INTO {new_table} ({column_list}) VALUES ({values('NEW')});
+                    END
+                '''))
+            conn.execute(sa.text(f'''
+                CREATE TRIGGER {new_table}_delete AFTER DELETE ON {old}
+                BEGIN
+                    DELETE FROM {new_table} WHERE id = OLD.id;
+                END
+            '''))
+
+        # Rows already written by a trigger are newer than the copy, so the copy never overwrites them
+        copied = 0
+        for after, upto in self.id_chunks(table):
+            with self.transaction() as conn:
+                copied += conn.execute(sa.text(f'''
+                    INSERT OR IGNORE INTO {new_table} ({column_list})
+                    SELECT {values('src')} FROM {old} AS src WHERE src.id > :after AND src.id <= :upto
+                '''), {'after': after, 'upto': upto}).rowcount
+
+        with self.transaction() as conn:
+            # Dropping the old table drops its triggers too
+            conn.execute(sa.text(f'DROP TABLE {old}'))
+            conn.execute(sa.text(f'ALTER TABLE {new_table} RENAME TO {old}'))
+        print(f"Rebuilt {table} ({copied} rows copied).")
+
+
+# Revisions
+def upgrade_legacy_user_table(ctx):
+    """
+    Make a user table from the Google sign-in era usable by the app
+    Leftover columns stay unless they would block inserts (NOT NULL without a
+    default); users without a password are kept and reported, never deleted
+    """
+    if 'user' not in ctx.table_names():
+        return
+    user_columns = ctx.columns('user')
+    blocking = [
+        name for name, column in user_columns.items()
+        if name not in USER_COLUMNS and not column['nullable'] and column.get('default') is None
+    ]
+    nullable_password = user_columns['password']['nullable']
+    if not blocking and not nullable_password:
+        return
+
+    user_table = ctx.quote('user')
+    with ctx.transaction() as conn:
+        passwordless = conn.execute(sa.text(
+            f"SELECT COUNT(*) FROM {user_table} WHERE password IS NULL OR password = ''"
+        )).scalar()
+
+    if ctx.dialect == 'sqlite':
+        ctx.rebuild_table('user', '''
+            CREATE TABLE user_new (
+                id INTEGER NOT NULL,
+                name VARCHAR(100) NOT NULL,
+                email VARCHAR(120) NOT NULL,
+                password VARCHAR(200) NOT NULL,
+                PRIMARY KEY (id),
+                UNIQUE (email)
+            )
+        ''', USER_COLUMNS, ('{row}.id', '{row}.name', '{row}.email', "COALESCE({row}.password, '')"))
+    else:
+        with ctx.transaction() as conn:
+            for name in blocking:
+                conn.execute(sa.text(f'ALTER TABLE {user_table} ALTER COLUMN {ctx.quote(name)} DROP NOT NULL'))
+        if nullable_password:
+            ctx.backfill('user', "password = ''", 'password IS NULL')
+            with ctx.transaction() as conn:
+                conn.execute(sa.text(f'ALTER TABLE {user_table} ALTER COLUMN password SET NOT NULL'))
+
+    if passwordless:
+        print(f"{passwordless} users have no password (Google sign-in); they were kept but cannot log in with a password.")
+
+
+QUERY_INDEXES = (
+    ('ix_cart_user_email_product_id', 'cart', ('user_email', 'product_id')),
+    ('ix_order_user_email_order_time', 'order', ('user_email', 'order_time')),
+    ('ix_order_item_order_id', 'order_item', ('order_id',)),
+    ('ix_membership_user_email_start_date', 'membership', ('user_email', 'start_date')),
+    ('ix_diet_chart_user_email_is_active_created_date', 'diet_chart', ('user_email', 'is_active', 'created_date')),
+)
+
+# (table, constraint name, column, referenced table)
+QUERY_FOREIGN_KEYS = (
+    ('cart', 'fk_cart_product_id', 'product_id', 'product'),
+    ('order_item', 'fk_order_item_order_id', 'order_id', 'order'),
+    ('order_item', 'fk_order_item_product_id', 'product_id', 'product'),
+)
+
+# SQLite cannot add a constraint in place, so these tables are rebuilt with their foreign keys
+SQLITE_FOREIGN_KEY_TABLES = {
+    'cart': (('id', 'user_email', 'product_id', 'quantity'), '''
+        CREATE TABLE cart_new (
+            id INTEGER NOT NULL,
+            user_email VARCHAR(120) NOT NULL,
+            product_id INTEGER NOT NULL,
+            quantity INTEGER,
+            PRIMARY KEY (id),
+            FOREIGN KEY(product_id) REFERENCES product (id)
+        )
+    '''),
+    'order_item': (('id', 'order_id', 'product_id', 'quantity'), '''
+        CREATE TABLE order_item_new (
+            id INTEGER NOT NULL,
+            order_id INTEGER NOT NULL,
+            product_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            PRIMARY KEY (id),
+            FOREIGN KEY(order_id) REFERENCES "order" (id),
+            FOREIGN KEY(product_id) REFERENCES product (id)
+        )
+    '''),
+}
+
+
+def repair_orphans(ctx):
+    """
+    Fix rows the new foreign keys would reject
+    Cart rows for a missing product are dropped and order items of a missing
+    order are deleted. Order items for a missing product keep the order history:
+    a "Removed product <id>" placeholder is created for them
+    """
+    with ctx.transaction() as conn:
+        missing = lambda column, table: f'NOT EXISTS (SELECT 1 FROM {ctx.quote(table)} AS ref WHERE ref.id = {column})'
+        carts = conn.execute(sa.text(f'DELETE FROM cart WHERE {missing("cart.product_id", "product")}')).rowcount
+        items = conn.execute(sa.text(f'DELETE FROM order_item WHERE {missing("order_item.order_id", "order")}')).rowcount
+        placeholders = conn.execute(sa.text(f'''
+            SELECT DISTINCT order_item.product_id FROM order_item WHERE {missing("order_item.product_id", "product")}
+        ''')).scalars().all()
+        for product_id in placeholders:
+            conn.execute(sa.text(
+                'INSERT INTO product (id, name, description, price) VALUES (:id, :name, :description, 0)'
+            ), {'id': product_id, 'name': f'Removed product {product_id}',
+                'description': 'Placeholder for order history; the original product was deleted'})
+        if placeholders and ctx.dialect == 'postgresql':
+            # Explicit ids don't advance the serial sequence
+            conn.execute(sa.text("SELECT setval(pg_get_serial_sequence('product', 'id'), (SELECT MAX(id) FROM product))"))
+    if carts or items or placeholders:
+        print(f"Orphans: removed {carts} cart rows and {items} order items, "
+              f"added {len(placeholders)} placeholder products.")
+
+
+def add_query_indexes(ctx):
+    """Composite indexes for the per-user lookups, and foreign keys on cart and order_item"""
+    repair_orphans(ctx)
+    if ctx.dialect == 'sqlite':
+        # The rebuild swaps in a table with all of its foreign keys at once
+        for table in ('cart', 'order_item'):
+            if ctx.has_foreign_keys(table):
+                continue
+            print(f"Adding foreign keys to {table}...")
+            column_names, statement = SQLITE_FOREIGN_KEY_TABLES[table]
+            ctx.rebuild_table(table, statement, column_names, [f'{{row}}.{column}' for column in column_names])
+    else:
+        # NOT VALID skips the scan under the lock; VALIDATE then checks existing rows without blocking writes.
+        # Each key is checked by name, so a run that stopped between the two steps finishes the job
+        for table, name, column, referred in QUERY_FOREIGN_KEYS:
+            validated = ctx.constraint_validated(table, name)
+            if validated is None:
+                print(f"Adding foreign key {name}...")
+                with ctx.transaction() as conn:
+                    conn.execute(sa.text(
+                        f'ALTER TABLE {ctx.quote(table)} ADD CONSTRAINT {ctx.quote(name)} '
+                        f'FOREIGN KEY ({ctx.quote(column)}) REFERENCES {ctx.quote(referred)} (id) NOT VALID'
+                    ))
+            if not validated:
+                with ctx.transaction() as conn:
+                    conn.execute(sa.text(f'ALTER TABLE {ctx.quote(table)} VALIDATE CONSTRAINT {ctx.quote(name)}'))
+
+    # After any rebuild, which drops a table's indexes
+    for name, table, column_names in QUERY_INDEXES:
+        ctx.create_index(name, table, column_names)
+
+    with ctx.transaction() as conn:
+        conn.execute(sa.text('ANALYZE'))
+
+
+def add_order_prices(ctx):
+    """order_item.price (backfilled from today's product price) and idempotent checkout keys"""
+    needs_backfill = 'price' not in ctx.columns('order_item')
+    ctx.add_column('order_item', sa.Column('price', sa.Float))
+    if needs_backfill:
+        # Best available snapshot for existing orders is today's price
+        ctx.backfill(
+            'order_item',
+            'price = (SELECT product.price FROM product WHERE product.id = order_item.product_id)',
+            'price IS NULL'
+        )
+
+    ctx.add_column('order', sa.Column('idempotency_key', sa.String(64)))
+    ctx.create_index('ux_order_user_email_idempotency_key', 'order', ('user_email', 'idempotency_key'), unique=True)
+
+
+def diet_chart_tables():
+    metadata = sa.MetaData()
+    # Stand-in so the foreign key resolves; diet_chart itself already exists
+    sa.Table('diet_chart', metadata, sa.Column('id', sa.Integer, primary_key=True))
+    meal = sa.Table(
+        'diet_chart_meal', metadata,
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('chart_id', sa.Integer, sa.ForeignKey('diet_chart.id'), nullable=False),
+        sa.Column('position', sa.Integer, nullable=False),
+        sa.Column('name', sa.String(100), nullable=False),
+        sa.Column('time', sa.String(20)),
+        sa.Column('calories', sa.Integer),
+        sa.Column('protein', sa.Float),
+        sa.Column('carbs', sa.Float),
+        sa.Column('fats', sa.Float),
+        sa.Column('macros', sa.String(100)),
+        sa.Column('foods_listed', sa.Boolean),
+        sa.Column('extras', sa.Text),
+        sa.Index('ix_diet_chart_meal_chart_id_position', 'chart_id', 'position'),
+        sa.Index('ix_diet_chart_meal_name_calories', 'name', 'calories')
+    )
+    food = sa.Table(
+        'diet_chart_meal_food', metadata,
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('meal_id', sa.Integer, sa.ForeignKey('diet_chart_meal.id'), nullable=False),
+        sa.Column('position', sa.Integer, nullable=False),
+        sa.Column('name', sa.Text, nullable=False),
+        sa.Index('ix_diet_chart_meal_food_meal_id_position', 'meal_id', 'position')
+    )
+    return meal, food
+
+
+def normalise_diet_charts(ctx):
+    """
+    Move meals out of diet_chart.chart_data into diet_chart_meal / diet_chart_meal_food rows
+    Charts are converted a chunk at a time, each with its meal rows in one
+    transaction; a chart without meal rows is (re)converted, which is how an
+    interrupted run picks up again (converting a chart twice changes nothing)
+    """
+    ctx.add_column('diet_chart', sa.Column('total_calories', sa.Integer))
+    ctx.add_column('diet_chart', sa.Column('dietary_preference', sa.String(50)))
+    meal_table, food_table = diet_chart_tables()
+    with ctx.transaction() as conn:
+        meal_table.create(conn, checkfirst=True)
+        food_table.create(conn, checkfirst=True)
+
+    migrated = 0
+    skipped = []
+    unconverted = 'NOT EXISTS (SELECT 1 FROM diet_chart_meal WHERE diet_chart_meal.chart_id = diet_chart.id)'
+    for after, upto in ctx.id_chunks('diet_chart', unconverted):
+        with ctx.transaction() as conn:
+            charts = conn.execute(sa.text(f'''
+                SELECT id, chart_data, user_data FROM diet_chart
+                WHERE id > :after AND id <= :upto AND {unconverted}
+            '''), {'after': after, 'upto': upto}).all()
+            for chart_id, chart_data, user_data in charts:
+                try:
+                    chart_data, user_data = json.loads(chart_data), json.loads(user_data)
+                except (TypeError, ValueError):
+                    # Left as it is rather than failing the whole migration on one unreadable chart
+                    skipped.append(chart_id)
+                    continue
+                migrate_chart(conn, meal_table, food_table, chart_id, chart_data, user_data)
+                migrated += 1
+    print(f"Migrated {migrated} diet charts.")
+    if skipped:
+        print(f"Skipped {len(skipped)} charts that aren't valid JSON (ids {', '.join(map(str, skipped[:20]))}).")
+
+
+def migrate_chart(conn, meal_table, food_table, chart_id, chart_data, user_data):
+    meals, extras = split_chart_data(chart_data)
+    for position, meal in enumerate(meals):
+        meal_id = conn.execute(meal_table.insert().values(
+            chart_id=chart_id, position=position, name=meal['name'], time=meal['time'],
+            calories=meal['calories'], protein=meal['protein'], carbs=meal['carbs'],
+            fats=meal['fats'], macros=meal['macros'], foods_listed=meal['foods_listed'],
+            extras=json.dumps(meal['extras']) if meal['extras'] else None
+        )).inserted_primary_key[0]
+        if meal['foods']:
+            conn.execute(food_table.insert(), [
+                {'meal_id': meal_id, 'position': food_position, 'name': food}
+                for food_position, food in enumerate(meal['foods'])
+            ])
+
+    conn.execute(sa.text('''
+        UPDATE diet_chart SET chart_data = :chart_data, total_calories = :total_calories,
+                              dietary_preference = :dietary_preference
+        WHERE id = :id
+    '''), {
+        'chart_data': json.dumps(extras),
+        'total_calories': chart_total_calories(chart_data, meals),
+        'dietary_preference': chart_dietary_preference(user_data),
+        'id': chart_id
+    })
+
+
+def lossless_diet_chart_meals(ctx):
+    """
+    diet_chart_meal.foods_listed and .extras, which keep meal values the
+    columns can't hold; rows already converted keep their shape's usual form
+    """
+    ctx.add_column('diet_chart_meal', sa.Column('foods_listed', sa.Boolean))
+    ctx.add_column('diet_chart_meal', sa.Column('extras', sa.Text))
+
+
+def unique_product_names(ctx):
+    """
+    Unique index on product.name, which the catalogue import upserts on
+    Duplicate products (from concurrent demo seeding) are merged into the
+    oldest one first: carts and order items are repointed, then the
+    duplicates are deleted
+    """
+    if ctx.has_index('product', 'ux_product_name'):
+        return
+    with ctx.transaction() as conn:
+        duplicates = conn.execute(sa.text('''
+            SELECT product.id, keep.id FROM product
+            JOIN (SELECT name, MIN(id) AS id FROM product GROUP BY name HAVING COUNT(*) > 1) AS keep
+              ON keep.name = product.name AND keep.id < product.id
+        ''')).all()
+        for duplicate_id, keep_id in duplicates:
+            for table in ('cart', 'order_item'):
+                conn.execute(sa.text(f'UPDATE {ctx.quote(table)} SET product_id = :keep WHERE product_id = :duplicate'),
+                             {'keep': keep_id, 'duplicate': duplicate_id})
+            conn.execute(sa.text('DELETE FROM product WHERE id = :id'), {'id': duplicate_id})
+    if duplicates:
+        print(f"Merged {len(duplicates)} duplicate products.")
+    ctx.create_index('ux_product_name', 'product', ('name',), unique=True)
+
+
+def add_catalogue_version(ctx):
+    """catalogue_version, the row every server checks before serving its cached product catalogue"""
+    table = sa.Table(
+        'catalogue_version', sa.MetaData(),
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('version', sa.Integer, nullable=False)
+    )
+    with ctx.transaction() as conn:
+        table.create(conn, checkfirst=True)
+
+
+def add_job_table(ctx):
+    """job, the queue job_queue.py used to keep in a SQLite file on each node"""
+    table = sa.Table(
+        'job', sa.MetaData(),
+        sa.Column('id', sa.String(32), primary_key=True),
+        sa.Column('kind', sa.String(50), nullable=False),
+        sa.Column('user_email', sa.String(120), nullable=False),
+        sa.Column('payload', sa.Text, nullable=False),
+        sa.Column('payload_blob', sa.LargeBinary),
+        sa.Column('status', sa.String(20), nullable=False),
+        sa.Column('result', sa.Text),
+        sa.Column('error', sa.Text),
+        sa.Column('attempts', sa.Integer, nullable=False),
+        sa.Column('max_attempts', sa.Integer, nullable=False),
+        sa.Column('created_at', sa.Float, nullable=False),
+        sa.Column('run_after', sa.Float, nullable=False),
+        sa.Column('started_at', sa.Float),
+        sa.Column('finished_at', sa.Float),
+        sa.Column('lease_expires', sa.Float),
+        sa.Column('lease_token', sa.String(32)),
+        sa.Column('worker', sa.String(200))
+    )
+    with ctx.transaction() as conn:
+        table.create(conn, checkfirst=True)
+    ctx.create_index('ix_job_status_run_after', 'job', ('status', 'run_after'))
+    ctx.create_index('ix_job_user_email_status', 'job', ('user_email', 'status'))
+
+
+def add_diet_chart_merge_job(ctx):
+    """diet_chart.merge_job_id, so a retried merge job finds the chart it already created"""
+    ctx.add_column('diet_chart', sa.Column('merge_job_id', sa.String(32)))
+    ctx.create_index('ux_diet_chart_merge_job_id', 'diet_chart', ('merge_job_id',), unique=True)
+
+
+REVISIONS = (
+    Revision('0001_legacy_user_table', 'Relax user columns left over from Google sign-in', upgrade_legacy_user_table),
+    Revision('0002_query_indexes', 'Per-user lookup indexes and cart / order_item foreign keys', add_query_indexes),
+    Revision('0003_order_prices', 'Order item price snapshots and checkout idempotency keys', add_order_prices),
+    Revision('0004_diet_chart_rows', 'Diet chart meals and foods as rows', normalise_diet_charts),
+    Revision('0005_unique_product_name', 'Unique product names for catalogue upserts', unique_product_names),
+    Revision('0006_diet_chart_meal_extras', 'Meal values without a column of their own', lossless_diet_chart_meals),
+    Revision('0007_catalogue_version', 'Catalogue version for cross-process cache checks', add_catalogue_version),
+    Revision('0008_job_table', 'Job queue in the shared database', add_job_table),
+    Revision('0009_diet_chart_merge_job', 'Merge job ids on merged diet charts', add_diet_chart_merge_job),
+)
+
+
+# Runner
+def applied_revisions(conn):
+    """{revision id: applied_at} recorded in the database"""
+    if not sa.inspect(conn).has_table(schema_revision.name):
+        return {}
+    return dict(conn.execute(sa.select(schema_revision.c.id, schema_revision.c.applied_at)).all())
+
+
+def record_revision(conn, revision, duration_ms=None):
+    schema_revision.create(conn, checkfirst=True)
+    conn.execute(schema_revision.insert().values(
+        id=revision.id, description=revision.description, applied_at=datetime.utcnow(), duration_ms=duration_ms
+    ))
+
+
+def stamp(conn):
+    """Mark every revision as applied (for a schema just created from the models)"""
+    applied = applied_revisions(conn)
+    for revision in REVISIONS:
+        if revision.id not in applied:
+            record_revision(conn, revision)
+
+
+def revision_index(revision_id):
+    for index, revision in enumerate(REVISIONS):
+        if revision.id == revision_id:
+            return index
+    raise ValueError(f"Unknown revision {revision_id}")
+
+
+def upgrade(target=None, up_to=None, dry_run=False, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Apply pending revisions in order (up to and including up_to); a dry run rolls everything back"""
+    url = database_url(target)
+    if missing_sqlite_file(url):
+        print("Database doesn't exist yet. Create it with: flask --app app init-db")
+        return []
+
+    last = revision_index(up_to) if up_to else len(REVISIONS) - 1
+    engine = migration_engine(url)
+    outer = None
+    try:
+        if dry_run:
+            outer = engine.connect()
+            outer.begin()
+
+            @sa.event.listens_for(outer, 'before_cursor_execute')
+            def show_statement(conn, cursor, statement, parameters, context, executemany):
+                print(f"    SQL: {' '.join(statement.split())}")
+
+        ctx = MigrationContext(engine, chunk_size, outer)
+        with ctx.transaction() as conn:
+            applied = applied_revisions(conn)
+        pending = [revision for revision in REVISIONS[:last + 1] if revision.id not in applied]
+
+        print(f"{sa.engine.make_url(url).render_as_string(hide_password=True)} ({engine.dialect.name}): "
+              f"{len(applied)} applied, {len(pending)} pending{' (dry run)' if dry_run else ''}")
+        for revision in pending:
+            print(f"Applying {revision.id}: {revision.description}")
+            start = time.perf_counter()
+            revision.upgrade(ctx)
+            duration_ms = round((time.perf_counter() - start) * 1000)
+            with ctx.transaction() as conn:
+                record_revision(conn, revision, duration_ms)
+            print(f"Applied {revision.id} in {duration_ms}ms")
+
+        if dry_run:
+            outer.rollback()
+            print("Dry run: all changes rolled back.")
+        elif pending:
+            print("Database migration completed successfully!")
+        else:
+            print("Database is up to date.")
+        return [revision.id for revision in pending]
+    except Exception as e:
+        print(f"Migration failed: {e}")
+        raise
+    finally:
+        if outer is not None:
+            outer.close()
+        engine.dispose()
+
+
+def status(target=None):
+    """(revision, applied_at or None) for every revision"""
+    url = database_url(target)
+    if missing_sqlite_file(url):
+        return [(revision, None) for revision in REVISIONS]
+    engine = migration_engine(url)
+    try:
+        with engine.begin() as conn:
+            applied = applied_revisions(conn)
+    finally:
+        engine.dispose()
+    return [(revision, applied.get(revision.id)) for revision in REVISIONS]
@@ -0,0 +1,76 @@
+"""
+Columnar nutrition table built from INDIAN_FOOD_DATABASE
+One float32 column per nutrient plus a name -> row index, so portion
+scaling, meal totals and macro filters are single array operations
+"""
+
+import numpy as np
+
+from indian_food_database import INDIAN_FOOD_DATABASE
+
+NUTRIENTS = ('calories', 'protein', 'carbs', 'fats', 'fiber', 'sugar')
+
+# Values used when a food is missing a nutrient (per serving)
+NUTRIENT_DEFAULTS = {'calories': 200, 'protein': 8, 'carbs': 30, 'fats': 5, 'fiber': 3, 'sugar': 5}
+
+
+class NutritionTable:
+    def __init__(self, database):
+        self.names = list(database.keys())
+        self.index = {name: row for row, name in enumerate(self.names)}
+        self.values = np.array(
+            [[food_data.get(nutrient, NUTRIENT_DEFAULTS[nutrient]) for nutrient in NUTRIENTS]
+             for food_data in database.values()],
+            dtype=np.float32
+        ).reshape(-1, len(NUTRIENTS))
+
+        # Named column views onto the same matrix
+        self.columns = {nutrient: self.values[:, position] for position, nutrient in enumerate(NUTRIENTS)}
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def rows(self, names):
+        """Row numbers for a list of food names (KeyError on unknown foods)"""
+        return np.array([self.index[name] for name in names], dtype=np.intp)
+
+    def nutrition(self, name, portion=1.0):
+        """Nutrition dict for one food, scaled by portion (number of servings)"""
+        values = self.values[self.index[name]] * portion
+        return {nutrient: round(float(value), 1) for nutrient, value in zip(NUTRIENTS, values)}
+
+    def scaled(self, names, portions=None):
+        """Per-food nutrition matrix (len(names) x nutrients) scaled by portions"""
+        values = self.values[self.rows(names)]
+        if portions is None:
+            return values
+        return values * np.asarray(portions, dtype=np.float32)[:, None]
+
+    def totals(self, names, portions=None):
+        """Total nutrition of a list of foods (e.g. a meal), optionally with portions"""
+        totals = self.scaled(names, portions).sum(axis=0, dtype=np.float64)
+        return {nutrient: round(float(value), 1) for nutrient, value in zip(NUTRIENTS, totals)}
+
+    def filter(self, **bounds):
+        """
+        Names of foods within nutrient bounds, in database order
+        Bounds are min_<nutrient> / max_<nutrient>, e.g. filter(max_calories=200, min_protein=10)
+        """
+        mask = np.ones(len(self.names), dtype=bool)
+        for bound, limit in bounds.items():
+            kind, _, nutrient = bound.partition('_')
+            if nutrient not in self.columns or kind not in ('min', 'max'):
+                raise ValueError(f"Unknown nutrient bound: {bound}")
+            # Compare in float32 so a bound equal to a stored value is inclusive
+            limit = np.float32(limit)
+            if kind == 'min':
+                mask &= self.columns[nutrient] >= limit
+            else:
+                mask &= self.columns[nutrient] <= limit
+        return [self.names[row] for row in np.flatnonzero(mask)]
+
+
+NUTRITION_TABLE = NutritionTable(INDIAN_FOOD_DATABASE)
@@ -0,0 +1,74 @@
+"""
+Bulk product catalogue import
+Reads products from a JSON or CSV file and upserts them by name (unique since
+revision 0005) in batches of INSERT ... ON CONFLICT, so re-running an import,
+or running two at once, updates products instead of duplicating them.
+Run it with: flask --app app import-products [FILE]
+"""
+
+import csv
+import json
+import os
+
+from sqlalchemy.dialects import postgresql, sqlite
+
+DEMO_PRODUCTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'demo_products.json')
+
+IMPORT_FIELDS = ('name', 'description', 'image', 'price')
+
+DEFAULT_BATCH_SIZE = 1000
+
+DIALECT_INSERTS = {
+    'sqlite': sqlite.insert,
+    'postgresql': postgresql.insert,
+}
+
+
+def read_product_file(path):
+    """
+    Product dicts from a JSON list (or {"products": [...]}) or a CSV file with
+    a name,description,image,price header
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.lower().endswith('.csv'):
+            records = list(csv.DictReader(f))
+        else:
+            records = json.load(f)
+            if isinstance(records, dict):
+                records = records.get('products', [])
+    return clean_products(records)
+
+
+def clean_products(records):
+    """Validate and normalise records; a name repeated later in the file wins (ValueError on bad rows)"""
+    products = {}
+    for number, record in enumerate(records, start=1):
+        name = (record.get('name') or '').strip()
+        if not name:
+            raise ValueError(f"Product {number}: name is required")
+        try:
+            price = float(record.get('price'))
+        except (TypeError, ValueError):
+            raise ValueError(f"Product {number} ({name}): price must be a number")
+        products[name] = {
+            'name': name,
+            'description': record.get('description') or None,
+            'image': record.get('image') or None,
+            'price': price
+        }
+    return list(products.values())
+
+
+def upsert_products(conn, product_table, products, batch_size=DEFAULT_BATCH_SIZE):
+    """Insert or update products by name, one executemany statement per batch; returns rows written"""
+    insert = DIALECT_INSERTS.get(conn.dialect.name)
+    if insert is None:
+        raise ValueError(f"Product import doesn't support {conn.dialect.name}")
+    statement = insert(product_table)
+    statement = statement.on_conflict_do_update(
+        index_elements=['name'],
+        set_={field: statement.excluded[field] for field in IMPORT_FIELDS if field != 'name'}
+    )
+    for start in range(0, len(products), batch_size):
+        conn.execute(statement, products[start:start + batch_size])
+    return len(products)
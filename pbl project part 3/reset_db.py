@@ -7,8 +7,8 @@ if os.path.exists('workoutvibes.db'):
     print("Removed old database")
 
 # Import and recreate with new schema
-from app import app, db
+from app import create_app, db
 
-with app.app_context():
+with create_app().app_context():
     db.create_all()
     print("Created new database with updated schema")
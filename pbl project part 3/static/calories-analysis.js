@@ -74,11 +74,19 @@ document.addEventListener('DOMContentLoaded', function() {
         const formData = new FormData();
         formData.append('image', file);
 
-        fetch('/api/analyze-food', {
+        // Analysis runs on a background worker; submit it and wait for the result
+        fetch('/api/jobs/analyze-food', {
             method: 'POST',
             body: formData
         })
         .then(response => response.json())
+        .then(job => {
+            if (!job.success) {
+                return job;
+            }
+            return waitForJob(job.job_id)
+                .then(outcome => outcome.success ? outcome.result : outcome);
+        })
         .then(data => {
             loadingSection.style.display = 'none';
             
@@ -96,6 +104,23 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
+    // Poll the job with short requests, so waiting clients never hold a server worker
+    async function waitForJob(jobId, intervalMs = 1000, timeoutMs = 120000) {
+        const deadline = Date.now() + timeoutMs;
+        while (Date.now() < deadline) {
+            const response = await fetch(`/api/jobs/${jobId}/result`);
+            const outcome = await response.json();
+            if (outcome.success || (outcome.status && outcome.status !== 'queued' && outcome.status !== 'running')) {
+                return outcome;
+            }
+            if (!outcome.status) {
+                throw new Error(outcome.message || 'analysis job not found');
+            }
+            await new Promise(resolve => setTimeout(resolve, intervalMs));
+        }
+        throw new Error('timed out waiting for the analysis');
+    }
+
     function displayResults(data) {
         // Update food info
         document.getElementById('foodName').textContent = data.food_name;
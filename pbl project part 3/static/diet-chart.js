@@ -99,7 +99,7 @@ function logout() {
     localStorage.removeItem('userEmail');
     currentUser = null;
     showLoggedOutState();
-    window.location.href = '/';
+    window.location.href = '/logout'; // Clears the server session too
 }
 
 // Dark mode functions
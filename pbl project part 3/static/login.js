@@ -38,5 +38,5 @@ function logout() {
     localStorage.removeItem('isLoggedIn');
     localStorage.removeItem('userName');
     localStorage.removeItem('userEmail'); // Remove email on logout
-    window.location.href = '/';
+    window.location.href = '/logout'; // Clears the server session too
 } 
\ No newline at end of file
@@ -167,7 +167,7 @@ function logout() {
     localStorage.removeItem('userEmail'); // Remove email on logout
     currentUser = null;
     showLoggedOutState();
-    window.location.href = '/';
+    window.location.href = '/logout'; // Clears the server session too
     // Optionally, reload to update nav
     // location.reload();
 }
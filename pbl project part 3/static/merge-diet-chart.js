@@ -3,6 +3,7 @@ let currentUser = null;
 let selectedCharts = [];
 let selectedGoal = null;
 let allDietCharts = [];
+let nextChartsCursor = null;
 
 // Check if user is logged in on page load
 function checkAuthState() {
@@ -61,7 +62,7 @@ function logout() {
     localStorage.removeItem('userEmail');
     currentUser = null;
     showLoggedOutState();
-    window.location.href = '/';
+    window.location.href = '/logout'; // Clears the server session too
 }
 
 // Dark mode functions
@@ -79,8 +80,8 @@ function setDarkMode(enabled) {
     }
 }
 
-// Load diet charts from API
-async function loadDietCharts() {
+// Load diet charts from API (summaries, one page at a time)
+async function loadDietCharts(cursor) {
     const userEmail = localStorage.getItem('userEmail');
     if (!userEmail) {
         showLoginRequired();
@@ -88,12 +89,15 @@ async function loadDietCharts() {
     }
 
     try {
-        const response = await fetch(`/api/diet-chart/list?user_email=${encodeURIComponent(userEmail)}`);
+        const params = new URLSearchParams();
+        if (cursor) params.set('cursor', cursor);
+        const response = await fetch(`/api/diet-chart/list?${params}`);
         const result = await response.json();
 
         if (result.success) {
-            allDietCharts = result.charts;
-            displayDietCharts(result.charts);
+            allDietCharts = cursor ? allDietCharts.concat(result.charts) : result.charts;
+            nextChartsCursor = result.next_cursor;
+            displayDietCharts(allDietCharts);
         } else {
             throw new Error(result.message || 'Failed to load diet charts');
         }
@@ -127,10 +131,16 @@ function displayDietCharts(charts) {
         <div class="charts-grid">
             ${charts.map(chart => createChartCard(chart)).join('')}
         </div>
+        ${nextChartsCursor ? '<button id="loadMoreChartsBtn" class="submit-btn" style="margin-top: 15px;">Load more charts</button>' : ''}
     `;
 
     chartsContainer.innerHTML = chartsHtml;
 
+    const loadMoreBtn = document.getElementById('loadMoreChartsBtn');
+    if (loadMoreBtn) {
+        loadMoreBtn.addEventListener('click', () => loadDietCharts(nextChartsCursor));
+    }
+
     // Add event listeners for checkboxes and remove buttons
     charts.forEach(chart => {
         const checkbox = document.getElementById(`chart-${chart.id}`);
@@ -151,8 +161,8 @@ function createChartCard(chart) {
     const createdDate = new Date(chart.created_date).toLocaleDateString();
     
     return `
-        <div class="chart-card" id="card-${chart.id}">
-            <input type="checkbox" class="chart-checkbox" id="chart-${chart.id}" value="${chart.id}">
+        <div class="chart-card${selectedCharts.includes(chart.id) ? ' selected' : ''}" id="card-${chart.id}">
+            <input type="checkbox" class="chart-checkbox" id="chart-${chart.id}" value="${chart.id}"${selectedCharts.includes(chart.id) ? ' checked' : ''}>
             <div class="chart-title">${chart.chart_name}</div>
             <div class="chart-goal">${formatGoal(chart.goal)}</div>
             <div class="chart-details">
@@ -288,7 +298,8 @@ async function mergeCharts() {
     loadingOverlay.style.display = 'flex';
 
     try {
-        const response = await fetch('/api/diet-chart/merge', {
+        // The merge runs on a background worker; wait for its result
+        const response = await fetch('/api/jobs/diet-chart-merge', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -300,7 +311,13 @@ async function mergeCharts() {
             })
         });
 
-        const result = await response.json();
+        const job = await response.json();
+        if (!job.success) {
+            throw new Error(job.message || 'Failed to queue merge');
+        }
+
+        const outcome = await waitForJob(job.job_id);
+        const result = outcome.success ? outcome.result : outcome;
 
         if (result.success) {
             // Hide loading overlay
@@ -323,6 +340,24 @@ async function mergeCharts() {
     }
 }
 
+// Wait for a background job to finish and resolve with its result payload
+// (short polls, so waiting clients never hold a server worker)
+async function waitForJob(jobId, intervalMs = 1000, timeoutMs = 120000) {
+    const deadline = Date.now() + timeoutMs;
+    while (Date.now() < deadline) {
+        const response = await fetch(`/api/jobs/${jobId}/result`);
+        const outcome = await response.json();
+        if (outcome.success || (outcome.status && outcome.status !== 'queued' && outcome.status !== 'running')) {
+            return outcome;
+        }
+        if (!outcome.status) {
+            throw new Error(outcome.message || 'Merge job not found');
+        }
+        await new Promise(resolve => setTimeout(resolve, intervalMs));
+    }
+    throw new Error('Timed out waiting for the merge');
+}
+
 // Display merged diet chart result
 function displayMergedResult(mergedChart) {
     const mergedResult = document.getElementById('mergedResult');
@@ -340,6 +375,10 @@ function displayMergedResult(mergedChart) {
                     <h4 style="color: #22543d; margin-bottom: 10px;">🎯 Optimization Summary</h4>
                     <p style="color: #2d5016;">${mergedChart.chart_data.optimization_notes}</p>
                     <p style="color: #2d5016;"><strong>Merged from ${mergedChart.chart_data.merged_from} diet charts</strong></p>
+                    ${(mergedChart.chart_data.knownLimitations || []).length ? `
+                        <ul style="color: #744210; margin: 10px 0 0; padding-left: 20px;">
+                            ${mergedChart.chart_data.knownLimitations.map(note => `<li>${note}</li>`).join('')}
+                        </ul>` : ''}
                 </div>
                 
                 <div class="meal-plan">
@@ -0,0 +1,12 @@
+"""
+WSGI entry point for production
+gunicorn -c gunicorn.conf.py wsgi:app
+Create the schema first with: APP_CONFIG=production flask --app app init-db
+The gunicorn master also starts job_worker.py, which runs queued merges and analyses
+"""
+
+import os
+
+from app import create_app
+
+app = create_app(os.getenv('APP_CONFIG', 'production'))